@@ -4,45 +4,70 @@ import io
 
 # Import Utils
 # ✅ 1. เพิ่ม log_action ในบรรทัดนี้
-from utils.gsheet_handler import load_data_staff, load_data_fast, log_action
+from utils.gsheet_handler import (
+    load_data_staff, load_data_fast, load_columns_staff, log_action, missing_token_mask, provision_public_tokens
+)
 from utils.style import load_custom_css
+from utils.visit_journal import pending_count, parked_count, flusher_status
+from utils.metrics import start_metrics_server
+from utils.clinics import (
+    clinic_config, clinic_name, clinic_password, current_clinic, resolve_clinic, set_session_clinic,
+    misconfigured_clinics
+)
 
-# Import Views
-from views.patient_view import render_patient_view
-from views.staff_dashboard import render_dashboard
-from views.staff_action import render_register_patient, render_search_patient
-from views.staff_import import render_import_appointment
+# Import Views: โหลดเฉพาะหน้าที่เปิด (ใน if/elif ด้านล่าง) -> หน้า QR ของผู้ป่วยไม่ต้องโหลดกราฟ/Import/Excel
 
 
 # --- Page Config ---
 st.set_page_config(page_title="Asthma Care Connect", layout="centered", page_icon="🫁")
 load_custom_css()
+start_metrics_server()  # เปิดเฉพาะเมื่อตั้ง METRICS_PORT
 
 # ==========================================
 # 🔐 SECURITY & CONFIG
 # ==========================================
-if "admin_password" not in st.secrets:
+# ต้องมี admin_password กลาง หรือทุกคลินิกตั้งรหัสผ่านของตัวเอง ([clinics.<id>] admin_password)
+if "admin_password" not in st.secrets and not all(cfg['admin_password'] for cfg in clinic_config().values()):
     st.error("❌ ไม่พบรหัสผ่านผู้ดูแลระบบ (กรุณาตั้งค่า admin_password ใน secrets.toml)")
     st.stop()
 
-ADMIN_PASSWORD = st.secrets["admin_password"]
+if misconfigured_clinics():
+    st.error(f"❌ คลินิก {', '.join(misconfigured_clinics())} ยังไม่ได้ตั้งค่า sheet_id ใน secrets.toml")
+    st.stop()
 
 if "deploy_url" in st.secrets:
     BASE_URL = st.secrets["deploy_url"].rstrip("/")
 else:
     BASE_URL = "http://localhost:8501" 
 
+# ข้อมูลที่แต่ละเมนูใช้: {ตาราง: รายชื่อคอลัมน์ (None = ทั้งตาราง)} -> โหลดเฉพาะที่หน้านั้นใช้
+STAFF_ROUTES = {
+    "🔍 ค้นหา/บันทึกอาการ": {"patients": None, "visits": None},
+    "➕ ลงทะเบียนผู้ป่วยใหม่": {"patients": ["hn"]},
+    "📊 Dashboard ภาพรวม": {"patients": None, "visits": None},
+    "📥 นำเข้าข้อมูล (Import)": {"patients": ["hn", "first_name", "last_name"], "visits": ["hn", "date", "next_appt"]},
+    "🖨️ พิมพ์บัตรผู้ป่วย (Bulk)": {"patients": None, "visits": ["hn", "date", "next_appt"]},
+}
+# เมนูที่แสดง QR/Link ของผู้ป่วย (ต้องมี Public Token)
+TOKEN_ROUTES = {"🔍 ค้นหา/บันทึกอาการ", "🖨️ พิมพ์บัตรผู้ป่วย (Bulk)"}
+
 # ==========================================
 # 🏥 MAIN APP LOGIC
 # ==========================================
 query_params = st.query_params
 target_token = query_params.get("token", None)
+requested_clinic = query_params.get("clinic", None)
 
 if target_token:
     # ---------------------------------------------------
     # 🟢 PATIENT VIEW (Secure Access)
     # ---------------------------------------------------
-    patients_db = load_data_fast("patients")
+    # คลินิกมาจากลิงก์เท่านั้น (ไม่มี ?clinic= -> "default")
+    # ส่งคลินิกไปตรงๆ ไม่เปลี่ยนคลินิกของ Session (เจ้าหน้าที่ที่ Login ค้างไว้ยังอยู่คลินิกเดิม)
+    patient_clinic = resolve_clinic(requested_clinic)
+    patients_db = pd.DataFrame()
+    if patient_clinic is not None:
+        patients_db = load_data_fast("patients", clinic=patient_clinic)
     
     target_hn = None
     if 'public_token' in patients_db.columns:
@@ -51,8 +76,9 @@ if target_token:
             target_hn = match.iloc[0]['hn']
     
     if target_hn:
-        visits_db = load_data_fast("visits")
-        render_patient_view(target_hn, patients_db, visits_db)
+        visits_db = load_data_fast("visits", clinic=patient_clinic)
+        from views.patient_view import render_patient_view
+        render_patient_view(target_hn, patients_db, visits_db, clinic=patient_clinic)
     else:
         st.error("❌ Invalid or Expired Token (ไม่พบข้อมูลผู้ป่วย)")
         if st.button("กลับสู่หน้าหลัก"):
@@ -68,12 +94,30 @@ else:
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
 
+    # Login ผูกกับคลินิกที่ใส่รหัสผ่าน: ?clinic= อื่น หรือคลินิกของ Session ไม่ตรงกับที่ Login -> ต้อง Login ใหม่
+    logged_in_clinic = st.session_state.get("logged_in_clinic")
+    if st.session_state.logged_in and (
+        logged_in_clinic != current_clinic() or (requested_clinic and requested_clinic != logged_in_clinic)
+    ):
+        st.session_state.logged_in = False
+        st.session_state.pop("logged_in_clinic", None)
+
     if not st.session_state.logged_in:
         st.title("🔐 เข้าสู่ระบบเจ้าหน้าที่")
+        login_clinic = resolve_clinic(requested_clinic)
+        if requested_clinic and login_clinic is None:
+            st.error(f"❌ ไม่พบคลินิก '{requested_clinic}'")
+            st.stop()
+        if login_clinic is None:
+            # หลายคลินิกและไม่ได้ระบุใน URL -> ให้เลือก
+            clinics = list(clinic_config())
+            login_clinic = st.selectbox("คลินิก", clinics, format_func=clinic_name)
         pwd = st.text_input("รหัสผ่าน", type="password")
         if st.button("Login"):
-            if pwd == ADMIN_PASSWORD:
+            set_session_clinic(login_clinic)
+            if pwd == clinic_password(login_clinic):
                 st.session_state.logged_in = True
+                st.session_state.logged_in_clinic = login_clinic
                 log_action("Admin", "Login", "Success") # ✅ 2. บันทึก Log Login
                 st.rerun()
             else:
@@ -83,37 +127,67 @@ else:
 
     # --- ส่วนทำงานหลัง Login สำเร็จ ---
     st.sidebar.success("สถานะ: เจ้าหน้าที่ (Logged In)")
+    if len(clinic_config()) > 1:
+        st.sidebar.caption(f"🏥 {clinic_name(current_clinic())}")
     
     if st.sidebar.button("🔓 ออกจากระบบ"):
         log_action("Admin", "Logout", "User Initiated") # ✅ 3. บันทึก Log Logout
         st.session_state.logged_in = False
+        st.session_state.pop("logged_in_clinic", None)
         st.rerun()
     
-    st.sidebar.divider()
+    # สถานะ Visit ที่ยังรอส่งขึ้น Google Sheets
+    journal_pending = pending_count()
+    if journal_pending:
+        st.sidebar.warning(f"⏳ รอส่งข้อมูล {journal_pending} Visit")
+        journal_error = flusher_status()['last_error']
+        if journal_error:
+            st.sidebar.caption(f"ส่งไม่สำเร็จ (จะลองใหม่อัตโนมัติ): {journal_error}")
+    journal_parked = parked_count()
+    if journal_parked:
+        st.sidebar.error(f"🚫 {journal_parked} Visit ส่งไม่สำเร็จหลายครั้ง (หยุดส่งอัตโนมัติ) ตรวจสอบได้ที่หน้าค้นหาผู้ป่วย")
 
-    # Load Data
-    patients_db = load_data_staff("patients")
-    visits_db = load_data_staff("visits")
+    st.sidebar.divider()
 
     # Menu
-    mode = st.sidebar.radio(
-        "เมนูหลัก", 
-        [
-            "🔍 ค้นหา/บันทึกอาการ", 
-            "➕ ลงทะเบียนผู้ป่วยใหม่", 
-            "📊 Dashboard ภาพรวม",
-            "📥 นำเข้าข้อมูล (Import)"
-        ]
-    )
+    mode = st.sidebar.radio("เมนูหลัก", list(STAFF_ROUTES.keys()))
+
+    # Load Data (เฉพาะตาราง/คอลัมน์ที่หน้านั้นใช้)
+    route_data = {}
+    for table, columns in STAFF_ROUTES[mode].items():
+        if columns is None:
+            route_data[table] = load_data_staff(table)
+        else:
+            route_data[table] = load_columns_staff(table, tuple(columns))
+    patients_db = route_data.get("patients")
+    visits_db = route_data.get("visits")
+
+    # สร้าง Public Token ให้ผู้ป่วยที่ยังไม่มีทีเดียวทั้งหมด (เฉพาะหน้าที่ใช้ Token / ไม่ต้องสร้างตอนเปิดดูทีละคน)
+    if mode in TOKEN_ROUTES and not patients_db.empty and missing_token_mask(patients_db).any():
+        try:
+            with st.spinner("กำลังสร้าง Secure Token ให้ผู้ป่วย..."):
+                patients_db, created = provision_public_tokens(patients_db)
+            if created:
+                log_action("Admin", "Generate Token", f"Bulk: {created} patients")
+        except Exception as e:
+            st.sidebar.warning(f"⚠️ สร้าง Token ไม่สำเร็จ: {e}")
 
     if mode == "🔍 ค้นหา/บันทึกอาการ":
+        from views.staff_action import render_search_patient
         render_search_patient(patients_db, visits_db, BASE_URL)
         
     elif mode == "➕ ลงทะเบียนผู้ป่วยใหม่":
+        from views.staff_action import render_register_patient
         render_register_patient(patients_db)
         
     elif mode == "📊 Dashboard ภาพรวม":
+        from views.staff_dashboard import render_dashboard
         render_dashboard(visits_db, patients_db)
         
     elif mode == "📥 นำเข้าข้อมูล (Import)":
+        from views.staff_import import render_import_appointment
         render_import_appointment(patients_db, visits_db)
+
+    elif mode == "🖨️ พิมพ์บัตรผู้ป่วย (Bulk)":
+        from views.staff_cards import render_bulk_cards
+        render_bulk_cards(patients_db, visits_db, BASE_URL)
@@ -0,0 +1,50 @@
+import pandas as pd
+
+import utils.batch_import as batch_import
+import utils.gsheet_handler as gsheet_handler
+
+
+def _write_csv(path, rows):
+    pd.DataFrame(rows, columns=['HN', 'วันที่รับบริการ', 'วันนัดถัดไป']).to_csv(path, index=False)
+    return str(path)
+
+
+def test_ledger_records_only_applied_rows_per_file(tmp_path, monkeypatch):
+    patients = pd.DataFrame({'hn': ['0000001', '0000002'], 'first_name': ['A', 'C'], 'last_name': ['B', 'D']})
+    visits = pd.DataFrame({'hn': ['0000001', '0000002'],
+                           'date': ['2024-01-01', '2024-01-02'],
+                           'next_appt': ['2024-02-01', '2024-02-02']})
+    first = _write_csv(tmp_path / "a.csv", [('0000001', '2024-01-01', '2024-03-01'),
+                                            ('0000001', '2024-01-05', '')])
+    second = _write_csv(tmp_path / "b.csv", [('0000002', '2024-01-02', '2024-03-02')])
+
+    recorded = {}
+    monkeypatch.setattr(gsheet_handler, 'save_multiple_visits', lambda rows: None)
+    # update ของไฟล์แรกถูกข้าม (แถวใน Sheet เปลี่ยนระหว่างนำเข้า)
+    monkeypatch.setattr(gsheet_handler, 'update_appointments_batch', lambda updates: {
+        'stale': [u for u in updates if u['hn'] == '0000001']})
+    monkeypatch.setattr(batch_import, 'record_import',
+                        lambda file_hash, name, rows, counts=None, user=None: recorded.update({name: (rows, counts)}))
+
+    summary = batch_import.run_batch_import([first, second], patients, visits, use_ledger=False, max_workers=1)
+
+    rows_a, counts_a = recorded['a.csv']
+    assert list(rows_a['action']) == ['new']
+    assert counts_a['update'] == 0 and counts_a['new'] == 1
+    rows_b, counts_b = recorded['b.csv']
+    assert list(rows_b['action']) == ['update']
+    assert counts_b['update'] == 1
+    assert summary['update'] == 1 and summary['stale_updates'] == 1
+
+
+def test_cli_reports_sheet_load_failure(tmp_path, capsys):
+    from utils.local_sheets import LocalSheetsClient
+
+    path = _write_csv(tmp_path / "a.csv", [('0000001', '2024-01-01', '2024-03-01')])
+    # ไม่มี Sheet patients/visits -> ต้องแจ้ง Error จริงและจบด้วย exit code 2 (ไม่ใช่ UnboundLocalError)
+    gsheet_handler.use_sheets_client(LocalSheetsClient())
+    try:
+        assert batch_import.main([path, '--dry-run']) == 2
+    finally:
+        gsheet_handler.use_sheets_client(None)
+    assert "WorksheetNotFound" in capsys.readouterr().err
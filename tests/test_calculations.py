@@ -0,0 +1,105 @@
+from datetime import date
+
+import pandas as pd
+
+from utils.calculations import (
+    TECHNIQUE_VALID_DAYS, check_technique_status, compute_technique_status_table, pefr_date_bounds,
+    prepare_pefr_chart_data,
+)
+
+
+def _visits(dates, pefrs):
+    return pd.DataFrame({'date': dates, 'pefr': pefrs})
+
+
+def test_pefr_date_bounds():
+    df = _visits(['2024-03-01', 'bad', '2022-01-15'], [300, 310, 320])
+    assert pefr_date_bounds(df) == (date(2022, 1, 15), date(2024, 3, 1))
+
+
+def test_pefr_date_bounds_all_unparseable():
+    assert pefr_date_bounds(_visits(['', 'not a date'], [300, 310])) is None
+
+
+def test_chart_data_drops_zero_pefr_and_bad_dates():
+    df = prepare_pefr_chart_data(_visits(['2024-01-02', '2024-01-01', 'x', '2024-01-03'], [300, 0, 250, '280']))
+    assert df['pefr'].tolist() == [300, 280]
+
+
+def test_chart_data_date_range_is_inclusive():
+    dates = pd.date_range('2024-01-01', periods=10).strftime('%Y-%m-%d')
+    df = prepare_pefr_chart_data(_visits(dates, range(100, 110)), date_range=(date(2024, 1, 3), date(2024, 1, 5)))
+    assert df['pefr'].tolist() == [102, 103, 104]
+
+
+def test_chart_data_decimation_keeps_extremes_and_endpoints():
+    dates = pd.date_range('2020-01-01', periods=1000).strftime('%Y-%m-%d')
+    pefrs = [300] * 1000
+    pefrs[500], pefrs[700] = 50, 900
+    df = prepare_pefr_chart_data(_visits(dates, pefrs), max_points=100)
+    assert len(df) <= 102
+    assert {50, 900} <= set(df['pefr'])
+    assert df['date'].iloc[0] == pd.Timestamp('2020-01-01')
+    assert df['date'].iloc[-1] == pd.Timestamp(dates[-1])
+
+
+def _tech_visits(rows):
+    return pd.DataFrame(rows, columns=['hn', 'date', 'technique_check'])
+
+
+NOW = pd.Timestamp('2024-06-30')
+
+
+def test_technique_status_table_never_valid_overdue():
+    visits = _tech_visits([
+        ('A', '2024-06-01', 'ทำ'),
+        ('A', '2023-01-01', 'ทำ'),
+        ('B', '2023-01-01', 'ทำ'),
+        ('B', '2024-06-20', 'ไม่'),    # ครั้งที่ไม่ได้สอน ไม่นับ
+        ('C', '2024-06-01', ''),
+    ])
+    table = compute_technique_status_table(visits, now=NOW)
+    assert table.index.name == 'hn' and set(table.index) == {'A', 'B'}
+    assert table.loc['A', 'status'] == 'valid' and table.loc['A', 'days'] == TECHNIQUE_VALID_DAYS - 29
+    assert table.loc['B', 'status'] == 'overdue' and table.loc['B', 'days'] == (NOW - pd.Timestamp('2023-01-01')).days
+    assert table.loc['A', 'due_date'] == pd.Timestamp('2024-06-01') + pd.Timedelta(days=TECHNIQUE_VALID_DAYS)
+
+
+def test_technique_status_table_reindexes_all_hns():
+    visits = _tech_visits([('A', '2024-06-01', 'ทำ')])
+    table = compute_technique_status_table(visits, all_hns=['C', 'A', 'C'], now=NOW)
+    assert table.index.tolist() == ['C', 'A']
+    assert table.loc['C', 'status'] == 'never' and table.loc['C', 'days'] == 0
+    assert pd.isna(table.loc['C', 'last_tech_date'])
+
+    empty = compute_technique_status_table(_tech_visits([]), all_hns=['A'], now=NOW)
+    assert empty['status'].tolist() == ['never']
+
+
+def test_technique_status_ignores_unparseable_dates():
+    visits = _tech_visits([('A', 'not a date', 'ทำ'), ('A', '2024-06-10', 'ทำ'), ('B', '', 'ทำ')])
+    table = compute_technique_status_table(visits, all_hns=['A', 'B'], now=NOW)
+    assert table.loc['A', 'last_tech_date'] == pd.Timestamp('2024-06-10')
+    assert table.loc['B', 'status'] == 'never'
+
+    assert check_technique_status(_tech_visits([('A', 'bad', 'ทำ')])) == ("never", 0, None)
+
+
+def test_check_technique_status_single_patient():
+    today = pd.Timestamp.now().normalize()
+    recent = (today - pd.Timedelta(days=10)).strftime('%Y-%m-%d')
+    old = (today - pd.Timedelta(days=TECHNIQUE_VALID_DAYS + 5)).strftime('%Y-%m-%d')
+
+    status, days, last = check_technique_status(_tech_visits([('A', old, 'ทำ'), ('A', recent, 'ทำ')]))
+    assert status == 'valid' and days == TECHNIQUE_VALID_DAYS - 10 and last == pd.Timestamp(recent)
+    status, days, _ = check_technique_status(_tech_visits([('A', old, 'ทำ')]))
+    assert status == 'overdue' and days == TECHNIQUE_VALID_DAYS + 5
+    assert check_technique_status(pd.DataFrame()) == ("never", 0, None)
+
+
+def test_technique_status_does_not_modify_callers_frame():
+    visits = _tech_visits([('A', '2024-06-01', 'ทำ'), ('B', 'bad', 'ทำ')])
+    before = visits.copy()
+    compute_technique_status_table(visits, all_hns=['A', 'B', 'C'], now=NOW)
+    check_technique_status(visits)
+    pd.testing.assert_frame_equal(visits, before)
@@ -0,0 +1,57 @@
+import pytest
+
+import utils.clinics as clinics
+from utils.clinics import (
+    DEFAULT_CLINIC_ID, clinic_path, configure_clinics, misconfigured_clinics, patient_link,
+    plan_clinic_evictions, resolve_clinic, use_clinic
+)
+
+MB = 2 ** 20
+
+
+@pytest.fixture
+def clinic_setup(monkeypatch):
+    monkeypatch.setattr(clinics, '_LAST_ACCESS', {})
+    yield configure_clinics
+    configure_clinics(None)
+
+
+def test_resolve_clinic(clinic_setup):
+    clinic_setup({'a': {'sheet_id': 'A'}, 'b': {'sheet_id': 'B'}})
+    assert resolve_clinic('a') == 'a'
+    assert resolve_clinic('x') is None
+    # หลายคลินิก ไม่มี default และไม่ได้ระบุ -> ต้องเลือกเอง
+    assert resolve_clinic(None) is None
+
+    clinic_setup({DEFAULT_CLINIC_ID: {}, 'b': {'sheet_id': 'B'}})
+    assert resolve_clinic(None) == DEFAULT_CLINIC_ID
+    clinic_setup({'only': {'sheet_id': 'O'}})
+    assert resolve_clinic(None) == 'only'
+
+
+def test_misconfigured_clinics_need_own_sheet(clinic_setup):
+    clinic_setup({DEFAULT_CLINIC_ID: {}, 'b': {}, 'c': {'sheet_id': 'C'}})
+    assert misconfigured_clinics() == ['b']
+
+
+def test_clinic_path_and_patient_link():
+    assert clinic_path("/x/journal.sqlite", DEFAULT_CLINIC_ID) == "/x/journal.sqlite"
+    assert clinic_path("/x/journal.sqlite", "b") == "/x/journal.b.sqlite"
+    with use_clinic("b"):
+        assert clinic_path("/x/journal.sqlite") == "/x/journal.b.sqlite"
+        assert patient_link("http://h", "t") == "http://h/?token=t&clinic=b"
+    # ลิงก์ของคลินิก default คงรูปแบบเดิม (บัตรที่พิมพ์ไปแล้วยังใช้ได้)
+    assert patient_link("http://h", "t", DEFAULT_CLINIC_ID) == "http://h/?token=t"
+
+
+def test_plan_clinic_evictions(clinic_setup, monkeypatch):
+    monkeypatch.setattr(clinics, 'CLINIC_IDLE_EVICT', 100)
+    monkeypatch.setattr(clinics, 'CLINIC_MEMORY_BUDGET_MB', 30)
+    now = 1000.0
+    clinics._LAST_ACCESS.update({'idle': now - 500, 'old': now - 50, 'newer': now - 20, 'fresh': now - 1, 'me': now - 60})
+    usage = {'idle': 5 * MB, 'old': 10 * MB, 'newer': 10 * MB, 'fresh': 10 * MB, 'me': 10 * MB}
+
+    plan = plan_clinic_evictions(usage, keep='me', now=now)
+    # idle ถูกปล่อยก่อน, จากนั้นคลินิกที่ใช้ล่าสุดนานที่สุดจนไม่เกินงบ (คลินิกปัจจุบัน / เพิ่งใช้ ไม่ถูกปล่อย)
+    assert plan == [('idle', 'idle'), ('old', 'budget')]
+    assert plan_clinic_evictions({'me': 100 * MB, 'fresh': 100 * MB}, keep='me', now=now) == []
@@ -0,0 +1,64 @@
+import pytest
+
+import utils.data_version as data_version
+from utils.data_version import changes_since, current_version, publish_change
+
+
+@pytest.fixture
+def versions(tmp_path):
+    return str(tmp_path / "data_version.sqlite")
+
+
+def test_publish_and_read_back_changes(versions):
+    assert current_version(path=versions) == 0
+    v1 = publish_change('visits', ['0000002', '0000001', '0000002'], clinic='a', path=versions)
+    v2 = publish_change('patients', None, path=versions)
+
+    changes, complete = changes_since(0, path=versions)
+    assert complete and current_version(path=versions) == v2
+    assert [c['version'] for c in changes] == [v1, v2]
+    assert changes[0]['table'] == 'visits' and changes[0]['hns'] == ['0000001', '0000002']
+    assert changes[0]['clinic'] == 'a' and changes[0]['origin'] == data_version.REPLICA_ID
+    # hns = None (ไม่รู้ว่า HN ไหนเปลี่ยน) ต้องส่งต่อเป็น None ไม่ใช่ list ว่าง
+    assert changes[1]['hns'] is None and changes[1]['clinic'] == 'default'
+    assert changes_since(v2, path=versions) == ([], True)
+
+
+def test_incomplete_after_old_changes_are_compacted(versions, monkeypatch):
+    monkeypatch.setattr(data_version, 'VERSION_KEEP_CHANGES', 3)
+    for i in range(6):
+        publish_change('visits', [str(i)], path=versions)
+
+    changes, complete = changes_since(1, path=versions)
+    assert not complete
+    assert [c['hns'] for c in changes] == [['3'], ['4'], ['5']]
+    # ตามทันรายการที่ยังเก็บไว้ -> ครบ
+    assert changes_since(3, path=versions)[1]
+
+
+def test_watcher_skips_changes_from_this_replica(versions, monkeypatch):
+    class Stop(BaseException):
+        pass
+
+    monkeypatch.setattr(data_version, '_WATCHER', {'thread': None, 'version': 0, 'applied': 0, 'last_error': None})
+    publish_change('visits', ['0000001'], clinic='a', path=versions)
+    with data_version._connect(versions) as conn:
+        conn.execute(
+            "INSERT INTO data_changes (table_name, hns, origin, created_at, clinic) VALUES (?, ?, ?, ?, ?)",
+            ('patients', '["0000002"]', 'other-replica', '2024-01-01 00:00:00', 'b')
+        )
+    applied = []
+
+    def apply(table, hns, clinic):
+        applied.append((table, hns, clinic))
+        raise Stop()   # ออกจาก Loop หลังรายการแรกที่ถูกนำไปใช้
+
+    with pytest.raises(Stop):
+        data_version._watcher_loop(apply, lambda: None, versions)
+    assert applied == [('patients', ['0000002'], 'b')]
+
+
+def test_schema_is_set_up_once_per_path(versions, monkeypatch):
+    publish_change('visits', ['0000001'], path=versions)
+    monkeypatch.setattr(data_version, '_SCHEMA', "THIS IS NOT SQL")
+    assert changes_since(0, path=versions)[0][0]['hns'] == ['0000001']
@@ -0,0 +1,27 @@
+import pytest
+
+from utils.fetch_fonts import KANIT_FILES, fetch_fonts
+
+
+def _source(tmp_path, ttf_data):
+    src = tmp_path / "src"
+    src.mkdir()
+    for name in KANIT_FILES:
+        (src / name).write_bytes(ttf_data if name.endswith('.ttf') else b"OFL")
+    return src.as_uri() + "/"
+
+
+def test_fetch_fonts_downloads_missing_files_only(tmp_path):
+    base_url = _source(tmp_path, b'\x00\x01\x00\x00font')
+    out = tmp_path / "fonts"
+    assert len(fetch_fonts(str(out), base_url=base_url)) == len(KANIT_FILES)
+    assert fetch_fonts(str(out), base_url=base_url) == []
+    assert (out / "Kanit-Regular.ttf").read_bytes().startswith(b'\x00\x01\x00\x00')
+
+
+def test_fetch_fonts_rejects_non_font_response(tmp_path):
+    base_url = _source(tmp_path, b"<!DOCTYPE html>")
+    out = tmp_path / "fonts"
+    with pytest.raises(ValueError):
+        fetch_fonts(str(out), base_url=base_url)
+    assert not any(p.suffix in ('.ttf', '.part') for p in out.iterdir())
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from utils.frame_diff import row_hashes, row_keys, changed_keys, frame_version
+from utils.snapshot_cache import SNAPSHOT_ATTR
+
+
+def _visits(rows):
+    return pd.DataFrame(rows, columns=['hn', 'date', 'next_appt', 'note'])
+
+
+def _diff(old, new, columns=('hn', 'date', 'next_appt')):
+    return changed_keys(row_hashes(old, columns), row_keys(old), row_hashes(new, columns), row_keys(new))
+
+
+def test_unchanged_and_ignored_columns():
+    old = _visits([('1', '2024-01-01', '', 'a'), ('2', '2024-01-02', '', 'b')])
+    new = old.copy()
+    new.loc[1, 'note'] = 'edited'
+    assert _diff(old, new) == set()
+
+
+def test_edit_in_place_reports_hn():
+    old = _visits([('1', '2024-01-01', '', ''), ('2', '2024-01-02', '', '')])
+    new = old.copy()
+    new.loc[1, 'next_appt'] = '2024-03-01'
+    assert _diff(old, new) == {'2'}
+
+
+def test_append_and_truncate():
+    old = _visits([('1', '2024-01-01', '', '')])
+    new = _visits([('1', '2024-01-01', '', ''), ('3', '2024-01-05', '', '')])
+    assert _diff(old, new) == {'3'}
+    assert _diff(new, old) == {'3'}
+
+
+def test_delete_shifts_following_rows():
+    old = _visits([('1', 'd1', '', ''), ('2', 'd2', '', ''), ('3', 'd3', '', '')])
+    new = _visits([('2', 'd2', '', ''), ('3', 'd3', '', ''), ('4', 'd4', '', '')])
+    assert _diff(old, new) == {'1', '2', '3', '4'}
+
+
+def test_mixed_types_hash():
+    df = pd.DataFrame({'hn': ['1', '2'], 'pefr': [300, '']})
+    assert len(row_hashes(df, ['hn', 'pefr'])) == 2
+    assert row_hashes(df.iloc[0:0], ['hn']).dtype == np.uint64
+
+
+def test_frame_version_prefers_snapshot_tag():
+    df = _visits([('1', '2024-01-01', '', '')])
+    df.attrs[SNAPSHOT_ATTR] = ('staff', ('default', 'visits'), 12.5)
+    assert frame_version(df, ['hn']) == ('staff', ('default', 'visits'), 12.5)
+
+
+def test_frame_version_changes_with_content_at_same_length():
+    df = _visits([('1', '2024-01-01', '2024-02-01', '')])
+    other = df.copy()
+    other.loc[0, 'next_appt'] = '2024-02-15'
+    assert frame_version(df, ['hn', 'next_appt']) != frame_version(other, ['hn', 'next_appt'])
+    assert frame_version(df, ['hn']) == frame_version(other, ['hn'])
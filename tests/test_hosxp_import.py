@@ -0,0 +1,139 @@
+import io
+
+import pandas as pd
+
+from utils.hosxp_import import diff_import, normalize_hosxp_dates, sniff_csv_format, stream_hosxp_file
+
+
+def test_buddhist_era_and_text_formats():
+    dates, errors = normalize_hosxp_dates(['19/01/2569', '19-01-2026', '2026-01-19', '2569-01-19 08:30:00',
+                                          '5/3/2567 14:00'])
+    assert dates.tolist() == ['2026-01-19'] * 4 + ['2024-03-05']
+    assert errors.empty
+
+
+def test_excel_serial_numbers_and_strings():
+    dates, errors = normalize_hosxp_dates([45310, 45310.0, '45310', '45310.5'])
+    assert dates.tolist() == ['2024-01-19'] * 4
+    assert errors.empty
+
+
+def test_blank_values_are_not_errors():
+    dates, errors = normalize_hosxp_dates(['', '-', None, float('nan'), '19/01/2569'])
+    assert dates.tolist() == [None, None, None, None, '2026-01-19']
+    assert errors.empty
+
+
+def test_invalid_dates_are_reported_with_row():
+    values = pd.Series(['31/02/2569', 'abc', '19/01/2569', 'abc'], index=[10, 11, 12, 13])
+    dates, errors = normalize_hosxp_dates(values)
+    assert dates.tolist() == [None, None, '2026-01-19', None]
+    assert errors['row'].tolist() == [10, 11, 13]
+    assert errors['value'].tolist() == ['31/02/2569', 'abc', 'abc']
+
+
+def test_datetime_column_passes_through():
+    values = pd.Series(pd.to_datetime(['2026-01-19 08:30', None]))
+    dates, errors = normalize_hosxp_dates(values)
+    assert dates.tolist() == ['2026-01-19', None]
+    assert errors.empty
+
+
+def _matched(rows):
+    return pd.DataFrame(rows, columns=['hn', 'first_name', 'last_name', 'visit_date', 'next_appt_date'])
+
+
+def test_diff_import_classifies_rows():
+    visits = pd.DataFrame({'hn': ['0000001', '0000002', '0000003'],
+                           'date': ['19/01/2569', '2026-01-20', '2026-01-21'],
+                           'next_appt': ['2026-02-01', '2026-02-02', '-']})
+    matched = _matched([
+        ('0000001', 'A', 'B', '2026-01-19', '2026-02-01'),   # unchanged (วันที่เดิมเป็น พ.ศ.)
+        ('0000002', 'C', 'D', '2026-01-20', '2026-03-02'),   # update
+        ('0000003', 'E', 'F', '2026-01-21', None),           # ไม่มีวันนัด -> ไม่เขียนทับ
+        ('0000004', 'G', 'H', '2026-01-22', '2026-04-01'),   # new
+        ('0000005', 'I', 'J', None, '2026-04-01'),           # skipped
+    ])
+    diff = diff_import(matched, visits)
+
+    assert diff['report']['action'].tolist() == ['unchanged', 'update', 'unchanged', 'new', 'skipped']
+    assert diff['appointment_updates'] == [{'row': 3, 'value': '2026-03-02', 'hn': '0000002', 'date': '2026-01-20'}]
+    assert [(v['hn'], v['date'], v['next_appt']) for v in diff['new_visits']] == [('0000004', '2026-01-22', '2026-04-01')]
+    assert diff['counts'] == {'unchanged': 2, 'update': 1, 'new': 1, 'skipped': 1}
+
+
+def test_diff_import_keeps_last_duplicate_with_appointment():
+    matched = _matched([
+        ('0000001', 'A', 'B', '2026-01-19', '2026-02-01'),
+        ('0000001', 'A', 'B', '2026-01-19', None),
+        ('0000001', 'A', 'B', '2026-01-19', '2026-02-15'),
+    ])
+    diff = diff_import(matched, pd.DataFrame())
+
+    assert diff['report']['action'].tolist() == ['duplicate', 'duplicate', 'new']
+    assert [v['next_appt'] for v in diff['new_visits']] == ['2026-02-15']
+    assert diff['appointment_updates'] == []
+
+
+HOSXP_HEADER = ['HN', 'ชื่อ', 'วันที่รับบริการ', 'วันนัดถัดไป']
+HOSXP_ROWS = [
+    ['1', 'สมชาย', '19/01/2569', '19/02/2569'],
+    ['0000002', 'สมหญิง', '20/01/2569', ''],
+    ['999', 'ไม่มีในทะเบียน', '21/01/2569', ''],
+    ['3.0', 'ประยุทธ', 'ไม่ทราบ', '01/03/2569'],
+    ['0000002', 'สมหญิง', '22/01/2569', '22/02/2569'],
+]
+PATIENTS = pd.DataFrame({'hn': ['0000001', '0000002', '0000003'], 'first_name': ['A', 'B', 'C'],
+                         'last_name': ['a', 'b', 'c']})
+
+
+def _hosxp_bytes(encoding, delimiter, bom=b''):
+    text = "\r\n".join(delimiter.join(r) for r in [HOSXP_HEADER] + HOSXP_ROWS) + "\r\n"
+    return bom + text.encode(encoding)
+
+
+def test_sniff_encoding_and_delimiter():
+    assert sniff_csv_format(_hosxp_bytes('cp874', ',')) == ('cp874', ',')
+    assert sniff_csv_format(_hosxp_bytes('utf-8', ';')) == ('utf-8', ';')
+    assert sniff_csv_format(_hosxp_bytes('utf-8', '\t', bom=b'\xef\xbb\xbf')) == ('utf-8-sig', '\t')
+    assert sniff_csv_format(_hosxp_bytes('utf-16', '\t')) == ('utf-16', '\t')       # มี BOM
+    assert sniff_csv_format(_hosxp_bytes('utf-16-le', ';')) == ('utf-16le', ';')  # ไม่มี BOM
+    assert sniff_csv_format(b'') == ('utf-8', ',')
+
+
+def test_sniff_does_not_fall_back_on_truncated_utf8_sample():
+    # ตัวอย่างตัดกลางตัวอักษรไทย (3 ไบต์) -> ยังเป็น utf-8 ไม่ใช่ cp874
+    data = _hosxp_bytes('utf-8', ',')
+    cut = data.index('สมหญิง'.encode('utf-8')) + 1
+    assert sniff_csv_format(data[:cut]) == ('utf-8', ',')
+
+
+def test_stream_reads_each_encoding_and_delimiter():
+    cases = [('cp874', ';', b''), ('utf-16', '\t', b''), ('utf-8', ',', b'\xef\xbb\xbf'), ('utf-8', '|', b'')]
+    for encoding, delimiter, bom in cases:
+        result = stream_hosxp_file(io.BytesIO(_hosxp_bytes(encoding, delimiter, bom)), 'export.csv', PATIENTS)
+        assert result['missing_cols'] == [], (encoding, delimiter)
+        assert result['delimiter'] == delimiter and result['total_rows'] == len(HOSXP_ROWS)
+        assert result['matched']['hn'].tolist() == ['0000001', '0000002', '0000003', '0000002']
+        assert result['matched']['visit_date'].tolist()[:2] == ['2026-01-19', '2026-01-20']
+
+
+def test_stream_in_chunks_matches_whole_file():
+    data = _hosxp_bytes('cp874', ',')
+    whole = stream_hosxp_file(io.BytesIO(data), 'export.csv', PATIENTS)
+    progress = []
+    chunked = stream_hosxp_file(io.BytesIO(data), 'export.csv', PATIENTS, chunksize=2,
+                                progress_callback=lambda rows, fraction: progress.append(rows))
+
+    pd.testing.assert_frame_equal(chunked['matched'], whole['matched'])
+    assert progress == [2, 4, 5]
+    assert chunked['sample_hns'] == ['0000001', '0000002']
+    # เลขแถวของวันที่ผิดพลาดนับต่อเนื่องทั้งไฟล์ (ไม่เริ่มใหม่ทุก Chunk)
+    assert chunked['date_errors'][['row', 'column', 'HN']].values.tolist() == [[3, 'วันที่รับบริการ', '0000003']]
+    pd.testing.assert_frame_equal(chunked['date_errors'], whole['date_errors'])
+
+
+def test_stream_reports_missing_columns():
+    data = "HN,วันที่\r\n1,19/01/2569\r\n".encode('utf-8')
+    result = stream_hosxp_file(io.BytesIO(data), 'export.csv', PATIENTS)
+    assert result['missing_cols'] == ['วันที่รับบริการ', 'วันนัดถัดไป']
@@ -0,0 +1,83 @@
+import pandas as pd
+
+from utils.hosxp_import import diff_import, applied_import_rows
+from utils.import_ledger import filter_known_rows, record_import, find_imported_file, import_history
+
+
+def _matched(rows):
+    return pd.DataFrame(rows, columns=['hn', 'first_name', 'last_name', 'visit_date', 'next_appt_date'])
+
+
+def test_known_rows_are_skipped_after_record(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    matched = _matched([('0000001', 'A', 'B', '2024-01-01', '2024-02-01'),
+                        ('0000002', 'C', 'D', '2024-01-02', None)])
+    fresh, skipped = filter_known_rows(matched, path=path)
+    assert skipped == 0 and len(fresh) == 2
+
+    record_import("hash-1", "a.csv", matched, counts={'total_rows': 2, 'new': 2}, path=path)
+    fresh, skipped = filter_known_rows(matched, path=path)
+    assert skipped == 2 and fresh.empty
+    assert find_imported_file("hash-1", path=path)['new_count'] == 2
+    assert len(import_history(path=path)) == 1
+
+
+def test_changed_appointment_is_not_known(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    record_import("h", "a.csv", _matched([('0000001', 'A', 'B', '2024-01-01', '2024-02-01')]), path=path)
+    fresh, skipped = filter_known_rows(_matched([('0000001', 'A', 'B', '2024-01-01', '2024-03-01')]), path=path)
+    assert skipped == 0 and len(fresh) == 1
+
+
+def test_rows_without_visit_date_are_not_recorded(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    matched = _matched([('0000001', 'A', 'B', None, '2024-02-01')])
+    record_import("h", "a.csv", matched, path=path)
+    assert filter_known_rows(matched, path=path)[1] == 0
+
+
+def test_applied_rows_exclude_stale_updates_and_duplicates(tmp_path):
+    visits = pd.DataFrame({'hn': ['0000001', '0000002', '0000003'],
+                           'date': ['2024-01-01', '2024-01-02', '2024-01-03'],
+                           'next_appt': ['2024-02-01', '2024-02-02', '2024-02-03']})
+    matched = _matched([
+        ('0000001', 'A', 'B', '2024-01-01', '2024-03-01'),   # update -> stale
+        ('0000002', 'C', 'D', '2024-01-02', '2024-03-02'),   # update -> สำเร็จ
+        ('0000003', 'E', 'F', '2024-01-03', '2024-02-03'),   # unchanged
+        ('0000004', 'G', 'H', '2024-01-04', None),           # new
+        ('0000004', 'G', 'H', '2024-01-04', None),           # duplicate
+        ('0000005', 'I', 'J', None, None),                   # skipped
+    ])
+    diff = diff_import(matched, visits)
+    stale = [u for u in diff['appointment_updates'] if u['hn'] == '0000001']
+    applied = applied_import_rows(diff['report'], stale)
+    assert sorted(applied['hn']) == ['0000002', '0000003', '0000004']
+
+    path = str(tmp_path / "ledger.sqlite")
+    record_import("h", "a.csv", applied, path=path)
+    fresh, skipped = filter_known_rows(matched, path=path)
+    # แถวที่ยังไม่ได้ใช้ (stale) ต้องถูกนำเข้าอีกครั้งได้
+    assert '0000001' in set(fresh['hn'])
+    assert skipped == 4
+
+
+def test_re_recording_a_file_keeps_row_history(tmp_path):
+    from utils.import_ledger import imported_rows_for
+
+    path = str(tmp_path / "ledger.sqlite")
+    matched = _matched([('0000001', 'A', 'B', '2024-01-01', '2024-02-01')])
+    first_id = record_import("h", "a.csv", matched, counts={'new': 1}, path=path)
+    # นำเข้าใหม่ทั้งหมด (ไฟล์เดิม) -> id เดิม, ประวัติของแถวยังอยู่
+    again = _matched([('0000001', 'A', 'B', '2024-01-01', '2024-02-01'),
+                      ('0000001', 'A', 'B', '2024-01-05', '2024-03-01')])
+    assert record_import("h", "a-renamed.csv", again, counts={'new': 1}, path=path) == first_id
+
+    rows = imported_rows_for('0000001', path=path)
+    assert rows['visit_date'].tolist() == ['2024-01-05', '2024-01-01']
+    assert set(rows['file_name']) == {'a-renamed.csv'}
+    assert len(import_history(path=path)) == 1
+
+    # แถวเดียวกันจากไฟล์อื่น -> ชี้ไปที่การนำเข้าล่าสุด
+    record_import("h2", "b.csv", matched, path=path)
+    rows = imported_rows_for('0000001', path=path).set_index('visit_date')
+    assert rows.loc['2024-01-01', 'file_name'] == 'b.csv'
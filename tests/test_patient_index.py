@@ -0,0 +1,77 @@
+import pandas as pd
+
+from utils.patient_index import PatientSummaryIndex
+from utils.snapshot_cache import SNAPSHOT_ATTR
+
+
+def _patients(hns):
+    return pd.DataFrame({
+        'hn': hns, 'prefix': 'นาย', 'first_name': 'A', 'last_name': 'B',
+        'dob': '1980-01-01', 'height': 170, 'best_pefr': 400,
+    })
+
+
+def _visits(rows):
+    return pd.DataFrame(rows, columns=['hn', 'date', 'pefr', 'controller', 'technique_check'])
+
+
+def _tag(df, version):
+    df.attrs[SNAPSHOT_ATTR] = ('test', ('t',), version)
+    return df
+
+
+def test_patient_visits_sorted_by_date():
+    index = PatientSummaryIndex()
+    visits = _visits([('1', '2024-03-01', 300, 'X', ''), ('2', '2024-01-01', 200, '', ''),
+                      ('1', '2024-01-01', 250, 'Y', '')])
+    index.sync(_patients(['1', '2']), visits)
+    assert index.patient_visits('1', visits)['pefr'].tolist() == [250, 300]
+    assert index.get('1')['last_controller'] == 'X'
+    assert index.get('2')['visit_count'] == 1
+
+
+def test_manual_edit_with_same_row_count_is_picked_up():
+    index = PatientSummaryIndex()
+    patients = _tag(_patients(['1', '2']), 1.0)
+    visits = _tag(_visits([('1', '2024-01-01', 300, 'X', ''), ('2', '2024-01-02', 200, 'Y', '')]), 1.0)
+    index.sync(patients, visits)
+
+    edited = _tag(visits.copy(), 2.0)
+    edited.loc[0, 'controller'] = 'Z'
+    index.sync(patients, edited)
+    assert index.get('1')['last_controller'] == 'Z'
+    assert index.get('2')['last_controller'] == 'Y'
+
+
+def test_same_snapshot_version_skips_work():
+    index = PatientSummaryIndex()
+    patients = _tag(_patients(['1']), 1.0)
+    visits = _tag(_visits([('1', '2024-01-01', 300, 'X', '')]), 1.0)
+    index.sync(patients, visits)
+    index._rows = None  # ถ้าเทียบแถวอีกครั้งจะ Error
+    assert index.sync(patients, visits) is index
+
+
+def test_delete_plus_append_does_not_leak_other_patients_visits():
+    index = PatientSummaryIndex()
+    patients = _patients(['1', '2', '3'])
+    visits = _visits([('1', '2024-01-01', 300, '', ''), ('2', '2024-01-02', 200, '', ''),
+                      ('3', '2024-01-03', 100, '', '')])
+    index.sync(patients, visits)
+
+    # ลบแถวของ HN 1 แล้วเพิ่ม Visit ใหม่ของ HN 3 -> จำนวนแถวเท่าเดิม แต่ตำแหน่งเลื่อน
+    shifted = _visits([('2', '2024-01-02', 200, '', ''), ('3', '2024-01-03', 100, '', ''),
+                       ('3', '2024-02-01', 150, '', '')])
+    index.sync(patients, shifted)
+    assert index.patient_visits('1', shifted).empty
+    assert index.patient_visits('2', shifted)['hn'].tolist() == ['2']
+    assert index.patient_visits('3', shifted)['pefr'].tolist() == [100, 150]
+
+
+def test_stale_positions_fall_back_to_filtering():
+    index = PatientSummaryIndex()
+    visits = _visits([('1', '2024-01-01', 300, '', ''), ('2', '2024-01-02', 200, '', '')])
+    index.sync(_patients(['1', '2']), visits)
+    other = _visits([('2', '2024-01-02', 200, '', ''), ('1', '2024-01-05', 310, '', '')])
+    assert index.patient_visits('1', other)['pefr'].tolist() == [310]
+    assert index.patient_row('2', _patients(['2', '1']))['hn'] == '2'
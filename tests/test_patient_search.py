@@ -0,0 +1,114 @@
+import pandas as pd
+
+from utils.patient_search import PatientSearchIndex
+from utils.snapshot_cache import SNAPSHOT_ATTR
+
+
+def _patients(rows, version=None):
+    df = pd.DataFrame(rows, columns=['hn', 'prefix', 'first_name', 'last_name', 'status'])
+    if version is not None:
+        df.attrs[SNAPSHOT_ATTR] = ('test', ('patients',), version)
+    return df
+
+
+ROWS = [
+    ('0000123', 'นาย', 'สมชาย', 'ใจดี', 'Active'),
+    ('0001234', 'นาง', 'สมหญิง', 'รักดี', 'Active'),
+    ('0000999', 'นาย', 'ประยุทธ', 'สมบูรณ์', 'Inactive'),
+    ('0004567', 'Mr.', 'John', 'Smith', ''),
+]
+
+
+def test_hn_ranking_exact_then_prefix_then_contains():
+    index = PatientSearchIndex().sync(_patients(ROWS))
+    assert index.search('123') == ['0000123', '0001234']
+    assert index.search('0001234')[0] == '0001234'
+
+
+def test_name_prefix_beats_contains():
+    index = PatientSearchIndex().sync(_patients(ROWS))
+    # "สม" ขึ้นต้นชื่อ 2 คน และอยู่ในนามสกุล (ขึ้นต้น) ของอีกคน
+    assert set(index.search('สม')) == {'0000123', '0001234', '0000999'}
+    assert index.search('ใจดี') == ['0000123']
+
+
+def test_fuzzy_match_and_case_insensitive():
+    index = PatientSearchIndex().sync(_patients(ROWS))
+    assert index.search('john') == ['0004567']
+    assert index.search('Smiht') == ['0004567']
+
+
+def test_status_filter_and_default_status():
+    index = PatientSearchIndex().sync(_patients(ROWS))
+    assert index.search('', statuses=['Inactive']) == ['0000999']
+    assert index.label('0004567').endswith('(Active)')
+
+
+def test_manual_name_edit_same_row_count():
+    index = PatientSearchIndex().sync(_patients(ROWS, version=1.0))
+    edited = [list(r) for r in ROWS]
+    edited[0][2] = 'สมศักดิ์'
+    edited[2][4] = 'Active'
+    index.sync(_patients(edited, version=2.0))
+    assert index.search('สมศักดิ์') == ['0000123']
+    assert 'สมชาย' not in index.label('0000123')
+    assert '0000999' in index.search('', statuses=['Active'])
+
+
+def test_delete_plus_append_removes_old_hn():
+    index = PatientSearchIndex().sync(_patients(ROWS, version=1.0))
+    rows = ROWS[1:] + [('0007777', 'นาย', 'ใหม่', 'มาก', 'Active')]
+    index.sync(_patients(rows, version=2.0))
+    assert '0000123' not in index.all_hns
+    assert index.search('ใหม่') == ['0007777']
+
+
+def test_same_version_is_not_rescanned():
+    df = _patients(ROWS, version=1.0)
+    index = PatientSearchIndex().sync(df)
+    df.loc[0, 'first_name'] = 'ไม่ควรเห็น'   # แก้ในที่ โดยไม่เปลี่ยนรุ่น -> ไม่ต้องอ่านใหม่
+    index.sync(df)
+    assert index.search('สมชาย') == ['0000123']
+
+
+def test_published_state_is_not_modified_by_sync():
+    index = PatientSearchIndex().sync(_patients(ROWS, version=1))
+    before = index._state
+    edited = list(ROWS)
+    edited[0] = ('0000123', 'นาย', 'Somchai', 'ใจดี', 'Active')
+    index.sync(_patients(edited + [('0007777', 'นาง', 'มาลี', 'ศรี', 'Active')], version=2))
+
+    # การค้นหาที่ถือชุดเดิมอยู่ (เริ่มก่อน sync) ยังเห็นข้อมูลเดิมครบและตรงกัน
+    assert before.first[0] == 'สมชาย' and len(before.hns) == len(before.first) == 4
+    assert before.postings['สม'] >= {0, 1}
+    assert index.search('somchai') == ['0000123']
+    assert index.search('สมชาย') == []
+    assert '0007777' in index.all_hns
+
+
+def test_search_during_concurrent_rebuilds():
+    import threading
+
+    many = [(f"{i:07d}", 'นาย', f"ชื่อ{i}", f"สกุล{i}", 'Active') for i in range(300)]
+    index = PatientSearchIndex().sync(_patients(many, version=0))
+    errors = []
+    done = threading.Event()
+
+    def searcher():
+        while not done.is_set():
+            try:
+                index.search('ชื่อ1')
+                index.search('ชือ15')
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=searcher) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for v in range(1, 30):
+        index.sync(_patients(many[: 300 - v * 5] if v % 2 else many, version=v))
+    done.set()
+    for t in threads:
+        t.join()
+    assert errors == []
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import utils.gsheet_handler as gsheet_handler
+from utils.gsheet_handler import provision_public_tokens
+from utils.local_sheets import LocalSheetsClient
+from utils.synthetic_data import PATIENT_COLUMNS
+
+
+def _patients(rows, columns=PATIENT_COLUMNS):
+    return pd.DataFrame([r[:len(columns)] for r in rows], columns=columns)
+
+
+ROWS = [
+    ['0000001', 'นาย', 'ก', 'ข', '', '', '', 'Active', 'tok-1'],
+    ['0000002', 'นาง', 'ค', 'ง', '', '', '', 'Active', ''],
+    ['0000003', 'นาย', 'จ', 'ฉ', '', '', '', 'Active', ''],
+]
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    def use(df):
+        client = LocalSheetsClient({'patients': df})
+        gsheet_handler.use_sheets_client(client)
+        return client
+
+    monkeypatch.setattr(gsheet_handler, 'publish_change', lambda *args, **kwargs: None)
+    monkeypatch.setattr(gsheet_handler, '_UNPROVISIONED', {})
+    yield use
+    gsheet_handler.use_sheets_client(None)
+
+
+def _sheet(client):
+    return client.open_by_key(None).worksheet('patients').get_all_values()
+
+
+def test_tokens_are_written_to_the_sheet_row_of_each_hn(sheets):
+    # ลำดับใน DataFrame ไม่ตรงกับ Sheet -> ต้องหาแถวจาก HN ไม่ใช่ตำแหน่ง
+    client = sheets(_patients(ROWS))
+    df = _patients([ROWS[2], ROWS[0], ROWS[1]])
+
+    filled, created = provision_public_tokens(df, clinic='default')
+    values = _sheet(client)
+    assert created == 2
+    assert values[1][8] == 'tok-1'
+    assert values[2][8] == filled.loc[filled['hn'] == '0000002', 'public_token'].item() != ''
+    assert values[3][8] == filled.loc[filled['hn'] == '0000003', 'public_token'].item() != ''
+
+
+def test_header_is_added_when_token_column_is_missing(sheets):
+    columns = PATIENT_COLUMNS[:-1]
+    client = sheets(_patients(ROWS, columns))
+
+    filled, created = provision_public_tokens(_patients(ROWS, columns), clinic='default')
+    values = _sheet(client)
+    assert created == 3
+    assert values[0][8] == 'public_token'
+    assert [r[8] for r in values[1:]] == filled['public_token'].tolist()
+
+
+def test_returned_frame_is_filled_in_memory(sheets):
+    sheets(_patients(ROWS))
+    df = _patients(ROWS)
+
+    filled, _ = provision_public_tokens(df, clinic='default')
+    assert filled is not df and df['public_token'].tolist() == ['tok-1', '', '']
+    assert filled['public_token'].iloc[0] == 'tok-1'
+    assert not gsheet_handler.missing_token_mask(filled).any()
+    # เติมครบแล้ว -> ไม่เรียก Sheets อีก
+    assert provision_public_tokens(filled, clinic='default') == (filled, 0)
+
+
+def test_hns_missing_from_the_sheet_are_not_rechecked_every_rerun(sheets):
+    client = sheets(_patients(ROWS[:1]))
+    df = _patients(ROWS)    # 0000002 / 0000003 ไม่มีใน Sheet (เช่นถูกลบไปแล้ว)
+
+    assert provision_public_tokens(df, clinic='default') == (df, 0)
+    client.reset_calls()
+    assert provision_public_tokens(df, clinic='default') == (df, 0)
+    assert client.reset_calls() == {}
+
+    # ข้อมูลผู้ป่วยเปลี่ยน -> ตรวจใหม่
+    changed = _patients(ROWS + [['0000004', 'นาย', 'ช', 'ซ', '', '', '', 'Active', '']])
+    provision_public_tokens(changed, clinic='default')
+    assert ('patients', 'col_values') in client.reset_calls()
@@ -0,0 +1,132 @@
+import threading
+import time
+import types
+
+import pandas as pd
+import pytest
+
+import utils.snapshot_cache as snapshot_cache
+from utils.snapshot_cache import SnapshotCache, snapshot_version
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Thread เบื้องหลังของโมดูลยังใช้ sleep จริง
+    monkeypatch.setattr(snapshot_cache, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=time.sleep))
+    return clock
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+def _cache(loader, **kwargs):
+    # idle_timeout < 0 -> Thread refresher ไม่โหลดล่วงหน้าเอง (ทดสอบเฉพาะที่ get() สั่ง)
+    return SnapshotCache(loader, ttl=10, refresh_ahead=2, max_stale=100, idle_timeout=-1, name="test", **kwargs)
+
+
+def test_stale_value_is_served_while_refresh_runs(clock):
+    gate = threading.Event()
+    calls = []
+
+    def loader(table):
+        calls.append(table)
+        if len(calls) > 1:
+            gate.wait(5)
+        return pd.DataFrame({'n': [len(calls)]})
+
+    cache = _cache(loader)
+    first = cache.get('patients')
+    assert first['n'].item() == 1 and snapshot_version(first)[:2] == ("test", ('patients',))
+
+    clock.now += 9        # ใกล้หมดอายุ (ttl - refresh_ahead = 8)
+    stale = cache.get('patients')
+    assert stale['n'].item() == 1
+    _wait(lambda: len(calls) == 2)
+    assert cache.get('patients')['n'].item() == 1   # กำลังโหลดอยู่ -> ไม่สั่งซ้ำ
+    assert len(calls) == 2 and cache.stats['stale_hits'] == 2
+    assert cache.status()['tables']['patients']['refreshing']
+
+    gate.set()
+    _wait(lambda: not cache.status()['tables']['patients']['refreshing'])
+    fresh = cache.get('patients')
+    assert fresh['n'].item() == 2 and snapshot_version(fresh) != snapshot_version(first)
+    assert cache.stats['refreshes'] == 1
+
+
+def test_concurrent_misses_share_one_sync_load():
+    gate = threading.Event()
+    calls = []
+
+    def loader(table):
+        calls.append(table)
+        gate.wait(5)
+        return ['rows']
+
+    cache = _cache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('visits'))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    _wait(lambda: len(calls) == 1)
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+
+    assert calls == ['visits'] and results == [['rows']] * 5
+    assert cache.stats['sync_loads'] == 1 and cache.stats['hits'] == 4
+
+
+def test_load_finished_after_eviction_is_not_installed():
+    gate = threading.Event()
+    calls = []
+
+    def loader(table):
+        calls.append(table)
+        if len(calls) == 1:
+            gate.wait(5)
+        return f"v{len(calls)}"
+
+    cache = _cache(loader)
+    result = []
+    reader = threading.Thread(target=lambda: result.append(cache.get('patients')))
+    reader.start()
+    _wait(lambda: calls)
+    cache.clear()          # มีการเขียนข้อมูลระหว่างโหลด -> ผลที่กำลังโหลดเก่าไปแล้ว
+    gate.set()
+    reader.join()
+
+    assert result == ['v1']           # ผู้เรียกที่รออยู่ยังได้ผลของตัวเอง
+    assert cache.usage() == []
+    assert cache.get('patients') == 'v2'
+
+
+def test_clear_by_prefix_and_evict():
+    cache = _cache(lambda clinic, table: f"{clinic}/{table}", size_fn=len)
+    for key in [('a', 'patients'), ('a', 'visits'), ('b', 'patients'), ('b', 'visits')]:
+        cache.get(*key)
+
+    cache.clear('a')
+    assert sorted(k for k, _, _ in cache.usage()) == [('b', 'patients'), ('b', 'visits')]
+    cache.clear('b', 'visits')
+    assert [(k, size) for k, size, _ in cache.usage()] == [(('b', 'patients'), len('b/patients'))]
+    cache.evict([('b', 'patients'), ('missing',)])
+    assert cache.usage() == [] and cache.stats['evictions'] == 4
+
+    cache.get('a', 'patients')
+    cache.clear()
+    assert cache.usage() == [] and cache.stats['sync_loads'] == 5
@@ -0,0 +1,25 @@
+import utils.style as style
+
+
+def _font_css(monkeypatch, static_dir):
+    monkeypatch.setattr(style, 'STATIC_DIR', str(static_dir))
+    style._font_css.cache_clear()
+    try:
+        return style._font_css()
+    finally:
+        style._font_css.cache_clear()
+
+
+def test_font_css_falls_back_to_google_fonts_without_files(tmp_path, monkeypatch):
+    css = _font_css(monkeypatch, tmp_path)
+    assert css.startswith("@import") and "@font-face" not in css
+
+
+def test_font_css_uses_bundled_files(tmp_path, monkeypatch):
+    fonts = tmp_path / "fonts"
+    fonts.mkdir()
+    for name in style.KANIT_FACES.values():
+        (fonts / name).write_bytes(b"\x00\x01\x00\x00")
+    css = _font_css(monkeypatch, tmp_path)
+    assert "@import" not in css
+    assert css.count("@font-face") == 4 and "app/static/fonts/Kanit-SemiBold.ttf" in css
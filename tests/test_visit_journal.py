@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+
+import utils.visit_journal as visit_journal
+from utils.visit_journal import (
+    append_visit, flush_pending, merge_pending_visits, parked_count, pending_count, pending_visits,
+    requeue_parked, _claim_batch,
+)
+
+
+def _visit(hn, date="2024-01-01"):
+    return {'hn': hn, 'date': date, 'pefr': 300}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "journal.sqlite")
+
+
+def test_flush_sends_pending_rows_with_journal_id(journal):
+    ids = [append_visit(_visit(hn), path=journal) for hn in ('0000001', '0000002')]
+    sent = []
+    assert flush_pending(sent.extend, path=journal) == 2
+    assert [r['journal_id'] for r in sent] == ids
+    assert pending_count(path=journal) == 0
+    assert flush_pending(sent.extend, path=journal) == 0
+
+
+def test_failed_write_releases_claim_for_retry(journal):
+    append_visit(_visit('0000001'), path=journal)
+
+    def fail(records):
+        raise RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        flush_pending(fail, path=journal)
+    pending = pending_visits(path=journal)
+    assert pending['attempts'].tolist() == [1] and pending['last_error'].tolist() == ["quota"]
+
+    sent = []
+    assert flush_pending(sent.extend, path=journal) == 1
+
+
+def test_claimed_rows_are_skipped_until_lease_expires(journal):
+    append_visit(_visit('0000001'), path=journal)
+    assert len(_claim_batch("other-worker", 10, lease=300, path=journal)) == 1
+
+    sent = []
+    assert flush_pending(sent.extend, path=journal) == 0
+    # Worker เดิมเงียบไปเกิน lease -> ส่งแทนได้
+    assert flush_pending(sent.extend, path=journal, lease=-1) == 1
+    assert pending_count(path=journal) == 0
+
+
+def test_flusher_survives_base_exception(journal, monkeypatch):
+    monkeypatch.setattr(visit_journal, 'JOURNAL_FLUSH_INTERVAL', 0.01)
+    monkeypatch.setattr(visit_journal, 'JOURNAL_MAX_BACKOFF', 0.02)
+
+    class StopException(BaseException):
+        pass
+
+    calls = []
+    done = threading.Event()
+
+    def write(records):
+        calls.append(records)
+        if len(calls) == 1:
+            raise StopException()
+        done.set()
+
+    thread = visit_journal.start_journal_flusher(write, path=journal)
+    append_visit(_visit('0000001'), path=journal)
+    assert done.wait(5)
+    assert thread.is_alive()
+    assert visit_journal.flusher_status(path=journal)['running']
+
+
+def test_resent_journal_rows_are_not_appended_twice(monkeypatch):
+    import pandas as pd
+    import utils.gsheet_handler as gsheet_handler
+    from utils.local_sheets import LocalSheetsClient
+    from utils.synthetic_data import VISIT_COLUMNS
+
+    visits = pd.DataFrame([['0000009', '2024-01-01'] + [''] * (len(VISIT_COLUMNS) - 2)], columns=VISIT_COLUMNS)
+    client = LocalSheetsClient({'visits': visits})
+    monkeypatch.setattr(gsheet_handler, 'publish_change', lambda *args, **kwargs: None)
+    gsheet_handler.use_sheets_client(client)
+    try:
+        row = {'hn': '0000001', 'date': '2024-01-01', 'pefr': 300, 'control_level': '', 'controller': '',
+               'reliever': '', 'adherence': '', 'drp': '', 'advice': '', 'technique_check': '',
+               'next_appt': '', 'note': '', 'is_new_case': 'FALSE', 'journal_id': 7}
+        gsheet_handler._flush_journal_visits('default', [row])
+        # lease หมดระหว่างส่ง -> Worker อื่นส่งแถวเดิมซ้ำ + Visit ใหม่
+        gsheet_handler._flush_journal_visits('default', [row, {**row, 'journal_id': 8}])
+        values = client.open_by_key(None).worksheet('visits').get_all_values()
+    finally:
+        gsheet_handler.use_sheets_client(None)
+
+    assert [r[14] for r in values[1:]] == ['', '7', '8']
+
+
+def test_schema_is_set_up_once_per_path(journal, monkeypatch):
+    append_visit(_visit('0000001'), path=journal)
+    # เปิดไฟล์เดิมอีก -> ไม่รัน Schema / Migration ซ้ำ
+    monkeypatch.setattr(visit_journal, '_SCHEMA', "THIS IS NOT SQL")
+    append_visit(_visit('0000002'), path=journal)
+    assert pending_count(path=journal) == 2
+
+
+def test_poisoned_row_does_not_block_later_rows_and_is_parked(journal):
+    for hn in ('bad', '0000001', '0000002'):
+        append_visit(_visit(hn), path=journal)
+    sent = []
+
+    def write(records):
+        if any(r['hn'] == 'bad' for r in records):
+            raise ValueError("invalid row")
+        sent.extend(records)
+
+    with pytest.raises(ValueError):
+        flush_pending(write, path=journal)
+    assert [r['hn'] for r in sent] == ['0000001', '0000002']
+
+    for _ in range(visit_journal.JOURNAL_MAX_ATTEMPTS):
+        try:
+            flush_pending(write, path=journal)
+        except ValueError:
+            pass
+    assert pending_count(path=journal) == 0 and parked_count(path=journal) == 1
+    parked = pending_visits(path=journal)
+    assert parked['hn'].tolist() == ['bad'] and parked['parked_at'].notna().all()
+    # แถวที่พักไว้ไม่ขวาง Visit ใหม่
+    append_visit(_visit('0000003'), path=journal)
+    assert flush_pending(write, path=journal) == 1
+
+    assert requeue_parked(path=journal) == 1
+    assert pending_count(path=journal) == 1 and parked_count(path=journal) == 0
+
+
+def test_outage_does_not_park_rows(journal):
+    for hn in ('0000001', '0000002', '0000003', '0000004'):
+        append_visit(_visit(hn), path=journal)
+    calls = []
+
+    def down(records):
+        calls.append(len(records))
+        raise ConnectionError("sheets down")
+
+    for _ in range(visit_journal.JOURNAL_MAX_ATTEMPTS + 2):
+        with pytest.raises(ConnectionError):
+            flush_pending(down, path=journal)
+    assert parked_count(path=journal) == 0 and pending_count(path=journal) == 4
+    # ต่อรอบ: 1 Batch + ลองทีละแถวไม่เกิน JOURNAL_PROBE_ROWS
+    assert len(calls) == (visit_journal.JOURNAL_MAX_ATTEMPTS + 2) * (1 + visit_journal.JOURNAL_PROBE_ROWS)
+
+
+def test_merge_pending_visits_into_history():
+    import pandas as pd
+
+    visits = pd.DataFrame({
+        'hn': ['0000001', '0000001'], 'date': pd.to_datetime(['2024-01-01', '2024-03-01']),
+        'pefr': [300, 320], 'journal_id': ['', 5],
+    })
+    pending = pd.DataFrame([
+        {'hn': '0000001', 'date': '2024-02-01', 'pefr': 310, 'journal_id': 6, 'attempts': 1, 'last_error': 'x', 'parked_at': None},
+        {'hn': '0000001', 'date': '2024-03-01', 'pefr': 320, 'journal_id': 5, 'attempts': 0, 'last_error': None, 'parked_at': None},
+    ])
+    merged = merge_pending_visits(visits, pending)
+    assert merged['pefr'].tolist() == [300, 310, 320]
+    assert list(merged.columns) == list(visits.columns)
+    assert merge_pending_visits(visits.iloc[0:0], pending.iloc[:1])['pefr'].tolist() == [310]
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from utils.write_queue import GroupCommitQueue, resolve_row_positions
+
+
+def _key(item):
+    return (item['hn'], item['date'])
+
+
+def test_resolve_row_positions():
+    sheet_keys = [('1', 'a'), ('2', 'b'), ('3', 'c')]
+    updates = [
+        {'row': 2, 'hn': '1', 'date': 'a'},   # ตำแหน่งถูกต้อง
+        {'row': 2, 'hn': '3', 'date': 'c'},   # แถวเลื่อน -> ย้ายไปแถว 4
+        {'row': 9, 'hn': '4', 'date': 'd'},   # หาไม่เจอ
+    ]
+    resolved, stale, relocated = resolve_row_positions(updates, sheet_keys, _key)
+    assert [u['row'] for u in resolved] == [2, 4]
+    assert stale == [updates[2]]
+    assert relocated == 1
+
+
+def test_concurrent_submits_are_grouped():
+    written = []
+    queue = GroupCommitQueue(written.append, window=0.2)
+    start = threading.Barrier(5)
+
+    def submit(i):
+        start.wait()
+        queue.submit([i, i])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(row for batch in written for row in batch) == sorted(list(range(5)) * 2)
+    assert len(written) < 5
+    assert queue.stats['rows_written'] == 10
+
+
+def test_base_exception_is_raised_to_submitter():
+    class StopException(BaseException):
+        pass
+
+    def fail(rows):
+        raise StopException()
+
+    queue = GroupCommitQueue(fail, window=0)
+    with pytest.raises(StopException):
+        queue.submit([1])
+    assert queue.depth() == 0
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.hosxp_import import stream_hosxp_file, diff_import, applied_import_rows, file_content_hash, IMPORT_CHUNK_SIZE
+from utils.import_ledger import find_imported_file, filter_known_rows, record_import
+from utils.clinics import DEFAULT_CLINIC_ID, get_clinic, misconfigured_clinics, use_clinic
+
+# ==========================================
+# 🗂️ BATCH IMPORT (ไม่ต้องเปิดหน้าเว็บ)
+# นำเข้าไฟล์ HOSxP ทีละหลายไฟล์ / ทั้งโฟลเดอร์ สำหรับตั้งเวลานำเข้าทุกคืน
+#   python -m utils.batch_import exports/ --dry-run
+# ==========================================
+
+HOSXP_FILE_EXTENSIONS = ('.csv', '.xls', '.xlsx')
+
+def collect_import_files(paths):
+    """
+    รวมรายชื่อไฟล์จาก path ที่ระบุ (ไฟล์เดี่ยว หรือโฟลเดอร์) เรียงตามชื่อ
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and name.lower().endswith(HOSXP_FILE_EXTENSIONS):
+                    files.append(full)
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(path)
+    # ไม่นำเข้าไฟล์เดียวกันซ้ำ (ถ้าระบุทั้งไฟล์และโฟลเดอร์)
+    return list(dict.fromkeys(os.path.abspath(f) for f in files))
+
+# 1. อ่านไฟล์ 1 ไฟล์ (ทำงานใน Worker Process)
+def _parse_file(path, patients_lookup, chunksize):
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            file_hash = file_content_hash(f)
+            result = stream_hosxp_file(f, os.path.basename(path), patients_lookup, chunksize=chunksize)
+        error = None
+    except Exception as e:
+        file_hash, result, error = None, None, str(e)
+    return {
+        'path': path,
+        'file_hash': file_hash,
+        'result': result,
+        'error': error,
+        'parse_seconds': time.perf_counter() - started,
+    }
+
+def parse_files(paths, patients_db, max_workers=None, chunksize=IMPORT_CHUNK_SIZE):
+    """
+    อ่านหลายไฟล์แบบขนาน (หลาย CPU Core) -> คืนค่าผลการอ่านตามลำดับไฟล์เดิม
+    """
+    # ส่งเฉพาะคอลัมน์ที่ใช้จับคู่ข้าม Process (ไม่ต้อง Pickle ทะเบียนทั้งตาราง)
+    patients_lookup = patients_db[['hn', 'first_name', 'last_name']].copy()
+
+    if len(paths) <= 1 or max_workers == 1:
+        return [_parse_file(p, patients_lookup, chunksize) for p in paths]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_parse_file, p, patients_lookup, chunksize) for p in paths]
+        return [future.result() for future in futures]
+
+# 2. รวมทุกไฟล์ -> Diff ครั้งเดียว -> เขียนเป็น Batch
+def run_batch_import(paths, patients_db, visits_db, dry_run=False, use_ledger=True,
+                     max_workers=None, chunksize=IMPORT_CHUNK_SIZE, user="CLI"):
+    timings = {}
+    started = time.perf_counter()
+    parsed = parse_files(paths, patients_db, max_workers=max_workers, chunksize=chunksize)
+    timings['parse'] = time.perf_counter() - started
+
+    files = []
+    fresh_parts = []
+    seen_hashes = set()
+    for item in parsed:
+        info = {
+            'file': item['path'],
+            'status': 'ok',
+            'total_rows': 0,
+            'matched': 0,
+            'date_errors': 0,
+            'skipped_known': 0,
+            'new': 0,
+            'update': 0,
+            'parse_seconds': round(item['parse_seconds'], 3),
+        }
+        files.append(info)
+        result = item['result']
+
+        if item['error']:
+            info['status'] = f"error: {item['error']}"
+            continue
+        if result['missing_cols']:
+            info['status'] = f"missing columns: {', '.join(result['missing_cols'])}"
+            continue
+        if item['file_hash'] in seen_hashes:
+            info['status'] = 'duplicate file'
+            continue
+        seen_hashes.add(item['file_hash'])
+
+        if use_ledger:
+            previous = find_imported_file(item['file_hash'])
+            if previous:
+                info['status'] = f"already imported {previous['imported_at']}"
+                continue
+
+        info['total_rows'] = result['total_rows']
+        info['matched'] = len(result['matched'])
+        info['date_errors'] = len(result['date_errors'])
+
+        if use_ledger:
+            fresh, info['skipped_known'] = filter_known_rows(result['matched'])
+        else:
+            fresh = result['matched']
+        item['fresh'] = fresh
+        item['info'] = info
+        item['file_idx'] = len(files) - 1
+        # ลำดับไฟล์ = ลำดับความสำคัญ (แถวซ้ำข้ามไฟล์ ใช้ไฟล์หลังสุด)
+        fresh_parts.append(fresh.assign(_file=len(files) - 1))
+
+    started = time.perf_counter()
+    if fresh_parts:
+        combined = pd.concat(fresh_parts, ignore_index=True)
+        diff = diff_import(combined.drop(columns='_file'), visits_db)
+        report = diff['report'].assign(_file=combined['_file'].to_numpy())
+        per_file = report.groupby(['_file', 'action']).size()
+        for (file_idx, action), n in per_file.items():
+            if action in ('new', 'update'):
+                files[file_idx][action] = int(n)
+    else:
+        diff = {'new_visits': [], 'appointment_updates': [], 'counts': {}}
+        report = None
+    timings['diff'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    stale_updates = []
+    if not dry_run:
+        # import ตอนเขียนจริงเท่านั้น (Dry-run ไม่ต้องเชื่อมต่อ Google Sheets)
+        from utils.gsheet_handler import save_multiple_visits, update_appointments_batch
+
+        new_visits = diff['new_visits']
+        for i in range(0, len(new_visits), chunksize):
+            save_multiple_visits(new_visits[i:i + chunksize])
+        if diff['appointment_updates']:
+            update_result = update_appointments_batch(diff['appointment_updates'])
+            stale_updates = update_result['stale']
+
+        for item in parsed:
+            if 'fresh' in item:
+                info = item['info']
+                # เฉพาะแถวของไฟล์นี้ที่มีผลใน Sheet แล้ว (update ที่ถูกข้ามไม่บันทึก -> นำเข้าใหม่ได้)
+                file_report = report[report['_file'] == item['file_idx']]
+                applied = applied_import_rows(file_report, stale_updates)
+                info['update'] -= int((file_report['action'] == 'update').sum()) - int((applied['action'] == 'update').sum())
+                record_import(item['file_hash'], os.path.basename(item['path']), applied, counts={
+                    'total_rows': info['total_rows'], 'new': info['new'],
+                    'update': info['update'], 'skipped_known': info['skipped_known'],
+                }, user=user)
+    timings['write'] = time.perf_counter() - started
+
+    return {
+        'dry_run': dry_run,
+        'files': files,
+        'new': len(diff['new_visits']),
+        'update': len(diff['appointment_updates']) - len(stale_updates),
+        'stale_updates': len(stale_updates),
+        'counts': {k: int(v) for k, v in diff['counts'].items()},
+        'timings': {k: round(v, 3) for k, v in timings.items()},
+    }
+
+def _print_summary(summary):
+    mode = "DRY-RUN (ไม่บันทึกข้อมูล)" if summary['dry_run'] else "IMPORT"
+    print(f"=== HOSxP Batch {mode} ===")
+    for info in summary['files']:
+        print(f"- {os.path.basename(info['file'])}: {info['status']} | แถว {info['total_rows']:,} "
+              f"| ตรงกับผู้ป่วย {info['matched']:,} | เคยนำเข้า {info['skipped_known']:,} "
+              f"| ใหม่ {info['new']:,} | อัปเดต {info['update']:,} | วันที่ผิด {info['date_errors']:,} "
+              f"({info['parse_seconds']}s)")
+    print(f"สรุป: เพิ่มใหม่ {summary['new']:,} | อัปเดตวันนัด {summary['update']:,}")
+    print("เวลา: " + ", ".join(f"{k} {v}s" for k, v in summary['timings'].items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="นำเข้าไฟล์นัดหมายจาก HOSxP แบบไม่ต้องเปิดหน้าเว็บ")
+    parser.add_argument("paths", nargs="+", help="ไฟล์ .csv/.xls/.xlsx หรือโฟลเดอร์")
+    parser.add_argument("--dry-run", action="store_true", help="แสดงผลอย่างเดียว ไม่บันทึกข้อมูล")
+    parser.add_argument("--workers", type=int, default=None, help="จำนวน Process ที่ใช้อ่านไฟล์")
+    parser.add_argument("--chunksize", type=int, default=IMPORT_CHUNK_SIZE, help="จำนวนแถวต่อ Chunk / ต่อการเขียน")
+    parser.add_argument("--no-ledger", action="store_true", help="ไม่ข้ามไฟล์/แถวที่เคยนำเข้าแล้ว")
+    parser.add_argument("--user", default="CLI", help="ชื่อผู้นำเข้า (บันทึกใน Ledger)")
+    parser.add_argument("--clinic", default=DEFAULT_CLINIC_ID, help="คลินิกที่จะนำเข้า (ตาม [clinics] ใน secrets.toml)")
+    parser.add_argument("--json", action="store_true", help="พิมพ์ผลลัพธ์เป็น JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        paths = collect_import_files(args.paths)
+    except FileNotFoundError as e:
+        print(f"❌ ไม่พบไฟล์: {e}", file=sys.stderr)
+        return 2
+    if not paths:
+        print("⚠️ ไม่พบไฟล์ HOSxP ที่จะนำเข้า", file=sys.stderr)
+        return 1
+
+    if get_clinic(args.clinic) is None:
+        print(f"❌ ไม่พบคลินิก: {args.clinic}", file=sys.stderr)
+        return 2
+    if args.clinic in misconfigured_clinics():
+        print(f"❌ คลินิก {args.clinic} ยังไม่ได้ตั้งค่า sheet_id", file=sys.stderr)
+        return 2
+
+    from utils.gsheet_handler import fetch_table
+    # Sheet / Ledger / Journal ทั้งหมดของคลินิกที่เลือก
+    with use_clinic(args.clinic):
+        try:
+            patients_db = fetch_table("patients")
+            visits_db = fetch_table("visits")
+        except Exception as e:
+            print(f"❌ โหลดข้อมูลจาก Google Sheets ไม่สำเร็จ: {type(e).__name__}: {e}", file=sys.stderr)
+            return 2
+
+        summary = run_batch_import(
+            paths, patients_db, visits_db, dry_run=args.dry_run, use_ledger=not args.no_ledger,
+            max_workers=args.workers, chunksize=args.chunksize, user=args.user,
+        )
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        _print_summary(summary)
+
+    failed = [f for f in summary['files'] if f['status'].startswith(('error', 'missing'))]
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
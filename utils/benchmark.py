@@ -0,0 +1,356 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.synthetic_data import SCALES, make_clinic
+from utils.clinics import DEFAULT_CLINIC_ID
+
+# ==========================================
+# 🏁 BENCHMARK
+# จับเวลาส่วนที่ช้าของแอปด้วยข้อมูลจำลอง + Google Sheets จำลองในเครื่อง (ไม่ต่อเน็ต)
+# ผลลัพธ์เป็น JSON (มี commit) -> เทียบกับผลครั้งก่อนได้
+#   python -m utils.benchmark --scale 10k
+#   python -m utils.benchmark --scale 10k --compare data/benchmarks/<ไฟล์ก่อนหน้า>.json
+# ==========================================
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(PROJECT_ROOT, "data", "benchmarks")
+BENCH_REPEAT = 5
+BENCH_MAX_SECONDS = 10      # หยุดทำซ้ำเมื่อเคสนั้นใช้เวลารวมเกินนี้ (อย่างน้อย 1 รอบ)
+REGRESSION_THRESHOLD = 0.2  # ช้าลงเกิน 20% = Regression
+LOOKUP_SAMPLE = 200         # จำนวนผู้ป่วยที่สุ่มค้นหาต่อรอบ
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """
+    ลงทะเบียนเคส: fn(ctx) -> ถ้าคืนค่า callable = setup (ไม่จับเวลา) แล้วจับเวลาเฉพาะ callable นั้น
+    """
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+# --- 1. LOADERS (อ่าน Sheet -> DataFrame ผ่าน Sheets จำลอง) ---
+@benchmark("load.staff_patients")
+def _bench_load_staff_patients(ctx):
+    from utils.gsheet_handler import _fetch_records
+    return lambda: _fetch_records(DEFAULT_CLINIC_ID, "patients")
+
+@benchmark("load.staff_visits")
+def _bench_load_staff_visits(ctx):
+    from utils.gsheet_handler import _fetch_records
+    return lambda: _fetch_records(DEFAULT_CLINIC_ID, "visits")
+
+@benchmark("load.public_visits")
+def _bench_load_public_visits(ctx):
+    from utils.gsheet_handler import _fetch_values
+    return lambda: _fetch_values(DEFAULT_CLINIC_ID, "visits")
+
+@benchmark("load.visit_columns")
+def _bench_load_visit_columns(ctx):
+    from utils.gsheet_handler import _fetch_columns
+    return lambda: _fetch_columns(DEFAULT_CLINIC_ID, "visits", ("hn", "date", "next_appt"))
+
+@benchmark("load.cached_visits")
+def _bench_load_cached_visits(ctx):
+    # อ่านซ้ำจาก Cache (ต้นทุนคือการ Copy DataFrame ให้ผู้ใช้แต่ละคน)
+    from utils.gsheet_handler import load_data_staff
+    load_data_staff("visits")
+    return lambda: load_data_staff("visits")
+
+# --- 2. DASHBOARD ---
+@benchmark("dashboard.render")
+def _bench_dashboard_render(ctx):
+    from views.staff_dashboard import render_dashboard
+    return lambda: render_dashboard(ctx['visits_staff'], ctx['patients_staff'])
+
+@benchmark("dashboard.technique_status")
+def _bench_dashboard_technique(ctx):
+    from utils.calculations import compute_technique_status_table
+    all_hns = ctx['patients_staff']['hn']
+    return lambda: compute_technique_status_table(ctx['visits_staff'], all_hns=all_hns)
+
+# --- 3. IMPORT ---
+@benchmark("import.parse")
+def _bench_import_parse(ctx):
+    from utils.hosxp_import import stream_hosxp_file
+    return lambda: stream_hosxp_file(io.BytesIO(ctx['hosxp_bytes']), "hosxp_export.csv", ctx['patients_staff'])
+
+@benchmark("import.diff")
+def _bench_import_diff(ctx):
+    from utils.hosxp_import import stream_hosxp_file, diff_import
+    matched = stream_hosxp_file(io.BytesIO(ctx['hosxp_bytes']), "hosxp_export.csv", ctx['patients_staff'])['matched']
+    return lambda: diff_import(matched, ctx['visits_staff'])
+
+# --- 4. PATIENT LOOKUP ---
+@benchmark("lookup.summary_index_build")
+def _bench_summary_index_build(ctx):
+    from utils.patient_index import PatientSummaryIndex
+    return lambda: PatientSummaryIndex().sync(ctx['patients_staff'], ctx['visits_staff'])
+
+@benchmark("lookup.patient_summary")
+def _bench_patient_summary(ctx):
+    from utils.patient_index import PatientSummaryIndex
+    index = PatientSummaryIndex().sync(ctx['patients_staff'], ctx['visits_staff'])
+    hns = ctx['sample_hns']
+
+    def run():
+        for hn in hns:
+            index.get(hn)
+            index.patient_visits(hn, ctx['visits_staff'])
+    return run
+
+@benchmark("lookup.public_token")
+def _bench_public_token(ctx):
+    # หน้า QR ของผู้ป่วย: หา HN จาก Token (เหมือนใน app.py)
+    patients = ctx['patients_public']
+    tokens = ctx['sample_tokens']
+
+    def run():
+        for token in tokens:
+            match = patients[patients['public_token'] == token]
+            if not match.empty:
+                match.iloc[0]['hn']
+    return run
+
+@benchmark("search.build")
+def _bench_search_build(ctx):
+    from utils.patient_search import PatientSearchIndex
+    return lambda: PatientSearchIndex().sync(ctx['patients_staff'])
+
+@benchmark("search.query")
+def _bench_search_query(ctx):
+    from utils.patient_search import PatientSearchIndex
+    index = PatientSearchIndex().sync(ctx['patients_staff'])
+    patients = ctx['patients_staff']
+    queries = (
+        [hn[:4] for hn in ctx['sample_hns'][:20]]
+        + patients['first_name'].head(20).str[:2].tolist()
+        + patients['last_name'].head(10).tolist()
+        + ["สมชัย", "ศรีสก", "แกวมณี", "ประเสริฐ", "9999"]
+    )
+    return lambda: [index.search(q) for q in queries]
+
+# --- 5. CALCULATIONS ---
+@benchmark("calc.predicted_pefr")
+def _bench_predicted_pefr(ctx):
+    from utils.calculations import calculate_predicted_pefr
+    rows = list(zip(ctx['ages'], ctx['patients_staff']['height'], ctx['patients_staff']['prefix']))
+    return lambda: [calculate_predicted_pefr(a, h, p) for a, h, p in rows]
+
+@benchmark("calc.action_plan_zone")
+def _bench_action_plan_zone(ctx):
+    from utils.calculations import get_action_plan_zone
+    pefr = ctx['visits_staff']['pefr'].head(100_000).tolist()
+    return lambda: [get_action_plan_zone(v, 450) for v in pefr]
+
+@benchmark("calc.chart_data")
+def _bench_chart_data(ctx):
+    from utils.calculations import prepare_pefr_chart_data
+    from utils.patient_index import PatientSummaryIndex
+    index = PatientSummaryIndex().sync(ctx['patients_staff'], ctx['visits_staff'])
+    per_patient = [index.patient_visits(hn, ctx['visits_staff']) for hn in ctx['sample_hns']]
+    return lambda: [prepare_pefr_chart_data(v) for v in per_patient]
+
+# ==========================================
+# RUNNER
+# ==========================================
+
+def _git_info():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except Exception:
+            return ""
+    return {'commit': git("rev-parse", "--short", "HEAD") or None, 'dirty': bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def prepare_context(scale, seed=0, latency=0.0, today=None):
+    """
+    สร้างคลินิกจำลอง + ต่อ gsheet_handler เข้ากับ Sheets จำลอง -> ctx ที่ทุกเคสใช้ร่วมกัน
+    """
+    from utils.local_sheets import LocalSheetsClient
+    from utils.gsheet_handler import use_sheets_client, _fetch_records, _fetch_values
+
+    n_patients = SCALES[scale] if isinstance(scale, str) else int(scale)
+    clinic = make_clinic(n_patients, seed=seed, today=today)
+    client = LocalSheetsClient({'patients': clinic['patients'], 'visits': clinic['visits']})
+    use_sheets_client(client)
+
+    # DataFrame แบบเดียวกับที่แอปได้จาก loader จริง
+    patients_staff = _fetch_records(DEFAULT_CLINIC_ID, "patients")
+    visits_staff = _fetch_records(DEFAULT_CLINIC_ID, "visits")
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(patients_staff), min(LOOKUP_SAMPLE, len(patients_staff)), replace=False)
+    client.latency = latency
+
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    return {
+        'client': client,
+        'patients_staff': patients_staff,
+        'visits_staff': visits_staff,
+        'patients_public': _fetch_values(DEFAULT_CLINIC_ID, "patients"),
+        'hosxp_bytes': clinic['hosxp'].to_csv(index=False).encode('utf-8-sig'),
+        'sample_hns': patients_staff['hn'].iloc[sample].tolist(),
+        'sample_tokens': patients_staff['public_token'].iloc[sample].tolist(),
+        'ages': ((today - pd.to_datetime(patients_staff['dob'])).dt.days // 365).tolist(),
+        'sizes': {'patients': len(patients_staff), 'visits': len(visits_staff), 'hosxp_rows': len(clinic['hosxp'])},
+    }
+
+def _quiet_streamlit():
+    # ปิดคำเตือนของ Streamlit ตอนเรียก View นอก streamlit run (Logger ถูกสร้างตอน import จึงต้องเรียกหลัง setup)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+def _time_case(run, repeat, max_seconds):
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat:
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > max_seconds:
+            break
+    return {
+        'median_ms': round(float(np.median(times)) * 1000, 3),
+        'min_ms': round(min(times) * 1000, 3),
+        'max_ms': round(max(times) * 1000, 3),
+        'runs': len(times),
+    }
+
+def run_benchmarks(scale='1k', names=None, repeat=BENCH_REPEAT, max_seconds=BENCH_MAX_SECONDS,
+                   seed=0, latency=0.0, today=None, progress=None):
+    """
+    รันเคสที่เลือก (None = ทุกเคส, ระบุเป็นชื่อเต็มหรือกลุ่ม เช่น "load", "search.query")
+    """
+    selected = [n for n in BENCHMARKS if not names or any(n == s or n.startswith(s + ".") for s in names)]
+
+    started = time.perf_counter()
+    ctx = prepare_context(scale, seed=seed, latency=latency, today=today)
+    setup_seconds = time.perf_counter() - started
+
+    results = {}
+    for name in selected:
+        if progress:
+            progress(name)
+        try:
+            run = BENCHMARKS[name](ctx)
+            _quiet_streamlit()
+            results[name] = _time_case(run, repeat, max_seconds)
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+
+    return {
+        'meta': {
+            **_git_info(),
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'scale': scale,
+            'seed': seed,
+            'latency_s': latency,
+            'sizes': ctx['sizes'],
+            'setup_seconds': round(setup_seconds, 2),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPU)",
+        },
+        'results': results,
+    }
+
+def compare_reports(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    เทียบ median ของแต่ละเคส -> DataFrame: baseline_ms, current_ms, change (สัดส่วน), status
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name, {})
+        if 'median_ms' not in result or 'median_ms' not in base:
+            rows.append({'case': name, 'baseline_ms': base.get('median_ms'), 'current_ms': result.get('median_ms'),
+                         'change': None, 'status': 'n/a'})
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        status = 'slower' if change > threshold else 'faster' if change < -threshold else 'same'
+        rows.append({'case': name, 'baseline_ms': base['median_ms'], 'current_ms': result['median_ms'],
+                     'change': round(change, 3), 'status': status})
+    return pd.DataFrame(rows, columns=['case', 'baseline_ms', 'current_ms', 'change', 'status'])
+
+def _print_report(report):
+    meta = report['meta']
+    print(f"=== Benchmark {meta['scale']} @ {meta['commit']}{' (dirty)' if meta['dirty'] else ''} "
+          f"| ผู้ป่วย {meta['sizes']['patients']:,} | Visit {meta['sizes']['visits']:,} ===")
+    for name, result in report['results'].items():
+        if 'error' in result:
+            print(f"  {name:<28} ERROR {result['error']}")
+        else:
+            print(f"  {name:<28} {result['median_ms']:>10.1f} ms  (min {result['min_ms']:.1f}, {result['runs']} รอบ)")
+
+def _print_comparison(table, baseline):
+    print(f"=== เทียบกับ {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}) ===")
+    for row in table.itertuples():
+        if row.change is None:
+            print(f"  {row.case:<28} {'-':>10}")
+            continue
+        mark = "🔴" if row.status == 'slower' else "🟢" if row.status == 'faster' else "⚪"
+        print(f"  {mark} {row.case:<26} {row.baseline_ms:>10.1f} -> {row.current_ms:>10.1f} ms ({row.change:+.0%})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ส่วนที่ช้าของแอปด้วยข้อมูลจำลอง")
+    parser.add_argument("cases", nargs="*", help="ชื่อเคสหรือกลุ่ม (เช่น load, import.diff) ค่าเริ่มต้น = ทุกเคส")
+    parser.add_argument("--scale", choices=list(SCALES), default='1k')
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="จำนวนรอบสูงสุดต่อเคส")
+    parser.add_argument("--max-seconds", type=float, default=BENCH_MAX_SECONDS, help="เวลาสูงสุดต่อเคส")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", default=None, help="วันที่อ้างอิงของข้อมูลจำลอง (YYYY-MM-DD) ให้ผลเทียบกันได้ข้ามวัน")
+    parser.add_argument("--latency", type=float, default=0.0, help="หน่วงเวลาต่อการเรียก Sheets จำลอง (วินาที)")
+    parser.add_argument("--output", default=None, help="ไฟล์ JSON ผลลัพธ์ (ค่าเริ่มต้น data/benchmarks/)")
+    parser.add_argument("--compare", default=None, help="ไฟล์ JSON ผลครั้งก่อนที่จะเทียบ")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="สัดส่วนที่ถือว่าช้าลง")
+    parser.add_argument("--fail-on-regression", action="store_true", help="จบด้วย exit 1 ถ้ามีเคสที่ช้าลง")
+    parser.add_argument("--list", action="store_true", help="แสดงรายชื่อเคส")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    unknown = [c for c in args.cases if not any(n == c or n.startswith(c + ".") for n in BENCHMARKS)]
+    if unknown:
+        print(f"❌ ไม่รู้จักเคส: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    report = run_benchmarks(args.scale, names=args.cases or None, repeat=args.repeat, max_seconds=args.max_seconds,
+                            seed=args.seed, latency=args.latency, today=args.today,
+                            progress=lambda name: print(f"... {name}", file=sys.stderr))
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}-{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    _print_report(report)
+    print(f"บันทึกผล: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('scale') != report['meta']['scale']:
+            print(f"⚠️ ขนาดข้อมูลไม่ตรงกัน ({baseline['meta'].get('scale')} vs {report['meta']['scale']})", file=sys.stderr)
+        table = compare_reports(report, baseline, threshold=args.threshold)
+        _print_comparison(table, baseline)
+        if args.fail_on_regression and (table['status'] == 'slower').any():
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
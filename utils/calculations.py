@@ -1,7 +1,4 @@
 import pandas as pd
-import altair as alt
-import qrcode
-import io
 
 # 1. คำนวณค่ามาตรฐาน (Predicted PEFR)
 def calculate_predicted_pefr(age, height, gender_prefix):
@@ -46,18 +43,66 @@ def get_action_plan_zone(current_pefr, predicted_pefr):
             🏥 <b>สำคัญ:</b> ต้องรีบกลับไปพบแพทย์ 'ก่อนวันนัด' หากมีอาการแย่ลง หรือพ่นยาฉุกเฉินแล้วอาการยังไม่ทุเลา"""
         )
 
-# 4. วาดกราฟแนวโน้ม (Trend Chart)
-def plot_pefr_chart(visits_df, predicted_pefr):
-    df = visits_df.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    
+# 3.1 ค่าขอบเขตโซนสำหรับบัตร (Digital Asthma Card)
+def get_card_zone_limits(ref_pefr):
+    if ref_pefr > 0:
+        green_lim = int(ref_pefr * 0.8)
+        yellow_lim = int(ref_pefr * 0.6)
+        return f"> {green_lim}", f"{yellow_lim} - {green_lim}", f"< {yellow_lim}"
+    return "-", "-", "-"
+
+# 4. เตรียมข้อมูลกราฟ (กรองค่า 0 + ลดจำนวนจุดแต่คงค่าสูงสุด/ต่ำสุด)
+CHART_MAX_POINTS = 200
+
+def prepare_pefr_chart_data(visits_df, max_points=CHART_MAX_POINTS, date_range=None):
+    df = pd.DataFrame({
+        'date': pd.to_datetime(visits_df['date'], errors='coerce'),
+        'pefr': pd.to_numeric(visits_df['pefr'], errors='coerce'),
+    })
+    # ตัดแถวที่ไม่ได้เป่าจริง (เช่น pefr == 0 จากการนำเข้า HOSxP)
+    df = df[(df['pefr'] > 0) & df['date'].notna()].sort_values('date')
+
+    if date_range is not None:
+        start, end = date_range
+        df = df[(df['date'] >= pd.Timestamp(start)) & (df['date'] < pd.Timestamp(end) + pd.Timedelta(days=1))]
+
+    if len(df) <= max_points:
+        return df.reset_index(drop=True)
+
+    # แบ่งช่วงเวลาเป็นถัง แล้วเก็บจุดต่ำสุด/สูงสุดของแต่ละถัง (min-max decimation)
+    n_buckets = max(1, max_points // 2)
+    bucket = pd.cut(df['date'].astype('int64'), bins=n_buckets, labels=False)
+    grouped = df['pefr'].groupby(bucket)
+    keep_idx = pd.Index(grouped.idxmin()).union(pd.Index(grouped.idxmax()))
+    # คงจุดแรกและจุดสุดท้ายเสมอ (เพื่อให้เส้นเริ่ม-จบตรงกับข้อมูลจริง)
+    keep_idx = keep_idx.union(pd.Index([df.index[0], df.index[-1]]))
+
+    return df.loc[keep_idx].sort_values('date').reset_index(drop=True)
+
+def pefr_date_bounds(visits_df):
+    # วันแรก/วันสุดท้ายของข้อมูลกราฟ (None = ไม่มีวันที่ที่อ่านได้เลย)
+    dates = pd.to_datetime(visits_df['date'], errors='coerce').dropna()
+    if dates.empty:
+        return None
+    return dates.min().date(), dates.max().date()
+
+# 4.1 วาดกราฟแนวโน้ม (Trend Chart)
+def plot_pefr_chart(visits_df, predicted_pefr, max_points=CHART_MAX_POINTS, date_range=None):
+    import altair as alt  # โหลดตอนวาดกราฟครั้งแรก (ไม่ให้ทุกหน้าต้องจ่ายเวลา import)
+
+    df = prepare_pefr_chart_data(visits_df, max_points=max_points, date_range=date_range)
+
+    # ขอบเขตแกน Y ตามข้อมูลจริง (ไม่ต่ำกว่าเส้นโซนเขียว)
+    y_max = max(float(df['pefr'].max()) if not df.empty else 0, predicted_pefr * 0.8)
+    y_max = int(max(100, y_max * 1.15))
+
     base = alt.Chart(df).encode(x=alt.X('date', title='วันที่'))
     
     line = base.mark_line(point=True).encode(
         y=alt.Y(
             'pefr', 
             title='ค่าการเป่าปอด (L/min)', 
-            scale=alt.Scale(domain=[0, 800])
+            scale=alt.Scale(domain=[0, y_max])
         ),
         tooltip=[
             alt.Tooltip('date', title='วันที่', format='%d/%m/%Y'),
@@ -73,42 +118,61 @@ def plot_pefr_chart(visits_df, predicted_pefr):
     return chart.configure(padding={'left': 70, 'top': 10, 'right': 10, 'bottom': 10})
 
 # 5. ตรวจสอบสถานะเทคนิคพ่นยา (แก้ไข Logic วันที่เหลือ)
+TECHNIQUE_VALID_DAYS = 365
+
+def _technique_status_frame(last_dates, now=None):
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    days_since = (now - last_dates).dt.days
+
+    never = last_dates.isna()
+    overdue = days_since > TECHNIQUE_VALID_DAYS
+
+    status = pd.Series("valid", index=last_dates.index)
+    status[overdue] = "overdue"
+    status[never] = "never"
+
+    # overdue -> จำนวนวันที่ "เลยมาแล้ว", valid -> จำนวนวันที่ "เหลืออยู่", never -> 0
+    days = (TECHNIQUE_VALID_DAYS - days_since).where(~overdue, days_since).where(~never, 0).astype(int)
+
+    return pd.DataFrame({
+        'last_tech_date': last_dates,
+        'days_since': days_since,
+        'days': days,
+        'status': status,
+        'due_date': last_dates + pd.Timedelta(days=TECHNIQUE_VALID_DAYS),
+    })
+
+def _last_technique_dates(visits_df):
+    if visits_df.empty or 'technique_check' not in visits_df.columns:
+        return pd.Series(dtype='datetime64[ns]'), pd.Series(dtype=object)
+    # หาครั้งที่ "ทำ" (ไม่แก้ไข DataFrame ต้นฉบับ)
+    done = visits_df['technique_check'].astype(str).str.contains("ทำ", na=False)
+    dates = pd.to_datetime(visits_df.loc[done, 'date'], errors='coerce')
+    return dates, visits_df.loc[done, 'hn']
+
+# 5.1 สถานะเทคนิคพ่นยาของผู้ป่วยทุกคนในครั้งเดียว (index = hn)
+def compute_technique_status_table(visits_df, all_hns=None, now=None):
+    dates, hns = _last_technique_dates(visits_df)
+    last_dates = dates.groupby(hns).max() if not dates.empty else pd.Series(dtype='datetime64[ns]')
+
+    if all_hns is not None:
+        # รวมผู้ป่วยที่ไม่เคยมี Visit สอนพ่นยาเลย (status = never)
+        last_dates = last_dates.reindex(pd.Index(pd.unique(pd.Series(all_hns)), name='hn'))
+    last_dates.index.name = 'hn'
+
+    return _technique_status_frame(last_dates, now=now)
+
+# 5.2 สถานะของผู้ป่วยรายเดียว (คืนค่า: status, days, last_date)
 def check_technique_status(visits_df):
-    if visits_df.empty:
+    dates, _ = _last_technique_dates(visits_df)
+    dates = dates.dropna()
+    if dates.empty:
         return "never", 0, None
 
-    visits_df['date'] = pd.to_datetime(visits_df['date'])
-    # หาครั้งที่ "ทำ" ล่าสุด
-    tech_visits = visits_df[visits_df['technique_check'].astype(str).str.contains("ทำ", na=False)].sort_values(by='date')
-    
-    if tech_visits.empty:
-        return "never", 0, None
-        
-    last_tech_date = tech_visits.iloc[-1]['date']
-    days_since = (pd.Timestamp.now() - last_tech_date).days
-    
-    if days_since > 365:
-        # ถ้าเกิน 1 ปี -> status = overdue, ส่งค่าวันที่ "เลยมาแล้ว" (days_since)
-        return "overdue", days_since, last_tech_date
-    else:
-        # ถ้ายังไม่เกิน -> status = valid, ส่งค่าวันที่ "เหลืออยู่" (365 - days_since)
-        days_remaining = 365 - days_since
-        return "valid", days_remaining, last_tech_date
+    row = _technique_status_frame(pd.Series([dates.max()])).iloc[0]
+    return row['status'], int(row['days']), row['last_tech_date']
 
-# 6. สร้าง QR Code
+# 6. สร้าง QR Code (ใช้ Cache จาก qr_service)
 def generate_qr(data):
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    return img_byte_arr.getvalue()
-
+    from utils.qr_service import get_qr_png
+    return get_qr_png(data, box_size=10, border=4, error_correction="L")
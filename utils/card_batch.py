@@ -0,0 +1,204 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.calculations import calculate_predicted_pefr, get_card_zone_limits
+from utils.qr_service import get_qr_png
+from utils.clinics import patient_link
+
+# --- CONFIGURATION ---
+CARD_SIZE = (1011, 638)          # ขนาดบัตร CR80 ที่ 300 dpi
+PAGE_SIZE = (2480, 3508)         # กระดาษ A4 ที่ 300 dpi
+CARDS_PER_ROW = 2
+CARDS_PER_COL = 5
+PAGE_MARGIN = 120
+CARD_GAP = 40
+
+# ฟอนต์ที่รองรับภาษาไทย (ใช้ตัวแรกที่หาเจอ) -> Kanit ใน Repo ก่อน (python -m utils.fetch_fonts)
+# แล้วจึงเป็นฟอนต์ไทยของเครื่อง (ห้ามใส่ฟอนต์ที่ไม่มีตัวอักษรไทย เช่น DejaVuSans -> ชื่อผู้ป่วยเป็นกล่องสี่เหลี่ยม)
+CARD_FONT_CANDIDATES = [
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "fonts", "Kanit-Regular.ttf"),
+    "/usr/share/fonts/truetype/tlwg/Garuda.ttf",
+    "/usr/share/fonts/opentype/tlwg/Garuda.otf",
+    "/usr/share/fonts/truetype/tlwg/Loma.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansThai-Regular.ttf",
+    "C:/Windows/Fonts/LeelawUI.ttf",
+    "C:/Windows/Fonts/tahoma.ttf",
+    "/System/Library/Fonts/Thonburi.ttc",
+]
+
+ZONE_STYLES = [
+    ("NORMAL", "#DCFCE7", "#86EFAC", "#166534"),
+    ("CAUTION", "#FEF9C3", "#FDE047", "#854D0E"),
+    ("DANGER", "#FEE2E2", "#FCA5A5", "#991B1B"),
+]
+
+def card_font_path():
+    # ฟอนต์ไทยที่ใช้วาดบัตร (None = ไม่พบเลย)
+    for path in CARD_FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+def _load_font(size):
+    path = card_font_path()
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+# 1. เลือกผู้ป่วยตามเงื่อนไข (สถานะ + ช่วงวันนัด)
+def select_card_patients(patients_df, visits_df, statuses=None, appt_from=None, appt_to=None):
+    if patients_df.empty:
+        return patients_df
+
+    df = patients_df.copy()
+    if 'status' in df.columns:
+        df['status'] = df['status'].replace('', 'Active').fillna('Active')
+    else:
+        df['status'] = 'Active'
+
+    if statuses:
+        df = df[df['status'].isin(statuses)]
+
+    if appt_from is not None or appt_to is not None:
+        if visits_df.empty:
+            return df.iloc[0:0]
+
+        # วันนัดถัดไปจาก Visit ล่าสุดของแต่ละคน
+        v = visits_df[['hn', 'date', 'next_appt']].copy()
+        v['date'] = pd.to_datetime(v['date'], errors='coerce')
+        v['next_appt'] = pd.to_datetime(v['next_appt'], errors='coerce')
+        latest = v.sort_values('date').groupby('hn').tail(1)
+
+        mask = latest['next_appt'].notna()
+        if appt_from is not None:
+            mask &= latest['next_appt'] >= pd.Timestamp(appt_from)
+        if appt_to is not None:
+            mask &= latest['next_appt'] <= pd.Timestamp(appt_to)
+        df = df[df['hn'].isin(latest.loc[mask, 'hn'])]
+
+    return df.sort_values('hn')
+
+# 2. เตรียมข้อมูลบัตร (dict ธรรมดา เพื่อส่งข้าม Process ได้)
+def build_card_jobs(selected_df, base_url):
+    jobs = []
+    skipped = []
+    now = datetime.now()
+
+    for pt in selected_df.to_dict('records'):
+        token = str(pt.get('public_token', '') or '').strip()
+        if token == '' or token.lower() == 'nan':
+            skipped.append(pt['hn'])
+            continue
+
+        try:
+            age = (now - pd.to_datetime(pt['dob'])).days // 365
+            predicted_pefr = calculate_predicted_pefr(age, pt.get('height', 0) or 0, pt['prefix'])
+        except Exception:
+            predicted_pefr = 0
+
+        ref_pefr = int(predicted_pefr)
+        if ref_pefr == 0:
+            ref_pefr = int(pd.to_numeric(pt.get('best_pefr', 0), errors='coerce') or 0)
+
+        jobs.append({
+            "hn": pt['hn'],
+            "name": f"{pt['prefix']}{pt['first_name']} {pt['last_name']}",
+            "ref_pefr": ref_pefr,
+            "zones": get_card_zone_limits(ref_pefr),
+            "link": patient_link(base_url, token),
+        })
+    return jobs, skipped
+
+# 3. วาดบัตร 1 ใบ (ทำงานใน Worker Process)
+def render_card_image(job):
+    w, h = CARD_SIZE
+    img = Image.new("RGB", CARD_SIZE, "white")
+    draw = ImageDraw.Draw(img)
+
+    font_logo = _load_font(26)
+    font_name = _load_font(54)
+    font_meta = _load_font(36)
+    font_zone_lbl = _load_font(22)
+    font_zone_val = _load_font(34)
+
+    draw.rounded_rectangle([0, 0, w - 1, h - 1], radius=40, fill="#F8FAFC", outline="#CBD5E1", width=3)
+    draw.rounded_rectangle([50, 40, 155, 110], radius=14, fill="#CBD5E1", outline="#64748B", width=2)
+    draw.text((w - 50, 60), "ASTHMA CARE CARD", font=font_logo, fill="#94A3B8", anchor="ra")
+
+    # ลดขนาดฟอนต์ชื่อถ้ายาวเกินพื้นที่ (ไม่ให้ทับ QR)
+    name_size = 54
+    while name_size > 28 and draw.textlength(job["name"], font=font_name) > w - 50 - 230 - 80:
+        name_size -= 4
+        font_name = _load_font(name_size)
+    draw.text((50, 170), job["name"], font=font_name, fill="#1E293B")
+    draw.text((50, 260), f"HN: {job['hn']}", font=font_meta, fill="#64748B")
+    draw.text((50, 310), f"Ref. PEFR: {job['ref_pefr']}", font=font_meta, fill="#0F172A")
+
+    qr_img = Image.open(io.BytesIO(get_qr_png(job["link"], box_size=10, border=1, error_correction="M")))
+    qr_img = qr_img.convert("RGB").resize((230, 230), Image.NEAREST)
+    img.paste(qr_img, (w - 50 - 230, 130))
+
+    box_w = (w - 100 - 2 * 20) // 3
+    for i, (label, bg, border, fg) in enumerate(ZONE_STYLES):
+        x0 = 50 + i * (box_w + 20)
+        draw.rounded_rectangle([x0, 440, x0 + box_w, 590], radius=20, fill=bg, outline=border, width=3)
+        draw.text((x0 + box_w // 2, 480), label, font=font_zone_lbl, fill=fg, anchor="mm")
+        draw.text((x0 + box_w // 2, 540), job["zones"][i], font=font_zone_val, fill=fg, anchor="mm")
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return job["hn"], buf.getvalue()
+
+# 4. วาดบัตรทั้งหมดแบบขนาน (หลาย CPU Core)
+def render_cards(jobs, max_workers=None, progress_callback=None):
+    results = {}
+    total = len(jobs)
+    if total == 0:
+        return []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(render_card_image, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            hn, png_bytes = future.result()
+            results[hn] = png_bytes
+            if progress_callback:
+                progress_callback(done, total)
+
+    # คืนค่าตามลำดับเดิมของ jobs
+    return [(job["hn"], results[job["hn"]]) for job in jobs]
+
+# 5. รวมเป็นไฟล์สำหรับพิมพ์
+def cards_to_pdf(card_images):
+    pages = []
+    per_page = CARDS_PER_ROW * CARDS_PER_COL
+    cw, ch = CARD_SIZE
+
+    for start in range(0, len(card_images), per_page):
+        page = Image.new("RGB", PAGE_SIZE, "white")
+        for i, (_, png_bytes) in enumerate(card_images[start:start + per_page]):
+            row, col = divmod(i, CARDS_PER_ROW)
+            x = PAGE_MARGIN + col * (cw + CARD_GAP)
+            y = PAGE_MARGIN + row * (ch + CARD_GAP)
+            page.paste(Image.open(io.BytesIO(png_bytes)).convert("RGB"), (x, y))
+        pages.append(page)
+
+    if not pages:
+        return b""
+
+    buf = io.BytesIO()
+    pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:], resolution=300)
+    return buf.getvalue()
+
+def cards_to_zip(card_images):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for hn, png_bytes in card_images:
+            zf.writestr(f"asthma_card_{hn}.png", png_bytes)
+    return buf.getvalue()
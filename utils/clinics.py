@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlencode
+
+# ==========================================
+# 🏥 CLINICS (หลายคลินิกใน Process เดียว)
+# แต่ละคลินิกมี Google Sheet / รหัสผ่าน / Journal / Import Ledger / Cache / Index ของตัวเอง
+# ตั้งค่าใน secrets.toml:
+#   [clinics.chiangmai]
+#   name = "คลินิกโรคหืด รพ.เชียงใหม่"
+#   sheet_id = "..."
+#   admin_password = "..."     # ไม่ใส่ = ใช้ admin_password กลาง
+#   memory_limit_mb = 256      # ไม่ใส่ = CLINIC_MEMORY_LIMIT_MB
+# ไม่มี [clinics] = คลินิกเดียว "default" (Sheet / ไฟล์เดิมทั้งหมด)
+# ลิงก์ของคลินิกอื่นที่ไม่ใช่ "default" มี ?clinic=<id> ต่อท้าย
+# ==========================================
+
+DEFAULT_CLINIC_ID = "default"
+CLINIC_SESSION_KEY = "clinic_id"
+CLINIC_MEMORY_LIMIT_MB = float(os.environ.get("CLINIC_MEMORY_LIMIT_MB", 256))    # ต่อคลินิก (ค่าเริ่มต้น)
+CLINIC_MEMORY_BUDGET_MB = float(os.environ.get("CLINIC_MEMORY_BUDGET_MB", 1024))  # รวมทุกคลินิกใน Process
+CLINIC_IDLE_EVICT = float(os.environ.get("CLINIC_IDLE_EVICT", 1800))  # วินาทีที่ไม่มีใครใช้ -> ปล่อยข้อมูลทั้งคลินิก
+CLINIC_EVICT_GRACE = 10  # วินาที: ข้อมูลที่เพิ่งถูกใช้ (กำลังแสดงหน้าเว็บอยู่) ไม่ถูกปล่อย
+
+_CONFIG_LOCK = threading.Lock()
+_CONFIG = {'clinics': None}
+_CURRENT_CLINIC = ContextVar("clinic_id", default=DEFAULT_CLINIC_ID)
+_LAST_ACCESS = {}   # clinic -> time.monotonic() ล่าสุดที่มีการโหลดข้อมูล
+
+def _normalize_config(clinics):
+    return {
+        str(clinic_id): {
+            'name': cfg.get('name'),
+            'sheet_id': cfg.get('sheet_id'),
+            'admin_password': cfg.get('admin_password'),
+            'memory_limit_mb': cfg.get('memory_limit_mb'),
+        }
+        for clinic_id, cfg in clinics.items()
+    }
+
+def _from_secrets():
+    import streamlit as st
+    try:
+        configured = st.secrets.get("clinics")
+    except Exception:
+        # ไม่มี secrets.toml (เช่นรันจาก CLI)
+        configured = None
+    return _normalize_config(configured or {DEFAULT_CLINIC_ID: {}})
+
+def clinic_config():
+    """
+    {clinic_id: {name, sheet_id, admin_password, memory_limit_mb}} (อ่านจาก secrets ครั้งแรกที่เรียก)
+    """
+    with _CONFIG_LOCK:
+        if _CONFIG['clinics'] is None:
+            _CONFIG['clinics'] = _from_secrets()
+        return _CONFIG['clinics']
+
+def configure_clinics(clinics=None):
+    """
+    กำหนดรายการคลินิกเอง (Benchmark / Load Test) / None = อ่านจาก secrets ใหม่
+    """
+    with _CONFIG_LOCK:
+        _CONFIG['clinics'] = None if clinics is None else _normalize_config(clinics)
+
+def get_clinic(clinic_id):
+    return clinic_config().get(clinic_id)
+
+def misconfigured_clinics():
+    # คลินิกอื่นที่ไม่ใช่ "default" ต้องมี sheet_id ของตัวเอง (ไม่งั้นจะอ่าน/เขียน Sheet ของคลินิก "default")
+    return [c for c, cfg in clinic_config().items() if c != DEFAULT_CLINIC_ID and not cfg['sheet_id']]
+
+def clinic_name(clinic_id):
+    cfg = get_clinic(clinic_id) or {}
+    return cfg.get('name') or clinic_id
+
+def resolve_clinic(requested=None):
+    """
+    คลินิกจาก ?clinic= -> id ที่ใช้ได้ / None = ไม่รู้จัก หรือมีหลายคลินิกแต่ไม่ได้ระบุ
+    """
+    clinics = clinic_config()
+    if requested:
+        return requested if requested in clinics else None
+    if DEFAULT_CLINIC_ID in clinics:
+        return DEFAULT_CLINIC_ID
+    if len(clinics) == 1:
+        return next(iter(clinics))
+    return None
+
+# --- คลินิกของงานปัจจุบัน ---
+def current_clinic():
+    """
+    ในหน้าเว็บ = คลินิกของ Session (รวมตอน Fragment rerun) / นอกหน้าเว็บ = ค่าจาก use_clinic()
+    """
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        if CLINIC_SESSION_KEY in ctx.session_state:
+            return ctx.session_state[CLINIC_SESSION_KEY]
+    return _CURRENT_CLINIC.get()
+
+def set_session_clinic(clinic_id):
+    import streamlit as st
+    st.session_state[CLINIC_SESSION_KEY] = clinic_id
+
+@contextmanager
+def use_clinic(clinic_id):
+    # สำหรับ CLI / Thread เบื้องหลัง: งานใน with นี้ทำกับคลินิก clinic_id
+    token = _CURRENT_CLINIC.set(clinic_id)
+    try:
+        yield clinic_id
+    finally:
+        _CURRENT_CLINIC.reset(token)
+
+def clinic_path(path, clinic_id=None):
+    """
+    ไฟล์ของแต่ละคลินิก: "default" ใช้ไฟล์เดิม / คลินิกอื่น -> <ชื่อไฟล์>.<clinic_id>.<นามสกุล>
+    """
+    clinic_id = clinic_id or current_clinic()
+    if clinic_id == DEFAULT_CLINIC_ID:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{clinic_id}{ext}"
+
+def clinic_password(clinic_id):
+    import streamlit as st
+    cfg = get_clinic(clinic_id) or {}
+    return cfg.get('admin_password') or st.secrets.get("admin_password")
+
+def patient_link(base_url, token, clinic_id=None):
+    # ลิงก์ QR ของผู้ป่วย (คลินิก "default" ใช้รูปแบบเดิม -> บัตรที่พิมพ์ไปแล้วยังใช้ได้)
+    clinic_id = clinic_id or current_clinic()
+    params = {'token': token}
+    if clinic_id != DEFAULT_CLINIC_ID:
+        params['clinic'] = clinic_id
+    return f"{base_url}/?{urlencode(params)}"
+
+# --- การใช้งาน + LRU (ปล่อยข้อมูลของคลินิกที่ไม่มีใครใช้) ---
+def touch_clinic(clinic_id):
+    _LAST_ACCESS[clinic_id] = time.monotonic()
+
+def clinic_memory_limit(clinic_id):
+    cfg = get_clinic(clinic_id) or {}
+    return float(cfg.get('memory_limit_mb') or CLINIC_MEMORY_LIMIT_MB) * 2 ** 20
+
+def plan_clinic_evictions(usage, keep=None, now=None):
+    """
+    usage = {clinic: byte ที่ใช้อยู่} -> [(clinic, เหตุผล)] ของคลินิกที่ควรปล่อยข้อมูลทั้งหมด
+    "idle" = ไม่มีใครใช้เกิน CLINIC_IDLE_EVICT / "budget" = รวมกันเกิน CLINIC_MEMORY_BUDGET_MB
+    (ปล่อยคลินิกที่ใช้ล่าสุดนานที่สุดก่อน)
+    """
+    now = time.monotonic() if now is None else now
+    last = dict(_LAST_ACCESS)
+    candidates = [c for c in usage if c != keep and now - last.get(c, 0) > CLINIC_EVICT_GRACE]
+    idle = [c for c in candidates if now - last.get(c, 0) > CLINIC_IDLE_EVICT]
+    evict = [(c, "idle") for c in idle]
+
+    total = sum(size for c, size in usage.items() if c not in idle)
+    budget = CLINIC_MEMORY_BUDGET_MB * 2 ** 20
+    for c in sorted((c for c in candidates if c not in idle), key=lambda c: last.get(c, 0)):
+        if total <= budget:
+            break
+        evict.append((c, "budget"))
+        total -= usage[c]
+    return evict
+
+def clinic_last_access():
+    now = time.monotonic()
+    return {c: round(now - t, 1) for c, t in _LAST_ACCESS.items()}
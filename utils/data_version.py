@@ -0,0 +1,158 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.clinics import DEFAULT_CLINIC_ID
+
+# ==========================================
+# 📡 DATA VERSION (แจ้งการเปลี่ยนแปลงข้าม Replica)
+# ทุกครั้งที่เขียนข้อมูลลง Sheets -> บันทึก "มีการเปลี่ยนแปลง" ลงไฟล์ SQLite ที่ทุก Replica ใช้ร่วมกัน
+# Replica อื่นตรวจไฟล์นี้ถี่ๆ (อ่านเลขล่าสุดอย่างเดียว ไม่เรียก Sheets) แล้วล้าง Cache / อัปเดต Index ทันที
+# ใช้ไฟล์เดียวร่วมกันทุกคลินิก (แต่ละรายการระบุคลินิก -> ล้างเฉพาะ Cache ของคลินิกนั้น)
+# ==========================================
+
+DATA_VERSION_PATH = os.environ.get(
+    "DATA_VERSION_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "data_version.sqlite")
+)
+VERSION_POLL_INTERVAL = 0.5   # วินาที ระหว่างรอบตรวจการเปลี่ยนแปลง
+VERSION_KEEP_CHANGES = 10000  # จำนวนรายการล่าสุดที่เก็บไว้ (เก่ากว่านี้ลบทิ้ง)
+
+# รหัสของ Process นี้ (ไม่ต้องทำซ้ำการเปลี่ยนแปลงที่ตัวเองประกาศ)
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    hns TEXT,
+    origin TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    clinic TEXT
+);
+"""
+
+# ไฟล์ที่สร้างตาราง/Migrate แล้วใน Process นี้ (Watcher เปิด Connection ทุก 0.5 วินาที -> ไม่ทำซ้ำทุกครั้ง)
+_INITIALISED = set()
+_INIT_LOCK = threading.Lock()
+
+def _initialise(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    # ไฟล์จากเวอร์ชันก่อน (คลินิกเดียว) -> เพิ่มคอลัมน์ clinic (รายการเดิม = "default")
+    if 'clinic' not in {row[1] for row in conn.execute("PRAGMA table_info(data_changes)")}:
+        conn.execute("ALTER TABLE data_changes ADD COLUMN clinic TEXT")
+
+@contextmanager
+def _connect(path=None):
+    path = path or DATA_VERSION_PATH
+    conn = None
+    try:
+        # ไฟล์ถูกลบ/ย้ายระหว่างทำงาน -> สร้างตารางใหม่
+        if path not in _INITIALISED or not os.path.exists(path):
+            with _INIT_LOCK:
+                if path not in _INITIALISED or not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    conn = sqlite3.connect(path, timeout=30)
+                    _initialise(conn)
+                    _INITIALISED.add(path)
+        conn = conn or sqlite3.connect(path, timeout=30)
+        with conn:
+            yield conn
+    finally:
+        if conn is not None:
+            conn.close()
+
+def publish_change(table, hns=None, clinic=DEFAULT_CLINIC_ID, path=None):
+    """
+    ประกาศว่าตาราง table ของคลินิก clinic เปลี่ยน (hns = HN ที่เปลี่ยน, None = ไม่รู้ -> ให้สร้าง Index ใหม่ทั้งหมด)
+    คืนค่าเลข Version ใหม่
+    """
+    payload = None if hns is None else json.dumps(sorted({str(h) for h in hns}))
+    with _connect(path) as conn:
+        version = conn.execute(
+            "INSERT INTO data_changes (table_name, hns, origin, created_at, clinic) VALUES (?, ?, ?, ?, ?)",
+            (table, payload, REPLICA_ID, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), clinic)
+        ).lastrowid
+        conn.execute("DELETE FROM data_changes WHERE id <= ?", (version - VERSION_KEEP_CHANGES,))
+    return version
+
+def current_version(path=None):
+    with _connect(path) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM data_changes").fetchone()[0]
+
+def changes_since(version, path=None):
+    """
+    การเปลี่ยนแปลงหลัง version -> (list ของ dict, ครบหรือไม่)
+    ครบ = False เมื่อรายการที่ต้องการถูกลบไปแล้ว (ตามไม่ทัน -> ควรล้างทุกอย่าง)
+    """
+    with _connect(path) as conn:
+        oldest = conn.execute("SELECT MIN(id) FROM data_changes").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, table_name, hns, origin, clinic FROM data_changes WHERE id > ? ORDER BY id",
+            (version,)
+        ).fetchall()
+    complete = oldest is None or oldest <= version + 1
+    changes = [
+        {'version': vid, 'table': table, 'hns': None if hns is None else json.loads(hns),
+         'origin': origin, 'clinic': clinic or DEFAULT_CLINIC_ID}
+        for vid, table, hns, origin, clinic in rows
+    ]
+    return changes, complete
+
+# --- Watcher (1 Thread ต่อ Process) ---
+_WATCHER_LOCK = threading.Lock()
+_WATCHER = {'thread': None, 'version': None, 'applied': 0, 'last_error': None}
+
+def _watcher_loop(apply_fn, reset_fn, path):
+    while True:
+        try:
+            if _WATCHER['version'] is None:
+                # เริ่มจาก Version ปัจจุบัน (ข้อมูลที่จะโหลดต่อจากนี้ใหม่กว่าการเปลี่ยนแปลงก่อนหน้าอยู่แล้ว)
+                _WATCHER['version'] = current_version(path)
+                reset_fn()
+            changes, complete = changes_since(_WATCHER['version'], path=path)
+            if not complete:
+                reset_fn()
+            for change in changes:
+                if change['origin'] != REPLICA_ID:
+                    apply_fn(change['table'], change['hns'], change['clinic'])
+                    _WATCHER['applied'] += 1
+                _WATCHER['version'] = change['version']
+            _WATCHER['last_error'] = None
+        except Exception as e:
+            # ไฟล์ถูกล็อก / ดิสก์มีปัญหา -> ลองใหม่รอบถัดไป (Cache ยังหมดอายุตาม TTL ตามปกติ)
+            _WATCHER['last_error'] = str(e)
+        time.sleep(VERSION_POLL_INTERVAL)
+
+def start_version_watcher(apply_fn, reset_fn, path=None):
+    """
+    เริ่ม Thread ตรวจการเปลี่ยนแปลงจาก Replica อื่น (เรียกซ้ำได้ จะเริ่มแค่ครั้งเดียว)
+    apply_fn(table, hns, clinic) = ล้าง Cache/Index ของตารางนั้น, reset_fn() = ล้างทุกอย่าง
+    """
+    with _WATCHER_LOCK:
+        thread = _WATCHER['thread']
+        if thread is None or not thread.is_alive():
+            if _WATCHER['version'] is None:
+                try:
+                    _WATCHER['version'] = current_version(path)
+                except Exception as e:
+                    _WATCHER['last_error'] = str(e)
+            thread = threading.Thread(target=_watcher_loop, args=(apply_fn, reset_fn, path), name="data-version-watcher", daemon=True)
+            thread.start()
+            _WATCHER['thread'] = thread
+    return thread
+
+def watcher_status():
+    return {
+        'running': _WATCHER['thread'] is not None and _WATCHER['thread'].is_alive(),
+        'version': _WATCHER['version'],
+        'applied': _WATCHER['applied'],
+        'last_error': _WATCHER['last_error'],
+    }
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import urllib.request
+
+# ==========================================
+# 🔤 FETCH FONTS (ดาวน์โหลดฟอนต์ Kanit มาไว้ใน static/fonts/)
+# ไฟล์ที่หน้าเว็บ (utils/style.py) และบัตร PNG (utils/card_batch.py) ใช้ -> รันครั้งเดียวแล้ว Commit ไฟล์เข้า Repo
+#   python -m utils.fetch_fonts
+# ==========================================
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "fonts")
+KANIT_BASE_URL = "https://github.com/google/fonts/raw/main/ofl/kanit/"
+KANIT_FILES = ['Kanit-Light.ttf', 'Kanit-Regular.ttf', 'Kanit-Medium.ttf', 'Kanit-SemiBold.ttf', 'OFL.txt']
+
+# Header ของไฟล์ TrueType / OpenType (กันได้หน้า HTML แทนไฟล์ฟอนต์)
+_FONT_MAGIC = (b'\x00\x01\x00\x00', b'true', b'OTTO')
+
+def fetch_fonts(out_dir=FONTS_DIR, base_url=KANIT_BASE_URL, force=False):
+    """
+    ดาวน์โหลดไฟล์ที่ยังไม่มี -> คืนค่า list ของไฟล์ที่ดาวน์โหลดใหม่
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    fetched = []
+    for name in KANIT_FILES:
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path) and not force:
+            continue
+        with urllib.request.urlopen(base_url + name, timeout=60) as resp:
+            data = resp.read()
+        if name.endswith('.ttf') and not data.startswith(_FONT_MAGIC):
+            raise ValueError(f"{name}: ไม่ใช่ไฟล์ฟอนต์")
+        # เขียนไฟล์ชั่วคราวก่อน แล้วค่อยเปลี่ยนชื่อ (ไม่ทิ้งไฟล์ครึ่งๆ ไว้ตอนดาวน์โหลดไม่สำเร็จ)
+        with open(path + ".part", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+        fetched.append(path)
+    return fetched
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ดาวน์โหลดฟอนต์ Kanit (SIL OFL) มาไว้ใน static/fonts/")
+    parser.add_argument("--out", default=FONTS_DIR, help="โฟลเดอร์ที่จะเขียนไฟล์")
+    parser.add_argument("--force", action="store_true", help="ดาวน์โหลดใหม่แม้มีไฟล์อยู่แล้ว")
+    args = parser.parse_args(argv)
+
+    try:
+        fetched = fetch_fonts(args.out, force=args.force)
+    except Exception as e:
+        print(f"❌ ดาวน์โหลดฟอนต์ไม่สำเร็จ: {e}", file=sys.stderr)
+        return 1
+    for path in fetched:
+        print(f"✅ {path}")
+    if not fetched:
+        print("มีไฟล์ฟอนต์ครบแล้ว")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
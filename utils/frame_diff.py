@@ -0,0 +1,54 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.snapshot_cache import snapshot_version
+
+# ==========================================
+# 🧮 FRAME DIFF (หาแถวที่เปลี่ยนระหว่างข้อมูล 2 ชุด)
+# ใช้กับ Index ที่สร้างจากตาราง: เทียบ Hash ของแต่ละแถว "ตามตำแหน่ง" กับชุดที่ Index ไว้
+# -> รู้ว่า HN ไหนต้องคำนวณใหม่ ทั้งที่บันทึกจากแอป และที่แก้ใน Google Sheets โดยตรง
+# ==========================================
+
+def row_hashes(df, columns):
+    """
+    Hash ของแต่ละแถว (เฉพาะคอลัมน์ที่ Index ใช้) เป็น numpy array ยาวเท่าจำนวนแถว
+    """
+    cols = [c for c in columns if c in df.columns]
+    if df.empty or not cols:
+        return np.zeros(len(df), dtype=np.uint64)
+    sub = df[cols]
+    try:
+        return pd.util.hash_pandas_object(sub, index=False).to_numpy()
+    except TypeError:
+        # คอลัมน์ที่มีค่าหลายชนิดปนกัน (ตัวเลข/ข้อความจาก Sheets) ที่ Hash ตรงๆ ไม่ได้
+        return pd.util.hash_pandas_object(sub.astype(str), index=False).to_numpy()
+
+def row_keys(df, column='hn'):
+    if column not in df.columns:
+        return np.array([""] * len(df), dtype=object)
+    return df[column].astype(str).str.strip().to_numpy(dtype=object)
+
+def changed_keys(old_hashes, old_keys, new_hashes, new_keys):
+    """
+    key (เช่น HN) ของทุกตำแหน่งที่ต่างกัน: แถวที่แก้ไข / เลื่อนตำแหน่ง (ลบแถว) / เพิ่มหรือหายไปท้ายตาราง
+    (นับทั้ง key เดิมและ key ใหม่ ณ ตำแหน่งนั้น)
+    """
+    n = min(len(old_hashes), len(new_hashes))
+    diff = np.flatnonzero(old_hashes[:n] != new_hashes[:n])
+    keys = set(old_keys[diff]) | set(new_keys[diff])
+    keys.update(old_keys[n:])
+    keys.update(new_keys[n:])
+    keys.discard("")
+    return keys
+
+def frame_version(df, columns):
+    """
+    รุ่นของข้อมูลสำหรับใช้เป็น key ของ Cache ในหน้าเว็บ:
+    มาจาก SnapshotCache -> snapshot_version / ไม่ใช่ -> Hash ของคอลัมน์ที่ใช้ (แก้ค่าโดยจำนวนแถวเท่าเดิมก็เปลี่ยน)
+    """
+    version = snapshot_version(df)
+    if version is not None:
+        return version
+    return len(df), hashlib.sha1(row_hashes(df, columns).tobytes()).hexdigest()
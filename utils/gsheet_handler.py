@@ -1,16 +1,59 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
 import streamlit as st
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime  # ✅ 1. เพิ่มบรรทัดนี้
+from utils.patient_index import invalidate_patient_indexes, drop_patient_indexes
+from utils.write_queue import GroupCommitQueue, resolve_row_positions
+from utils.hosxp_import import normalize_hosxp_dates
+from utils.visit_journal import VISIT_JOURNAL_PATH, append_visit, start_journal_flusher, pending_count, parked_count, flusher_status
+from utils.snapshot_cache import SnapshotCache, snapshot_status
+from utils.frame_diff import frame_version
+from utils.data_version import publish_change, start_version_watcher, watcher_status
+from utils.metrics import describe, inc, observe, register_collector
+from utils.clinics import (
+    DEFAULT_CLINIC_ID, CLINIC_EVICT_GRACE, current_clinic, get_clinic, clinic_config, clinic_path,
+    touch_clinic, clinic_memory_limit, plan_clinic_evictions
+)
 
 # --- CONFIGURATION ---
+# Sheet ของคลินิก "default" (คลินิกอื่นกำหนด sheet_id ใน secrets -> utils/clinics.py)
 SHEET_ID = "1LF9Yi6CXHaiITVCqj9jj1agEdEE9S-37FwnaxNIlAaE"
 PATIENTS_SHEET_NAME = "patients"
 VISITS_SHEET_NAME = "visits"
 LOGS_SHEET_NAME = "logs"  # ✅ 2. เพิ่มชื่อ Sheet Logs
 
+# ใช้ข้อมูลในเครื่องแทน Google Sheets (Benchmark / Load Test / ทดลองกับข้อมูลจำลอง)
+LOCAL_SHEETS_DIR = os.environ.get("LOCAL_SHEETS_DIR")
+_SHEETS_CLIENT = {'client': None}
+_SHEETS_CLIENT_LOCK = threading.Lock()
+
+def use_sheets_client(client):
+    """
+    ใช้ Client ที่กำหนด (เช่น LocalSheetsClient) แทนการเชื่อมต่อ Google Sheets / None = กลับไปใช้ของจริง
+    """
+    with _SHEETS_CLIENT_LOCK:
+        _SHEETS_CLIENT['client'] = client
+    clear_data_caches()
+    invalidate_patient_indexes()
+
 def connect_to_gsheet():
+    if _SHEETS_CLIENT['client'] is not None:
+        return _SHEETS_CLIENT['client']
+    if LOCAL_SHEETS_DIR:
+        with _SHEETS_CLIENT_LOCK:
+            if _SHEETS_CLIENT['client'] is None:
+                from utils.local_sheets import LocalSheetsClient
+                _SHEETS_CLIENT['client'] = LocalSheetsClient.from_dir(LOCAL_SHEETS_DIR)
+        return _SHEETS_CLIENT['client']
+
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     try:
         if "gcp_service_account" in st.secrets:
@@ -28,6 +71,155 @@ def connect_to_gsheet():
     except Exception as e:
         st.error("❌ ไม่สามารถเชื่อมต่อ Google Sheets ได้ (ตรวจสอบ service_account.json หรือ Secrets)")
         st.stop()
+        raise  # นอกหน้าเว็บ (CLI) st.stop() ไม่หยุดการทำงาน -> ส่ง Error จริงต่อ
+
+# --- METRICS (นับทุกการเรียก Google Sheets API: ครั้ง / เวลา / จำนวนแถว / ขนาดข้อมูล) ---
+describe("sheets_api_calls_total", "counter", "Google Sheets API calls by operation, sheet and status")
+describe("sheets_api_latency_seconds", "histogram", "Google Sheets API call latency")
+describe("sheets_rows_read_total", "counter", "Rows returned by Sheets reads")
+describe("sheets_bytes_read_total", "counter", "Approximate JSON bytes returned by Sheets reads")
+describe("sheets_rows_written_total", "counter", "Rows sent by Sheets writes")
+describe("sheets_bytes_written_total", "counter", "Approximate JSON bytes sent by Sheets writes")
+describe("clinic_evictions_total", "counter", "Cached data released per clinic (clinic_limit, idle, budget, manual)")
+
+# จำนวนแถวของผลลัพธ์แต่ละแบบ
+_READ_ROWS = {
+    'get_all_values': len,
+    'get_all_records': len,
+    'get': len,
+    'col_values': len,
+    'batch_get': lambda result: max((len(r) for r in result), default=0),
+    'row_values': lambda result: 1 if result else 0,
+    'cell': lambda result: 1,
+    'find': lambda result: 1 if result else 0,
+}
+# ข้อมูลที่ส่งไป (จำนวนแถว, ค่า) ของการเขียนแต่ละแบบ
+_WRITE_ROWS = {
+    'append_row': lambda args: (1, args[0]),
+    'append_rows': lambda args: (len(args[0]), args[0]),
+    'update_cells': lambda args: (len({c.row for c in args[0]}), [c.value for c in args[0]]),
+    'update_cell': lambda args: (1, args[2]),
+}
+
+_BYTES_SAMPLE_ROWS = 200  # ตารางใหญ่: วัดขนาดจากแถวตัวอย่างแล้วคูณจำนวนแถว (ไม่ต้อง Serialize ทั้งตาราง)
+
+def _payload_bytes(value):
+    if isinstance(value, gspread.Cell):
+        value = value.value
+    if isinstance(value, list) and value and isinstance(value[0], list) and value[0] and isinstance(value[0][0], list):
+        # batch_get = list ของหลายช่วง
+        return sum(_payload_bytes(v) for v in value)
+    if isinstance(value, list) and len(value) > _BYTES_SAMPLE_ROWS:
+        sample = value[:_BYTES_SAMPLE_ROWS]
+        return round(len(json.dumps(sample, ensure_ascii=False, default=str).encode("utf-8")) * len(value) / len(sample))
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+@contextmanager
+def _sheets_call(op, sheet, clinic):
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        labels = {'clinic': clinic, 'op': op, 'sheet': sheet}
+        inc("sheets_api_calls_total", {**labels, 'status': status})
+        observe("sheets_api_latency_seconds", time.perf_counter() - started, labels)
+
+class _InstrumentedWorksheet:
+    """
+    ห่อ Worksheet ของ gspread: ทุกเมธอดที่เรียก API ถูกนับ/จับเวลา (เมธอดอื่นส่งต่อตามเดิม)
+    """
+
+    def __init__(self, worksheet, title, clinic):
+        self._worksheet = worksheet
+        self.title = title
+        self.clinic = clinic
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name not in _READ_ROWS and name not in _WRITE_ROWS:
+            return attr
+
+        def call(*args, **kwargs):
+            with _sheets_call(name, self.title, self.clinic):
+                result = attr(*args, **kwargs)
+            labels = {'clinic': self.clinic, 'sheet': self.title}
+            if name in _READ_ROWS:
+                inc("sheets_rows_read_total", labels, _READ_ROWS[name](result))
+                inc("sheets_bytes_read_total", labels, _payload_bytes(result))
+            else:
+                rows, values = _WRITE_ROWS[name](args)
+                inc("sheets_rows_written_total", labels, rows)
+                inc("sheets_bytes_written_total", labels, _payload_bytes(values))
+            return result
+        return call
+
+def _sheet_id(clinic):
+    cfg = get_clinic(clinic)
+    if cfg is None:
+        raise KeyError(f"Unknown clinic: {clinic}")
+    if cfg['sheet_id']:
+        return cfg['sheet_id']
+    if clinic != DEFAULT_CLINIC_ID:
+        # ไม่ให้คลินิกที่ลืมตั้ง sheet_id ไปใช้ Sheet ของคลินิก "default" โดยไม่รู้ตัว
+        raise KeyError(f"Clinic {clinic} has no sheet_id")
+    return SHEET_ID
+
+def _open_spreadsheet(clinic):
+    client = connect_to_gsheet()
+    with _sheets_call('open_by_key', '-', clinic):
+        return client.open_by_key(_sheet_id(clinic))
+
+def _open_worksheet(worksheet_name, clinic, sh=None):
+    sh = sh or _open_spreadsheet(clinic)
+    with _sheets_call('worksheet', worksheet_name, clinic):
+        return _InstrumentedWorksheet(sh.worksheet(worksheet_name), worksheet_name, clinic)
+
+def _collect_metrics():
+    # อ่าน ณ ตอนที่มีคนขอ Metrics: สถานะ Cache / คิวเขียน / Journal / การแจ้งเปลี่ยนข้ามเครื่อง
+    samples = []
+    events = {'hits': 'hit', 'stale_hits': 'stale_hit', 'sync_loads': 'miss',
+              'refreshes': 'refresh', 'refresh_errors': 'refresh_error', 'evictions': 'eviction'}
+    for cache in snapshot_status():
+        for stat, event in events.items():
+            samples.append(("cache_events_total", "counter", "Snapshot cache hits, misses, refreshes and evictions",
+                            {'cache': cache['name'], 'event': event}, cache[stat]))
+        samples.append(("cache_entries", "gauge", "Tables currently held by each snapshot cache",
+                        {'cache': cache['name']}, len(cache['tables'])))
+
+    with _VISIT_QUEUES_LOCK:
+        queues = dict(_VISIT_QUEUES)
+    for clinic, queue in queues.items():
+        labels = {'clinic': clinic, 'queue': VISITS_SHEET_NAME}
+        samples += [
+            ("write_queue_depth", "gauge", "Rows waiting in the group-commit write queue", labels, queue.depth()),
+            ("write_queue_flushes_total", "counter", "Group-commit flushes to Sheets", labels, queue.stats['flushes']),
+            ("write_queue_rows_written_total", "counter", "Rows written by the group-commit queue", labels, queue.stats['rows_written']),
+        ]
+    for clinic in clinic_config():
+        path = clinic_path(VISIT_JOURNAL_PATH, clinic)
+        if not os.path.exists(path):
+            continue
+        samples += [
+            ("visit_journal_pending", "gauge", "Visits saved locally and not yet sent to Sheets",
+             {'clinic': clinic}, pending_count(path=path)),
+            ("visit_journal_parked", "gauge", "Visits that kept failing and wait for manual handling",
+             {'clinic': clinic}, parked_count(path=path)),
+            ("visit_journal_flush_error", "gauge", "1 if the last journal flush failed",
+             {'clinic': clinic}, int(bool(flusher_status(path=path)['last_error']))),
+        ]
+    for clinic, entries in _clinic_usage().items():
+        samples.append(("clinic_cache_bytes", "gauge", "Approximate memory held by each clinic's cached tables",
+                        {'clinic': clinic}, sum(e[2] for e in entries)))
+    watcher = watcher_status()
+    samples += [
+        ("data_version", "gauge", "Last cross-replica data version seen by this process", {}, watcher['version']),
+        ("data_changes_applied_total", "counter", "Data changes from other replicas applied to local caches", {}, watcher['applied']),
+    ]
+    return samples
+
+register_collector(_collect_metrics)
 
 # ✅ 3. เพิ่มฟังก์ชัน log_action นี้ลงไป
 def log_action(user, action, details="-"):
@@ -35,14 +227,15 @@ def log_action(user, action, details="-"):
     บันทึก Log การใช้งานลง Sheet 'logs'
     """
     try:
-        client = connect_to_gsheet()
-        sh = client.open_by_key(SHEET_ID)
+        clinic = current_clinic()
+        sh = _open_spreadsheet(clinic)
         
         # พยายามเปิด Sheet logs ถ้าไม่มีให้สร้างใหม่ (Auto-create)
         try:
-            worksheet = sh.worksheet(LOGS_SHEET_NAME)
+            worksheet = _open_worksheet(LOGS_SHEET_NAME, clinic, sh)
         except gspread.WorksheetNotFound:
-            worksheet = sh.add_worksheet(title=LOGS_SHEET_NAME, rows=1000, cols=4)
+            with _sheets_call('add_worksheet', LOGS_SHEET_NAME, clinic):
+                worksheet = _InstrumentedWorksheet(sh.add_worksheet(title=LOGS_SHEET_NAME, rows=1000, cols=4), LOGS_SHEET_NAME, clinic)
             # สร้าง Header
             worksheet.append_row(["Timestamp", "User", "Action", "Details"])
 
@@ -54,77 +247,261 @@ def log_action(user, action, details="-"):
     except Exception as e:
         print(f"⚠️ Logging Failed: {e}")
 
-@st.cache_data(ttl=60)
-def load_data_fast(worksheet_name):
+# --- LOADERS (อ่านจาก Sheets ตรงๆ / Error ส่งต่อให้ผู้เรียก) ---
+def _fetch_values(clinic, worksheet_name):
+    worksheet = _open_worksheet(worksheet_name, clinic)
+    data = worksheet.get_all_values()
+    if not data: return pd.DataFrame()
+
+    headers = data.pop(0)
+    df = pd.DataFrame(data, columns=headers)
+
+    if 'hn' in df.columns:
+        df['hn'] = df['hn'].astype(str).str.split('.').str[0].str.strip().apply(lambda x: x.zfill(7))
+        
+    cols_to_numeric = ['pefr', 'best_pefr', 'height']
+    for col in cols_to_numeric:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    return df
+
+def _fetch_records(clinic, worksheet_name):
+    worksheet = _open_worksheet(worksheet_name, clinic)
+    data = worksheet.get_all_records()
+    df = pd.DataFrame(data)
+    if 'hn' in df.columns:
+        df['hn'] = df['hn'].astype(str).str.strip().apply(lambda x: x.zfill(7))
+    return df
+
+def _fetch_columns(clinic, worksheet_name, columns):
+    worksheet = _open_worksheet(worksheet_name, clinic)
+    header = [h.strip() for h in worksheet.row_values(1)]
+    wanted = [c for c in columns if c in header]
+    if not wanted:
+        return pd.DataFrame(columns=list(columns))
+
+    letters = [gspread.utils.rowcol_to_a1(1, header.index(c) + 1)[:-1] for c in wanted]
+    ranges = worksheet.batch_get([f"{col}2:{col}" for col in letters])
+    values = [[r[0] if r else '' for r in vr] for vr in ranges]
+
+    # Sheets ตัดแถวว่างท้ายคอลัมน์ -> เติมให้ยาวเท่ากัน
+    n_rows = max((len(v) for v in values), default=0)
+    df = pd.DataFrame({c: v + [''] * (n_rows - len(v)) for c, v in zip(wanted, values)})
+    if 'hn' in df.columns:
+        df['hn'] = df['hn'].astype(str).str.strip().apply(lambda x: x.zfill(7))
+    return df
+
+# --- CACHE (Stale-While-Revalidate) ---
+# ผู้ใช้ได้ชุดข้อมูลล่าสุดทันที / Thread เบื้องหลังโหลดใหม่ก่อนหมดอายุ
+# ตารางที่ไม่มีใครเปิดเกิน idle_timeout จะหยุดโหลดล่วงหน้า (ประหยัด Quota ของ Sheets API)
+# การเขียนผ่านแอป (ทุก Replica) ล้าง Cache ทันทีผ่าน data_version -> TTL มีไว้สำหรับการแก้ Sheet ด้วยมือเท่านั้น
+# Key = (คลินิก, ตาราง[, คอลัมน์]) -> แต่ละคลินิกโหลด/ล้าง/ปล่อยข้อมูลแยกกัน
+_SIZE_SAMPLE_ROWS = 1000
+
+def _frame_bytes(df):
+    # ขนาดโดยประมาณของ DataFrame (วัดละเอียดจากแถวตัวอย่างแล้วคูณจำนวนแถว)
+    if len(df) <= _SIZE_SAMPLE_ROWS:
+        return int(df.memory_usage(deep=True).sum())
+    sample = df.iloc[:_SIZE_SAMPLE_ROWS]
+    return int(sample.memory_usage(deep=True).sum() * len(df) / _SIZE_SAMPLE_ROWS)
+
+_PUBLIC_TABLES = SnapshotCache(_fetch_values, ttl=300, max_stale=900, idle_timeout=1800,
+                               copy_fn=pd.DataFrame.copy, size_fn=_frame_bytes, name="public")
+_STAFF_TABLES = SnapshotCache(_fetch_records, ttl=120, max_stale=600, idle_timeout=600,
+                              copy_fn=pd.DataFrame.copy, size_fn=_frame_bytes, name="staff")
+_STAFF_COLUMNS = SnapshotCache(_fetch_columns, ttl=120, max_stale=600, idle_timeout=600,
+                               copy_fn=pd.DataFrame.copy, size_fn=_frame_bytes, name="staff_columns")
+_DATA_CACHES = (_PUBLIC_TABLES, _STAFF_TABLES, _STAFF_COLUMNS)
+
+def load_data_fast(worksheet_name, clinic=None):
+    clinic = clinic or current_clinic()
     try:
-        client = connect_to_gsheet()
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet(worksheet_name)
-        data = worksheet.get_all_values()
-        if not data: return pd.DataFrame()
-
-        headers = data.pop(0)
-        df = pd.DataFrame(data, columns=headers)
-
-        if 'hn' in df.columns:
-            df['hn'] = df['hn'].astype(str).str.split('.').str[0].str.strip().apply(lambda x: x.zfill(7))
-            
-        cols_to_numeric = ['pefr', 'best_pefr', 'height']
-        for col in cols_to_numeric:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        return df
+        _watch_data_changes()
+        df = _PUBLIC_TABLES.get(clinic, worksheet_name)
     except Exception as e:
         st.error(f"❌ Error loading {worksheet_name}: {e}")
         st.stop()
+    _clinic_used(clinic)
+    return df
 
-@st.cache_data(ttl=5) 
-def load_data_staff(worksheet_name):
-    client = connect_to_gsheet()
+def fetch_table(worksheet_name, clinic=None):
+    """
+    โหลดทั้งตารางจาก Sheets ตรงๆ สำหรับ CLI (ไม่ผ่าน Cache / ไม่ใช้ st.error -> Error ส่งต่อให้ผู้เรียก)
+    """
+    return _fetch_records(clinic or current_clinic(), worksheet_name)
+
+def load_data_staff(worksheet_name, clinic=None):
+    clinic = clinic or current_clinic()
     try:
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet(worksheet_name)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-        if 'hn' in df.columns:
-            df['hn'] = df['hn'].astype(str).str.strip().apply(lambda x: x.zfill(7))
-        return df
+        _watch_data_changes()
+        df = _STAFF_TABLES.get(clinic, worksheet_name)
     except Exception as e:
         st.error(f"Error: {e}")
         st.stop()
+    _clinic_used(clinic)
+    return df
 
-def save_visit_data(data_dict):
-    client = connect_to_gsheet()
-    sh = client.open_by_key(SHEET_ID)
-    worksheet = sh.worksheet("visits")
-    
-    inhaler_result = data_dict.get("inhaler_eval", "-")
-
-    row = [
-        str(data_dict["hn"]), 
-        data_dict["date"], 
-        data_dict["pefr"],
-        data_dict["control_level"], 
-        data_dict["controller"], 
-        data_dict["reliever"],
-        data_dict["adherence"], 
-        data_dict["drp"], 
-        data_dict["advice"],
-        data_dict["technique_check"], 
-        data_dict["next_appt"], 
-        data_dict["note"], 
-        data_dict["is_new_case"],
-        inhaler_result
+def load_columns_staff(worksheet_name, columns, clinic=None):
+    """
+    โหลดเฉพาะบางคอลัมน์ (อ่าน Header 1 ครั้ง + batch_get เฉพาะคอลัมน์ที่ต้องใช้)
+    ลำดับแถวเหมือน load_data_staff (ใช้คำนวณเลขแถวใน Sheet ได้)
+    """
+    clinic = clinic or current_clinic()
+    try:
+        _watch_data_changes()
+        df = _STAFF_COLUMNS.get(clinic, worksheet_name, tuple(columns))
+    except Exception as e:
+        st.error(f"Error: {e}")
+        st.stop()
+    _clinic_used(clinic)
+    return df
+
+def clear_data_caches(clinic=None, table=None):
+    # ทุก Cache ที่อ่านจาก Sheets (clinic = เฉพาะคลินิกนั้น, table = เฉพาะตารางนั้นของคลินิก)
+    prefix = () if clinic is None else (clinic,) if table is None else (clinic, table)
+    for cache in _DATA_CACHES:
+        cache.clear(*prefix)
+
+# --- หน่วยความจำต่อคลินิก (LRU) ---
+def _clinic_usage():
+    # {clinic: [(cache, key, byte, เวลาใช้ล่าสุด)]} ของทุก Cache
+    usage = {}
+    for cache in _DATA_CACHES:
+        for key, size, last_access in cache.usage():
+            usage.setdefault(key[0], []).append((cache, key, size, last_access))
+    return usage
+
+def evict_clinic(clinic, reason="manual"):
+    """
+    ปล่อยข้อมูลทั้งหมดของคลินิกออกจากหน่วยความจำ (Cache + Index) -> โหลดใหม่เมื่อมีคนเปิดอีกครั้ง
+    """
+    clear_data_caches(clinic)
+    drop_patient_indexes(clinic)
+    inc("clinic_evictions_total", {'clinic': clinic, 'reason': reason})
+
+def _clinic_used(clinic):
+    """
+    เรียกหลังโหลดข้อมูลทุกครั้ง: บันทึกเวลาใช้ล่าสุด แล้วปล่อยข้อมูลที่เกินงบ
+    - คลินิกนี้ใช้เกิน memory_limit_mb -> ปล่อยตารางที่ไม่ได้ใช้นานที่สุดของคลินิกนี้ (ยกเว้นที่เพิ่งใช้)
+    - คลินิกอื่นที่ไม่มีใครใช้นาน / ทุกคลินิกรวมกันเกินงบ -> ปล่อยทั้งคลินิก เริ่มจากที่ใช้ล่าสุดนานที่สุด
+    """
+    touch_clinic(clinic)
+    now = time.monotonic()
+    usage = _clinic_usage()
+
+    own = sorted(usage.get(clinic, []), key=lambda e: e[3])
+    over = sum(e[2] for e in own) - clinic_memory_limit(clinic)
+    for cache, key, size, last_access in own:
+        if over <= 0 or now - last_access < CLINIC_EVICT_GRACE:
+            break
+        cache.evict([key])
+        inc("clinic_evictions_total", {'clinic': clinic, 'reason': 'clinic_limit'})
+        over -= size
+
+    totals = {c: sum(e[2] for e in entries) for c, entries in usage.items()}
+    for other, reason in plan_clinic_evictions(totals, keep=clinic, now=now):
+        evict_clinic(other, reason)
+
+# --- แจ้งการเปลี่ยนแปลง (ทั้ง Process นี้ และ Replica อื่น) ---
+def _apply_data_change(table, hns=None, clinic=DEFAULT_CLINIC_ID):
+    # ล้าง Cache ของตารางที่เปลี่ยน -> Index หา HN ที่เปลี่ยนเองตอนโหลดชุดใหม่ (hns = None -> สร้างใหม่ทั้งหมด)
+    clear_data_caches(clinic, table)
+    if hns is None:
+        invalidate_patient_indexes(clinic)
+
+def _reset_data_caches():
+    clear_data_caches()
+    invalidate_patient_indexes()
+
+def _data_changed(table, hns=None, clinic=DEFAULT_CLINIC_ID):
+    """
+    เรียกหลังเขียนข้อมูลทุกครั้ง: อัปเดต Cache ของ Process นี้ แล้วแจ้ง Replica อื่น
+    """
+    _apply_data_change(table, hns, clinic)
+    try:
+        publish_change(table, hns, clinic=clinic)
+    except Exception as e:
+        # แจ้งไม่สำเร็จ -> Replica อื่นเห็นข้อมูลใหม่เมื่อ Cache หมดอายุ (ข้อมูลใน Sheets บันทึกแล้ว)
+        print(f"⚠️ Publish data change failed: {e}")
+
+def _watch_data_changes():
+    start_version_watcher(_apply_data_change, _reset_data_caches)
+
+def _visit_row(data):
+    return [
+        str(data["hn"]), 
+        data["date"], 
+        data["pefr"],
+        data["control_level"], 
+        data["controller"], 
+        data["reliever"],
+        data["adherence"], 
+        data["drp"], 
+        data["advice"],
+        data["technique_check"], 
+        data["next_appt"], 
+        data["note"], 
+        data["is_new_case"],
+        data.get("inhaler_eval", "-"),
+        data.get("journal_id", "")
+    ]
+
+def _drop_journaled_rows(worksheet, rows):
+    """
+    ตัดแถวจาก Journal ที่อยู่ใน Sheet แล้ว (hn, วันที่, journal_id เดียวกัน) -> ส่งซ้ำได้โดยไม่เกิดแถวซ้ำ
+    """
+    key_rows, journal_col = worksheet.batch_get(['A2:B', 'O1:O'])
+    header, journal_ids = (journal_col[0] if journal_col else []), journal_col[1:]
+    if header != ['journal_id']:
+        worksheet.update_cells([gspread.Cell(1, 15, 'journal_id')])
+    sheet_keys = _visit_keys(
+        [r[0] if len(r) > 0 else '' for r in key_rows],
+        [r[1] if len(r) > 1 else None for r in key_rows],
+    )
+    written = {
+        (*key, str(ids[0]).strip())
+        for key, ids in zip(sheet_keys, journal_ids) if ids and str(ids[0]).strip()
+    }
+    return [
+        row for row in rows
+        if not row[14] or (*_visit_keys([row[0]], [row[1]])[0], str(row[14])) not in written
     ]
-    worksheet.append_row(row)
-    load_data_staff.clear()
-    load_data_fast.clear()
 
-def save_patient_data(data_dict):
+def _append_visit_rows(clinic, rows):
+    # เขียนแถว Visit ทั้งกลุ่มด้วย Request เดียว (เรียกจาก Write Queue)
+    worksheet = _open_worksheet(VISITS_SHEET_NAME, clinic)
+    if any(row[14] for row in rows):
+        rows = _drop_journaled_rows(worksheet, rows)
+        if not rows:
+            return
+    worksheet.append_rows(rows)
+    _data_changed(VISITS_SHEET_NAME, {row[0] for row in rows}, clinic=clinic)
+
+# คิวเขียน Visit 1 คิวต่อคลินิก (หลาย Session บันทึกพร้อมกัน -> รวมเป็น append_rows ครั้งเดียว)
+_VISIT_QUEUES = {}
+_VISIT_QUEUES_LOCK = threading.Lock()
+
+def _visit_queue(clinic):
+    with _VISIT_QUEUES_LOCK:
+        if clinic not in _VISIT_QUEUES:
+            _VISIT_QUEUES[clinic] = GroupCommitQueue(partial(_append_visit_rows, clinic))
+        return _VISIT_QUEUES[clinic]
+
+def _flush_journal_visits(clinic, records):
+    # เรียกจาก Thread เบื้องหลังของ Journal (1 Thread ต่อคลินิก)
+    _visit_queue(clinic).submit([_visit_row(data) for data in records])
+
+def save_visit_data(data_dict, clinic=None):
+    # บันทึกลง Journal ในเครื่องก่อน (ไม่ต้องรอ Sheets) แล้วให้ Thread เบื้องหลังส่งต่อ
+    clinic = clinic or current_clinic()
+    path = clinic_path(VISIT_JOURNAL_PATH, clinic)
+    start_journal_flusher(partial(_flush_journal_visits, clinic), path=path)
+    return append_visit(data_dict, path=path)
+
+def save_patient_data(data_dict, clinic=None):
+    clinic = clinic or current_clinic()
     try:
-        client = connect_to_gsheet()
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet(PATIENTS_SHEET_NAME)
+        worksheet = _open_worksheet(PATIENTS_SHEET_NAME, clinic)
         
         hn_val = str(data_dict['hn']).strip()
         
@@ -142,25 +519,22 @@ def save_patient_data(data_dict):
         
         worksheet.append_row(row, value_input_option='USER_ENTERED')
         
-        load_data_staff.clear()
-        load_data_fast.clear()
+        _data_changed(PATIENTS_SHEET_NAME, [hn_val], clinic=clinic)
         return True
 
     except Exception as e:
         st.error(f"Save Patient Error: {e}")
         return False
 
-def update_patient_status(hn, new_status):
-    client = connect_to_gsheet()
-    sh = client.open_by_key(SHEET_ID)
-    worksheet = sh.worksheet("patients")
+def update_patient_status(hn, new_status, clinic=None):
+    clinic = clinic or current_clinic()
+    worksheet = _open_worksheet(PATIENTS_SHEET_NAME, clinic)
     
     try:
         cell = worksheet.find(str(hn))
         if cell:
             worksheet.update_cell(cell.row, 8, new_status)
-            load_data_staff.clear()
-            load_data_fast.clear()
+            _data_changed(PATIENTS_SHEET_NAME, [str(hn)], clinic=clinic)
             return True
         else:
             return False
@@ -168,73 +542,110 @@ def update_patient_status(hn, new_status):
         st.error(f"Update Status Error: {e}")
         return False
 
-def update_patient_token(hn, token):
-    client = connect_to_gsheet()
-    sh = client.open_by_key(SHEET_ID)
-    worksheet = sh.worksheet("patients")
-    
-    try:
-        header_cell = worksheet.cell(1, 9)
-        if header_cell.value != "public_token":
-            worksheet.update_cell(1, 9, "public_token")
+def missing_token_mask(patients_df):
+    if 'public_token' not in patients_df.columns:
+        return pd.Series(True, index=patients_df.index)
+    tokens = patients_df['public_token'].fillna('').astype(str).str.strip()
+    return (tokens == '') | (tokens.str.lower() == 'nan')
 
-        cell = worksheet.find(str(hn))
-        if cell:
-            worksheet.update_cell(cell.row, 9, token)
-            load_data_staff.clear()
-            load_data_fast.clear()
-            return True
+# HN ที่หาแถวใน Sheet ไม่เจอ ต่อคลินิก: clinic -> (รุ่นข้อมูลผู้ป่วย, set ของ HN)
+# -> ไม่อ่านคอลัมน์ A ซ้ำทุก Rerun จนกว่าข้อมูลผู้ป่วยจะเปลี่ยน
+_UNPROVISIONED = {}
+_UNPROVISIONED_LOCK = threading.Lock()
+
+def provision_public_tokens(patients_df, clinic=None):
+    """
+    สร้าง Public Token ให้ผู้ป่วยทุกคนที่ยังไม่มี แล้วเขียนลง Sheet ด้วย Request เดียว
+    คืนค่า (DataFrame ที่เติม Token แล้ว, จำนวนที่สร้างใหม่) -> ไม่ต้องโหลดข้อมูลใหม่
+    """
+    missing = missing_token_mask(patients_df)
+    if not missing.any():
+        return patients_df, 0
+
+    clinic = clinic or current_clinic()
+    version = frame_version(patients_df, ['hn', 'public_token'])
+    with _UNPROVISIONED_LOCK:
+        skipped = _UNPROVISIONED.get(clinic)
+    if skipped and skipped[0] == version:
+        missing = missing & ~patients_df['hn'].astype(str).isin(skipped[1])
+        if not missing.any():
+            return patients_df, 0
+
+    worksheet = _open_worksheet(PATIENTS_SHEET_NAME, clinic)
+
+    # หาแถวจริงใน Sheet จาก HN (อ่านคอลัมน์เดียว) แทนการเดาจากตำแหน่งใน DataFrame
+    sheet_hns = pd.Series(worksheet.col_values(1)[1:], dtype=object).astype(str).str.split('.').str[0].str.strip().str.zfill(7)
+    row_of = {hn: i + 2 for i, hn in reversed(list(enumerate(sheet_hns)))}
+
+    new_tokens = {}
+    cells = []
+    if 'public_token' not in patients_df.columns:
+        cells.append(gspread.Cell(1, 9, "public_token"))
+    not_found = set()
+    for hn in patients_df.loc[missing, 'hn'].astype(str).unique():
+        if hn in row_of:
+            new_tokens[hn] = str(uuid.uuid4())
+            cells.append(gspread.Cell(row_of[hn], 9, new_tokens[hn]))
         else:
-            return False
-    except Exception as e:
-        st.error(f"Update Token Error: {e}")
-        return False
+            not_found.add(hn)
+    with _UNPROVISIONED_LOCK:
+        _UNPROVISIONED[clinic] = (version, not_found)
 
-def save_multiple_visits(rows_list):
-    client = connect_to_gsheet()
-    sh = client.open_by_key(SHEET_ID)
-    worksheet = sh.worksheet("visits")
-    
-    data_to_append = []
-    for data in rows_list:
-        row = [
-            str(data["hn"]), 
-            data["date"], 
-            data["pefr"],
-            data["control_level"], 
-            data["controller"], 
-            data["reliever"],
-            data["adherence"], 
-            data["drp"], 
-            data["advice"],
-            data["technique_check"], 
-            data["next_appt"], 
-            data["note"], 
-            data["is_new_case"],
-            data.get("inhaler_eval", "-")
-        ]
-        data_to_append.append(row)
-    
-    if data_to_append:
-        worksheet.append_rows(data_to_append)
-        load_data_staff.clear()
-        load_data_fast.clear()
+    if not new_tokens:
+        return patients_df, 0
+
+    worksheet.update_cells(cells)
+    _data_changed(PATIENTS_SHEET_NAME, new_tokens.keys(), clinic=clinic)
+
+    patients_df = patients_df.copy()
+    current = patients_df['public_token'] if 'public_token' in patients_df.columns else pd.Series('', index=patients_df.index)
+    patients_df['public_token'] = current.where(~missing, patients_df['hn'].map(new_tokens)).fillna('')
+    return patients_df, len(new_tokens)
+
+def save_multiple_visits(rows_list, clinic=None):
+    _visit_queue(clinic or current_clinic()).submit([_visit_row(data) for data in rows_list])
 
-def update_appointments_batch(updates_list):
+def _visit_keys(hn_values, date_values):
+    # Key (hn 7 หลัก, วันที่ YYYY-MM-DD) ของแต่ละแถวใน Sheet
+    hns = pd.Series(hn_values, dtype=object).astype(str).str.split('.').str[0].str.strip().str.zfill(7)
+    dates = normalize_hosxp_dates(pd.Series(date_values, dtype=object))[0]
+    return list(zip(hns, dates))
+
+def update_appointments_batch(updates_list, clinic=None):
+    """
+    อัปเดตวันนัดตามตำแหน่งแถว โดยตรวจก่อนว่าแถวนั้นยังเป็น (hn, วันที่) เดิม
+    ถ้าแถวเลื่อนไป -> ย้ายไปแถวที่ถูกต้อง, ถ้าหาไม่เจอ -> ข้าม (ไม่เขียนทับแถวของคนอื่น)
+    """
+    summary = {'updated': 0, 'relocated': 0, 'stale': []}
     if not updates_list:
-        return
+        return summary
+
+    clinic = clinic or current_clinic()
+    worksheet = _open_worksheet(VISITS_SHEET_NAME, clinic)
+
+    # ไม่ให้มีการเพิ่มแถวใหม่แทรกระหว่างตรวจตำแหน่ง -> เขียน
+    with _visit_queue(clinic).exclusive():
+        if all('hn' in item and 'date' in item for item in updates_list):
+            sheet_rows = worksheet.get('A2:B')
+            sheet_keys = _visit_keys(
+                [r[0] if len(r) > 0 else '' for r in sheet_rows],
+                [r[1] if len(r) > 1 else None for r in sheet_rows],
+            )
+            updates, stale, relocated = resolve_row_positions(
+                updates_list, sheet_keys,
+                key_fn=lambda item: _visit_keys([item['hn']], [item['date']])[0]
+            )
+            summary['stale'] = stale
+            summary['relocated'] = relocated
+        else:
+            updates = updates_list
+
+        cells_to_update = [gspread.Cell(item['row'], 11, item['value']) for item in updates]
+        if cells_to_update:
+            worksheet.update_cells(cells_to_update)
+            summary['updated'] = len(cells_to_update)
 
-    client = connect_to_gsheet()
-    sh = client.open_by_key(SHEET_ID)
-    worksheet = sh.worksheet("visits")
-    
-    cells_to_update = []
-    for item in updates_list:
-        cells_to_update.append(
-            gspread.Cell(item['row'], 11, item['value'])
-        )
-    
     if cells_to_update:
-        worksheet.update_cells(cells_to_update)
-        load_data_staff.clear()
-        load_data_fast.clear()
+        hns = {str(item['hn']) for item in updates} if all('hn' in item for item in updates) else None
+        _data_changed(VISITS_SHEET_NAME, hns, clinic=clinic)
+    return summary
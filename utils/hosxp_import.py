@@ -0,0 +1,338 @@
+import hashlib
+
+import pandas as pd
+
+# ==========================================
+# 📥 HOSxP IMPORT HELPERS
+# ==========================================
+
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_SERIAL_RANGE = (1, 2958465)   # 1900-01-01 ถึง 9999-12-31
+BUDDHIST_ERA_OFFSET = 543
+
+# วัน/เดือน/ปี (รองรับทั้ง / และ -) เช่น 19/01/2026, 19-01-2569, 19/01/2026 08:30
+_DMY_PATTERN = r'^(?P<day>\d{1,2})[/-](?P<month>\d{1,2})[/-](?P<year>\d{4})(?:\D.*)?$'
+# ปี-เดือน-วัน (ISO) เช่น 2026-01-19, 2026-01-19 00:00:00
+_YMD_PATTERN = r'^(?P<year>\d{4})[/-](?P<month>\d{1,2})[/-](?P<day>\d{1,2})(?:\D.*)?$'
+
+def _parts_to_dates(parts):
+    year = pd.to_numeric(parts['year'], errors='coerce')
+    # ปี พ.ศ. -> ค.ศ.
+    year = year.where(year < 2400, year - BUDDHIST_ERA_OFFSET)
+    return pd.to_datetime(
+        pd.DataFrame({
+            'year': year,
+            'month': pd.to_numeric(parts['month'], errors='coerce'),
+            'day': pd.to_numeric(parts['day'], errors='coerce'),
+        }),
+        errors='coerce'
+    )
+
+def _parse_date_values(values):
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    text = values.astype(object).where(values.notna(), '').astype(str).str.strip()
+    blank = text.isin(['', '-', 'nan', 'NaT', 'None'])
+
+    # 1. Excel Serial (เช่น 45958 หรือ 45958.0)
+    serial = pd.to_numeric(values.where(~blank), errors='coerce')
+    is_serial = serial.between(*EXCEL_SERIAL_RANGE)
+    if is_serial.any():
+        result[is_serial] = EXCEL_EPOCH + pd.to_timedelta(serial[is_serial], unit='D')
+
+    # 2. Text (วัน/เดือน/ปี หรือ ISO) รวมถึงปี พ.ศ.
+    pending = ~blank & ~is_serial
+    if pending.any():
+        sub = text[pending]
+        dmy = sub.str.extract(_DMY_PATTERN)
+        ymd = sub.str.extract(_YMD_PATTERN)
+        parts = dmy.where(dmy['year'].notna(), ymd)
+        result[pending] = _parts_to_dates(parts)
+
+    return result, blank
+
+def normalize_hosxp_dates(values):
+    """
+    แปลงคอลัมน์วันที่จาก HOSxP เป็น 'YYYY-MM-DD' ในรอบเดียว (ไม่วนทีละแถว)
+    คืนค่า (Series วันที่ หรือ None, DataFrame รายงานแถวที่แปลงไม่ได้)
+    """
+    values = pd.Series(values)
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        result = values.dt.tz_localize(None) if values.dt.tz is not None else values
+        blank = values.isna()
+    else:
+        # ไฟล์ส่งออกมีวันที่ซ้ำกันมาก -> แปลงเฉพาะค่าที่ไม่ซ้ำ แล้วกระจายกลับ
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        parsed, parsed_blank = _parse_date_values(pd.Series(uniques, dtype=object))
+        parsed = pd.concat([parsed, pd.Series([pd.NaT], dtype='datetime64[ns]')], ignore_index=True)
+        parsed_blank = pd.concat([parsed_blank, pd.Series([True])], ignore_index=True)
+        result = pd.Series(parsed.to_numpy()[codes], index=values.index)
+        blank = pd.Series(parsed_blank.to_numpy()[codes], index=values.index)
+
+    result = result.dt.normalize()
+    failed = result.isna() & ~blank
+
+    dates = result.dt.strftime('%Y-%m-%d').astype(object).where(result.notna(), None)
+    errors = pd.DataFrame({
+        'row': values.index[failed],
+        'value': values[failed].astype(str).to_numpy(),
+        'reason': 'รูปแบบวันที่ไม่ถูกต้อง',
+    })
+    return dates, errors
+
+# ==========================================
+# 📄 STREAMING READER (อ่านไฟล์ทีละ Chunk)
+# ==========================================
+
+REQUIRED_COLUMNS = ['HN', 'วันที่รับบริการ', 'วันนัดถัดไป']
+IMPORT_CHUNK_SIZE = 5000
+SNIFF_SAMPLE_BYTES = 64 * 1024
+CANDIDATE_DELIMITERS = [',', '\t', ';', '|']
+
+def sniff_csv_format(sample):
+    """
+    เดา Encoding และตัวคั่นจากตัวอย่างต้นไฟล์ (ทำครั้งเดียว ไม่ต้องอ่านทั้งไฟล์ซ้ำ)
+    """
+    # 1. Encoding: ดูจาก BOM ก่อน
+    if sample.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8-sig'
+    elif sample.startswith((b'\xff\xfe', b'\xfe\xff')):
+        encoding = 'utf-16'
+    elif sample[1:200:2].count(0) > 50:
+        encoding = 'utf-16le'
+    elif sample[0:200:2].count(0) > 50:
+        encoding = 'utf-16be'
+    else:
+        # ตัดตัวอย่างที่บรรทัดสุดท้าย เพื่อไม่ให้ตัวอักษรหลายไบต์ขาดกลาง
+        cut = sample.rfind(b'\n')
+        probe = sample[:cut] if cut > 0 else sample
+        try:
+            probe.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'cp874'  # ครอบคลุม TIS-620
+
+    # 2. ตัวคั่น: นับจากบรรทัด Header
+    text = sample.decode(encoding, errors='ignore')
+    header = text.lstrip('\ufeff').splitlines()[0] if text.strip() else ''
+    counts = {d: header.count(d) for d in CANDIDATE_DELIMITERS}
+    delimiter = max(counts, key=counts.get) if any(counts.values()) else ','
+    return encoding, delimiter
+
+def file_content_hash(file_obj, block_size=1024 * 1024):
+    # Hash เนื้อหาไฟล์ (ใช้เป็น Key ของ Cache / ตรวจไฟล์ซ้ำ)
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(block_size), b''):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+def read_hosxp_chunks(file_obj, file_name, chunksize=IMPORT_CHUNK_SIZE):
+    """
+    อ่านไฟล์ HOSxP ทีละ Chunk (C engine) -> คืนค่า (iterator ของ DataFrame, encoding, delimiter)
+    """
+    if file_name.lower().endswith('.xlsx'):
+        # ไฟล์ Excel จริงต้องอ่านทั้งไฟล์ แล้วแบ่งเป็นช่วงๆ
+        df = pd.read_excel(file_obj, dtype=object)
+        df.columns = df.columns.astype(str).str.strip()
+        return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize)), None, None
+
+    file_obj.seek(0)
+    sample = file_obj.read(SNIFF_SAMPLE_BYTES)
+    file_obj.seek(0)
+    encoding, delimiter = sniff_csv_format(sample)
+
+    reader = pd.read_csv(
+        file_obj, sep=delimiter, encoding=encoding, engine='c',
+        chunksize=chunksize, dtype=str, skipinitialspace=True
+    )
+
+    def _iter():
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip().str.lstrip('\ufeff')
+            yield chunk
+
+    return _iter(), encoding, delimiter
+
+def clean_hosxp_chunk(chunk):
+    """
+    แปลง HN เป็น 7 หลัก + แปลงวันที่ -> คืนค่า (DataFrame ที่เหลือเฉพาะคอลัมน์ที่ใช้, รายงานวันที่ผิดพลาด)
+    """
+    out = pd.DataFrame(index=chunk.index)
+    out['HN_clean'] = chunk['HN'].astype(str).str.split('.').str[0].str.strip().str.zfill(7)
+    out['visit_date'], visit_errors = normalize_hosxp_dates(chunk['วันที่รับบริการ'])
+    out['next_appt_date'], appt_errors = normalize_hosxp_dates(chunk['วันนัดถัดไป'])
+
+    date_errors = pd.concat([
+        visit_errors.assign(column='วันที่รับบริการ'),
+        appt_errors.assign(column='วันนัดถัดไป'),
+    ], ignore_index=True)
+    if not date_errors.empty:
+        date_errors['HN'] = out.loc[date_errors['row'], 'HN_clean'].to_numpy()
+    return out, date_errors
+
+def match_patients(cleaned, patients_db):
+    # เก็บเฉพาะแถวที่มี HN อยู่ในทะเบียนผู้ป่วย
+    matched = cleaned[cleaned['HN_clean'].isin(patients_db['hn'])]
+    return pd.merge(
+        matched, patients_db[['hn', 'first_name', 'last_name']].drop_duplicates('hn'),
+        left_on='HN_clean', right_on='hn', how='left'
+    )
+
+def stream_hosxp_file(file_obj, file_name, patients_db, chunksize=IMPORT_CHUNK_SIZE, progress_callback=None):
+    """
+    อ่าน + ทำความสะอาด + จับคู่ผู้ป่วย ทีละ Chunk (หน่วยความจำคงที่ตามขนาด Chunk)
+    """
+    chunks, encoding, delimiter = read_hosxp_chunks(file_obj, file_name, chunksize=chunksize)
+    total_size = getattr(file_obj, 'size', None)
+
+    matched_parts, error_parts = [], []
+    total_rows = 0
+    sample_hns = []
+
+    for chunk in chunks:
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+        if missing_cols:
+            return {'missing_cols': missing_cols, 'columns': list(chunk.columns)}
+
+        # เลขแถวให้ต่อเนื่องทั้งไฟล์ (สำหรับรายงานข้อผิดพลาด)
+        chunk.index = pd.RangeIndex(total_rows, total_rows + len(chunk))
+        cleaned, date_errors = clean_hosxp_chunk(chunk)
+        if not sample_hns:
+            sample_hns = cleaned['HN_clean'].head().tolist()
+
+        matched_parts.append(match_patients(cleaned, patients_db))
+        if not date_errors.empty:
+            error_parts.append(date_errors)
+        total_rows += len(chunk)
+
+        if progress_callback:
+            position = file_obj.tell() if total_size else None
+            progress_callback(total_rows, min(position / total_size, 1.0) if position else None)
+
+    matched = pd.concat(matched_parts, ignore_index=True) if matched_parts else pd.DataFrame(
+        columns=['HN_clean', 'visit_date', 'next_appt_date', 'hn', 'first_name', 'last_name'])
+    date_errors = pd.concat(error_parts, ignore_index=True) if error_parts else pd.DataFrame(
+        columns=['row', 'value', 'reason', 'column', 'HN'])
+
+    return {
+        'missing_cols': [],
+        'matched': matched,
+        'date_errors': date_errors,
+        'total_rows': total_rows,
+        'sample_hns': sample_hns,
+        'encoding': encoding,
+        'delimiter': delimiter,
+    }
+
+# ==========================================
+# 🔀 DIFF ENGINE (จัดประเภทแถวนำเข้า: ใหม่ / อัปเดตวันนัด / ไม่เปลี่ยน)
+# ==========================================
+
+IMPORT_ACTIONS = {
+    'new': "🟢 เพิ่มใหม่",
+    'update': "🟡 อัปเดตวันนัด",
+    'unchanged': "⚪ ไม่เปลี่ยนแปลง",
+    'duplicate': "⚪ ซ้ำในไฟล์",
+    'skipped': "⛔ ไม่มีวันที่รับบริการ",
+}
+
+def build_import_visit(hn, visit_date, next_appt_date):
+    return {
+        "hn": hn,
+        "date": visit_date,
+        "pefr": 0, 
+        "control_level": "-",
+        "controller": "-",
+        "reliever": "-",
+        "adherence": 0,
+        "drp": "-",
+        "advice": "Imported from HOSxP",
+        "technique_check": "-",
+        "next_appt": next_appt_date if next_appt_date else "-",
+        "note": "นำเข้าจาก HOSxP",
+        "is_new_case": "FALSE",
+        "inhaler_eval": "-"
+    }
+
+def diff_import(matched_df, visits_db):
+    """
+    เทียบข้อมูลนำเข้ากับ Visit เดิมด้วย Merge (ไม่วน iterrows)
+    คืนค่า dict: report (ทุกแถว + action), new_visits, appointment_updates
+    """
+    incoming = matched_df[['hn', 'first_name', 'last_name', 'visit_date', 'next_appt_date']].reset_index(drop=True)
+    incoming['action'] = None
+
+    no_date = incoming['visit_date'].isna()
+    incoming.loc[no_date, 'action'] = 'skipped'
+
+    # แถว (hn, วันที่) ซ้ำกันในไฟล์ -> ใช้แถวสุดท้ายที่มีวันนัด (ถ้าไม่มีเลยใช้แถวสุดท้าย)
+    ranked = incoming[~no_date].assign(_has_appt=incoming['next_appt_date'].notna())
+    ranked = ranked.sort_values('_has_appt', kind='mergesort')
+    dup_idx = ranked.index[ranked.duplicated(['hn', 'visit_date'], keep='last')]
+    incoming.loc[dup_idx, 'action'] = 'duplicate'
+
+    # Visit เดิม: แปลงวันที่เป็น YYYY-MM-DD + ตำแหน่งแถวใน Sheet (Header=1 + 0-based = +2)
+    if not visits_db.empty:
+        existing = pd.DataFrame({
+            'hn': visits_db['hn'].astype(str).str.strip().to_numpy(),
+            'visit_date': normalize_hosxp_dates(visits_db['date'].reset_index(drop=True))[0].to_numpy(),
+            'existing_next_appt': normalize_hosxp_dates(visits_db['next_appt'].reset_index(drop=True))[0].to_numpy()
+                if 'next_appt' in visits_db.columns else None,
+            'sheet_row': range(2, len(visits_db) + 2),
+        })
+        existing = existing.dropna(subset=['visit_date']).drop_duplicates(['hn', 'visit_date'], keep='last')
+    else:
+        existing = pd.DataFrame(columns=['hn', 'visit_date', 'existing_next_appt', 'sheet_row'])
+
+    pending = incoming['action'].isna()
+    merged = pd.merge(
+        incoming[pending].reset_index(), existing,
+        on=['hn', 'visit_date'], how='left', indicator=True
+    ).set_index('index')
+
+    found = merged['_merge'] == 'both'
+    has_appt = merged['next_appt_date'].notna()
+    changed = merged['next_appt_date'] != merged['existing_next_appt']
+
+    merged['action'] = 'unchanged'
+    merged.loc[~found, 'action'] = 'new'
+    merged.loc[found & has_appt & changed, 'action'] = 'update'
+
+    incoming.loc[merged.index, 'action'] = merged['action']
+    incoming['existing_next_appt'] = merged['existing_next_appt'].reindex(incoming.index)
+    incoming['sheet_row'] = merged['sheet_row'].reindex(incoming.index)
+
+    new_rows = incoming[incoming['action'] == 'new']
+    new_visits = [
+        build_import_visit(hn, visit_date, next_appt)
+        for hn, visit_date, next_appt in zip(new_rows['hn'], new_rows['visit_date'], new_rows['next_appt_date'])
+    ]
+
+    update_rows = incoming[incoming['action'] == 'update']
+    appointment_updates = [
+        {'row': int(row), 'value': value, 'hn': hn, 'date': visit_date}
+        for row, value, hn, visit_date in zip(
+            update_rows['sheet_row'], update_rows['next_appt_date'], update_rows['hn'], update_rows['visit_date']
+        )
+    ]
+
+    return {
+        'report': incoming,
+        'new_visits': new_visits,
+        'appointment_updates': appointment_updates,
+        'counts': incoming['action'].value_counts().to_dict(),
+    }
+
+def applied_import_rows(report, stale_updates=()):
+    """
+    แถวจาก report ของ diff_import ที่มีผลใน Sheet แล้ว (เพิ่มใหม่ / อัปเดตสำเร็จ / ตรงกับของเดิม) สำหรับบันทึกลง Ledger
+    stale_updates = รายการที่ update_appointments_batch ข้าม -> ไม่บันทึก (นำเข้าอีกครั้งจะลองใหม่)
+    """
+    applied = report[report['action'].isin(['new', 'update', 'unchanged'])]
+    if len(stale_updates):
+        stale = {(u['hn'], u['date'], u['value']) for u in stale_updates}
+        keys = zip(applied['hn'], applied['visit_date'], applied['next_appt_date'])
+        applied = applied[[key not in stale for key in keys]]
+    return applied
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from utils.clinics import clinic_path
+
+# ==========================================
+# 📒 IMPORT LEDGER
+# บันทึกไฟล์และแถวที่เคยนำเข้าแล้ว (hn, วันที่รับบริการ, วันนัดถัดไป)
+# เพื่อข้ามแถวที่เคยเห็น และปฏิเสธไฟล์เดิมซ้ำได้ทันที
+# แต่ละคลินิกมีไฟล์ Ledger ของตัวเอง (path = None -> ไฟล์ของคลินิกปัจจุบัน)
+# ==========================================
+
+IMPORT_LEDGER_PATH = os.environ.get(
+    "IMPORT_LEDGER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "import_ledger.sqlite")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS imports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_hash TEXT UNIQUE NOT NULL,
+    file_name TEXT,
+    imported_at TEXT NOT NULL,
+    user TEXT,
+    total_rows INTEGER DEFAULT 0,
+    new_count INTEGER DEFAULT 0,
+    update_count INTEGER DEFAULT 0,
+    skipped_known INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS import_rows (
+    hn TEXT NOT NULL,
+    visit_date TEXT NOT NULL,
+    next_appt TEXT NOT NULL,
+    import_id INTEGER NOT NULL,
+    PRIMARY KEY (hn, visit_date, next_appt)
+);
+"""
+
+@contextmanager
+def _connect(path=None):
+    path = path or clinic_path(IMPORT_LEDGER_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.executescript(_SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _fingerprints(df):
+    return pd.DataFrame({
+        'hn': df['hn'].astype(str).to_numpy(),
+        'visit_date': df['visit_date'].astype(object).where(df['visit_date'].notna(), '').to_numpy(),
+        'next_appt': df['next_appt_date'].astype(object).where(df['next_appt_date'].notna(), '').to_numpy(),
+    })
+
+def find_imported_file(file_hash, path=None):
+    """
+    คืนค่า dict ของการนำเข้าครั้งก่อน ถ้าไฟล์นี้ (Hash เดียวกัน) เคยนำเข้าแล้ว
+    """
+    with _connect(path) as conn:
+        row = conn.execute(
+            "SELECT id, file_name, imported_at, user, total_rows, new_count, update_count "
+            "FROM imports WHERE file_hash = ?", (file_hash,)
+        ).fetchone()
+    if row is None:
+        return None
+    keys = ['id', 'file_name', 'imported_at', 'user', 'total_rows', 'new_count', 'update_count']
+    return dict(zip(keys, row))
+
+def filter_known_rows(matched_df, path=None):
+    """
+    ตัดแถวที่เคยนำเข้าแล้ว (hn, วันที่, วันนัด ตรงกันทุกค่า) -> คืนค่า (แถวที่ยังไม่เคยเห็น, จำนวนที่ข้าม)
+    """
+    if matched_df.empty:
+        return matched_df, 0
+
+    fp = _fingerprints(matched_df)
+    with _connect(path) as conn:
+        conn.execute("CREATE TEMP TABLE incoming (pos INTEGER, hn TEXT, visit_date TEXT, next_appt TEXT)")
+        conn.executemany(
+            "INSERT INTO incoming VALUES (?, ?, ?, ?)",
+            zip(range(len(fp)), fp['hn'], fp['visit_date'], fp['next_appt'])
+        )
+        known_pos = [r[0] for r in conn.execute(
+            "SELECT i.pos FROM incoming i JOIN import_rows r "
+            "ON r.hn = i.hn AND r.visit_date = i.visit_date AND r.next_appt = i.next_appt"
+        )]
+
+    if not known_pos:
+        return matched_df, 0
+    keep = pd.Series(True, index=range(len(matched_df)))
+    keep[known_pos] = False
+    return matched_df[keep.to_numpy()], len(known_pos)
+
+def record_import(file_hash, file_name, applied_df, counts=None, user="Admin", path=None):
+    """
+    บันทึกไฟล์และแถวที่นำเข้าสำเร็จลง Ledger
+    """
+    counts = counts or {}
+    fp = _fingerprints(applied_df[applied_df['visit_date'].notna()]) if not applied_df.empty else None
+
+    with _connect(path) as conn:
+        # ไฟล์เดิมนำเข้าซ้ำ (นำเข้าใหม่ทั้งหมด / --no-ledger) -> อัปเดตแถวเดิม คง id เดิมไว้
+        # (REPLACE = ลบแล้วเพิ่มใหม่ได้ id ใหม่ -> import_rows ที่ชี้ id เดิมหลุดจากประวัติ)
+        conn.execute(
+            "INSERT INTO imports "
+            "(file_hash, file_name, imported_at, user, total_rows, new_count, update_count, skipped_known) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(file_hash) DO UPDATE SET file_name = excluded.file_name, "
+            "imported_at = excluded.imported_at, user = excluded.user, total_rows = excluded.total_rows, "
+            "new_count = excluded.new_count, update_count = excluded.update_count, "
+            "skipped_known = excluded.skipped_known",
+            (
+                file_hash, file_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user,
+                int(counts.get('total_rows', 0)), int(counts.get('new', 0)),
+                int(counts.get('update', 0)), int(counts.get('skipped_known', 0)),
+            )
+        )
+        import_id = conn.execute("SELECT id FROM imports WHERE file_hash = ?", (file_hash,)).fetchone()[0]
+        if fp is not None and not fp.empty:
+            # แถวที่เคยบันทึกจากการนำเข้าครั้งก่อน -> ชี้ไปที่การนำเข้าล่าสุด
+            conn.executemany(
+                "INSERT INTO import_rows (hn, visit_date, next_appt, import_id) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hn, visit_date, next_appt) DO UPDATE SET import_id = excluded.import_id",
+                zip(fp['hn'], fp['visit_date'], fp['next_appt'], [import_id] * len(fp))
+            )
+    return import_id
+
+def import_history(limit=50, path=None):
+    with _connect(path) as conn:
+        return pd.read_sql_query(
+            "SELECT imported_at, file_name, user, total_rows, new_count, update_count, skipped_known, file_hash "
+            "FROM imports ORDER BY id DESC LIMIT ?", conn, params=(limit,)
+        )
+
+def imported_rows_for(hn, path=None):
+    with _connect(path) as conn:
+        return pd.read_sql_query(
+            "SELECT r.hn, r.visit_date, r.next_appt, i.imported_at, i.file_name "
+            "FROM import_rows r JOIN imports i ON i.id = r.import_id "
+            "WHERE r.hn = ? ORDER BY r.visit_date DESC", conn, params=(str(hn),)
+        )
@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from utils.synthetic_data import SCALES, make_clinic
+
+# ==========================================
+# 🚦 LOAD TEST
+# จำลองผู้ป่วยหลายคนสแกน QR (?token=) + เจ้าหน้าที่ใช้งานพร้อมกัน กับ Sheets จำลองในเครื่อง
+# รัน app.py จริงผ่าน streamlit.testing (1 Process = 1 Replica, ทุก Session ใช้ Cache ร่วมกัน)
+#   python -m utils.load_test --scale 10k --patients 200 --staff 5 --concurrency 20
+# ==========================================
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(PROJECT_ROOT, "app.py")
+LOADTEST_DIR = os.path.join(PROJECT_ROOT, "data", "loadtests")
+LOADTEST_PASSWORD = "load-test"
+RUN_TIMEOUT = 120            # วินาทีสูงสุดต่อ 1 Request
+MEMORY_SAMPLE_SESSIONS = 20  # จำนวน Session ที่ใช้วัดหน่วยความจำ
+PERCENTILES = (50, 90, 95, 99)
+SESSION_KIND_KEY = "_load_test_kind"
+
+def _session_tag():
+    # แยกว่าการเรียก Sheets มาจาก Session แบบไหน (ไม่มี ScriptRunContext = Thread เบื้องหลัง)
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return "background"
+    try:
+        return ctx.session_state[SESSION_KIND_KEY]
+    except KeyError:
+        return "unknown"
+
+def _install_secrets(base_url):
+    # ตั้ง Secrets ครั้งเดียวทั้ง Process (AppTest สลับ st.secrets ทุกครั้งที่ run ซึ่งไม่ปลอดภัยเมื่อรันพร้อมกัน)
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+    secrets = Secrets()
+    secrets._secrets = {"admin_password": LOADTEST_PASSWORD, "deploy_url": base_url}
+    st.secrets = secrets
+
+def _share_runtime():
+    # AppTest สร้าง Runtime จำลองใหม่ทุกครั้งที่ run แล้วตั้งกลับเป็น None เมื่อจบ
+    # ซึ่งทำให้ Session อื่นที่รันพร้อมกันพัง -> ให้ทุก Session ใช้ Runtime จำลองตัวเดียวกันทั้ง Process
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.components.v2.component_manager import BidiComponentManager
+
+    if getattr(Runtime, "_load_test_shared", None) is not None:
+        return
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    components = BidiComponentManager()
+    components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = components
+    Runtime._load_test_shared = runtime
+    Runtime.instance = classmethod(lambda cls: cls._load_test_shared)
+    Runtime.exists = classmethod(lambda cls: True)
+
+def _new_session(kind, query_params=None):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    at.session_state[SESSION_KIND_KEY] = kind
+    for key, value in (query_params or {}).items():
+        at.query_params[key] = value
+    return at
+
+def _timed_run(at, action=None):
+    started = time.perf_counter()
+    if action:
+        action(at)
+    at.run()
+    elapsed = time.perf_counter() - started
+    error = None
+    if len(at.exception):
+        error = at.exception[0].value
+    return elapsed, error
+
+# --- Session จำลอง ---
+def patient_session(token, reloads=1):
+    """
+    ผู้ป่วย 1 คน: เปิดลิงก์จาก QR (+ Reload ตามจำนวนที่กำหนด) -> list ของ (วินาที, error, พบผู้ป่วยหรือไม่)
+    """
+    at = _new_session("patient", {"token": token})
+    results = []
+    for _ in range(reloads):
+        elapsed, error = _timed_run(at)
+        found = not any("Invalid or Expired Token" in e.value for e in at.error)
+        results.append((elapsed, error, found))
+    return results
+
+def staff_session(requests, rng):
+    """
+    เจ้าหน้าที่ 1 คน: Login แล้วสลับเมนูแบบสุ่ม requests ครั้ง -> list ของ (วินาที, error, เมนู)
+    """
+    at = _new_session("staff")
+    results = []
+    elapsed, error = _timed_run(at)
+    results.append((elapsed, error, "login page"))
+
+    def login(app):
+        app.text_input[0].set_value(LOADTEST_PASSWORD)
+        app.button[0].click()
+    elapsed, error = _timed_run(at, login)
+    results.append((elapsed, error, "login"))
+    if error or not len(at.sidebar.radio):
+        return results
+
+    routes = list(at.sidebar.radio[0].options)
+    for route in rng.choice(routes, size=requests):
+        elapsed, error = _timed_run(at, lambda app, r=route: app.sidebar.radio[0].set_value(r))
+        results.append((elapsed, error, str(route)))
+    return results
+
+# --- สรุปผล ---
+def _latency_summary(samples, wall_seconds):
+    if not samples:
+        return {'requests': 0}
+    ms = np.array(samples) * 1000
+    summary = {'requests': len(samples), 'mean_ms': round(float(ms.mean()), 1), 'max_ms': round(float(ms.max()), 1)}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(float(np.percentile(ms, p)), 1)
+    if wall_seconds:
+        summary['throughput_rps'] = round(len(samples) / wall_seconds, 2)
+    return summary
+
+def _calls_summary(calls, kind, requests):
+    per_kind = {f"{sheet}.{method}": n for (tag, sheet, method), n in calls.items() if tag == kind}
+    total = sum(per_kind.values())
+    return {
+        'backend_calls': total,
+        'backend_calls_per_request': round(total / requests, 3) if requests else None,
+        'backend_calls_by_method': dict(sorted(per_kind.items())),
+    }
+
+def measure_session_memory(kind, tokens, rng, sessions=MEMORY_SAMPLE_SESSIONS, staff_requests=2):
+    """
+    หน่วยความจำเพิ่มต่อ 1 Session (วัดด้วย tracemalloc ขณะที่ Session ยังเปิดอยู่ทั้งหมด)
+    รวม session_state + หน้าเว็บล่าสุดของ Session (ไม่รวม Cache ที่ใช้ร่วมกัน ซึ่งโหลดไว้ก่อนวัด)
+    """
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        alive = []
+        for i in range(sessions):
+            if kind == "patient":
+                at = _new_session("patient", {"token": tokens[i % len(tokens)]})
+                at.run()
+            else:
+                at = _new_session("staff")
+                at.run()
+                at.text_input[0].set_value(LOADTEST_PASSWORD)
+                at.button[0].click()
+                at.run()
+                for _ in range(staff_requests):
+                    at.run()
+            alive.append(at)
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return round(used / sessions / 1024, 1)
+
+def run_load_test(scale='1k', patients=100, staff=0, concurrency=10, patient_reloads=1, staff_requests=5,
+                  invalid_token_rate=0.05, latency=0.0, seed=0, today=None, measure_memory=True, progress=None):
+    from utils.local_sheets import LocalSheetsClient
+    from utils.gsheet_handler import use_sheets_client
+    from utils.benchmark import _git_info
+
+    rng = np.random.default_rng(seed)
+    n_patients = SCALES[scale] if isinstance(scale, str) else int(scale)
+    clinic = make_clinic(n_patients, seed=seed, today=today)
+    client = LocalSheetsClient({'patients': clinic['patients'], 'visits': clinic['visits']},
+                               latency=latency, tag_fn=_session_tag)
+    use_sheets_client(client)
+    _install_secrets("http://localhost:8501")
+    _share_runtime()
+
+    tokens = clinic['patients']['public_token'].to_numpy()
+    scan_tokens = rng.choice(tokens, size=patients)
+    invalid = rng.random(patients) < invalid_token_rate
+    scan_tokens = np.where(invalid, [f"invalid-{i}" for i in range(patients)], scan_tokens)
+
+    # Warm-up: import โมดูล + โหลด Cache ครั้งแรก (ไม่นับในผล)
+    if progress:
+        progress("warm-up")
+    patient_session(str(tokens[0]))
+    if staff:
+        staff_session(1, rng)
+    client.reset_calls()
+
+    jobs = [("patient", str(t)) for t in scan_tokens] + [("staff", None)] * staff
+    order = rng.permutation(len(jobs))
+    samples = defaultdict(list)
+    errors = Counter()
+    outcomes = Counter()
+    routes = defaultdict(list)
+    lock = threading.Lock()
+
+    def run_job(job):
+        kind, token = job
+        session_rng = np.random.default_rng(rng.integers(1 << 32))
+        try:
+            if kind == "patient":
+                results = patient_session(token, reloads=patient_reloads)
+            else:
+                results = staff_session(staff_requests, session_rng)
+        except Exception as e:
+            with lock:
+                errors[f"{kind}: {type(e).__name__}: {e}"] += 1
+            return
+        with lock:
+            for elapsed, error, extra in results:
+                samples[kind].append(elapsed)
+                if error:
+                    errors[f"{kind}: {error}"] += 1
+                if kind == "patient":
+                    outcomes['found' if extra else 'invalid_token'] += 1
+                else:
+                    routes[extra].append(elapsed)
+
+    if progress:
+        progress(f"{patients} patient + {staff} staff sessions @ concurrency {concurrency}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_job, [jobs[i] for i in order]))
+    wall_seconds = time.perf_counter() - started
+    calls = client.reset_calls()
+
+    results = {}
+    for kind in ("patient", "staff"):
+        if samples[kind]:
+            results[kind] = {**_latency_summary(samples[kind], wall_seconds),
+                             **_calls_summary(calls, kind, len(samples[kind]))}
+    if 'patient' in results:
+        results['patient']['outcomes'] = dict(outcomes)
+    if 'staff' in results:
+        results['staff']['routes'] = {r: _latency_summary(v, None) for r, v in sorted(routes.items())}
+    results['background'] = _calls_summary(calls, "background", None)
+
+    memory = {}
+    if measure_memory:
+        if progress:
+            progress("memory per session")
+        memory['patient_kb_per_session'] = measure_session_memory("patient", tokens, rng)
+        if staff:
+            memory['staff_kb_per_session'] = measure_session_memory("staff", tokens, rng)
+
+    return {
+        'meta': {
+            **_git_info(),
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'scale': scale,
+            'sizes': {'patients': len(clinic['patients']), 'visits': len(clinic['visits'])},
+            'sessions': {'patient': patients, 'staff': staff},
+            'concurrency': concurrency,
+            'patient_reloads': patient_reloads,
+            'staff_requests': staff_requests,
+            'latency_s': latency,
+            'seed': seed,
+            'cpu_count': os.cpu_count(),
+        },
+        'wall_seconds': round(wall_seconds, 2),
+        'results': results,
+        'memory': memory,
+        'errors': dict(errors.most_common(20)),
+    }
+
+def compare_load_tests(current, baseline, threshold=0.2):
+    """
+    เทียบ p50/p95 และจำนวนการเรียก Sheets ต่อ Request -> list ของ (metric, ก่อน, หลัง, สัดส่วนที่เปลี่ยน)
+    """
+    rows = []
+    for kind in ("patient", "staff"):
+        cur, base = current['results'].get(kind), baseline.get('results', {}).get(kind)
+        if not cur or not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "backend_calls_per_request"):
+            if cur.get(metric) is None or not base.get(metric):
+                continue
+            change = cur[metric] / base[metric] - 1
+            rows.append((f"{kind}.{metric}", base[metric], cur[metric], round(change, 3), change > threshold))
+    for key, cur in current.get('memory', {}).items():
+        base = baseline.get('memory', {}).get(key)
+        if base:
+            change = cur / base - 1
+            rows.append((f"memory.{key}", base, cur, round(change, 3), change > threshold))
+    return rows
+
+def _print_report(report):
+    meta = report['meta']
+    print(f"=== Load Test {meta['scale']} @ {meta['commit']}{' (dirty)' if meta['dirty'] else ''} "
+          f"| ผู้ป่วย {meta['sessions']['patient']} + เจ้าหน้าที่ {meta['sessions']['staff']} Session "
+          f"| พร้อมกัน {meta['concurrency']} | {report['wall_seconds']}s ===")
+    for kind, info in report['results'].items():
+        if kind == "background":
+            print(f"  background: เรียก Sheets {info['backend_calls']} ครั้ง")
+            continue
+        pct = " ".join(f"p{p} {info[f'p{p}_ms']:.0f}" for p in PERCENTILES)
+        print(f"  {kind}: {info['requests']} req | {pct} | max {info['max_ms']:.0f} ms "
+              f"| {info['throughput_rps']} req/s | Sheets {info['backend_calls_per_request']} ครั้ง/req")
+        if kind == "patient":
+            print(f"    ผลลัพธ์: {info['outcomes']}")
+    for key, kb in report['memory'].items():
+        print(f"  memory {key}: {kb:,.1f} KB")
+    if report['errors']:
+        print("  ❌ Errors:")
+        for message, n in report['errors'].items():
+            print(f"    {n} x {message}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load Test หน้า QR ของผู้ป่วย + หน้าเจ้าหน้าที่ ด้วย Sheets จำลอง")
+    parser.add_argument("--scale", choices=list(SCALES), default='1k')
+    parser.add_argument("--patients", type=int, default=100, help="จำนวน Session ผู้ป่วย (สแกน QR)")
+    parser.add_argument("--staff", type=int, default=0, help="จำนวน Session เจ้าหน้าที่")
+    parser.add_argument("--concurrency", type=int, default=10, help="จำนวน Session ที่ทำงานพร้อมกัน")
+    parser.add_argument("--reloads", type=int, default=1, help="จำนวนครั้งที่ผู้ป่วยแต่ละคนเปิด/Reload หน้า")
+    parser.add_argument("--staff-requests", type=int, default=5, help="จำนวนครั้งที่เจ้าหน้าที่แต่ละคนสลับเมนู")
+    parser.add_argument("--invalid-rate", type=float, default=0.05, help="สัดส่วน Token ที่ไม่ถูกต้อง")
+    parser.add_argument("--latency", type=float, default=0.0, help="หน่วงเวลาต่อการเรียก Sheets จำลอง (วินาที)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", default=None, help="วันที่อ้างอิงของข้อมูลจำลอง (YYYY-MM-DD)")
+    parser.add_argument("--no-memory", action="store_true", help="ไม่วัดหน่วยความจำต่อ Session")
+    parser.add_argument("--output", default=None, help="ไฟล์ JSON ผลลัพธ์ (ค่าเริ่มต้น data/loadtests/)")
+    parser.add_argument("--compare", default=None, help="ไฟล์ JSON ผลครั้งก่อนที่จะเทียบ")
+    parser.add_argument("--fail-on-regression", action="store_true", help="จบด้วย exit 1 ถ้าช้าลง/เรียก Sheets มากขึ้นเกิน 20%%")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        scale=args.scale, patients=args.patients, staff=args.staff, concurrency=args.concurrency,
+        patient_reloads=args.reloads, staff_requests=args.staff_requests, invalid_token_rate=args.invalid_rate,
+        latency=args.latency, seed=args.seed, today=args.today, measure_memory=not args.no_memory,
+        progress=lambda msg: print(f"... {msg}", file=sys.stderr),
+    )
+
+    output = args.output or os.path.join(
+        LOADTEST_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}-{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    _print_report(report)
+    print(f"บันทึกผล: {output}")
+
+    exit_code = 1 if report['errors'] else 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"=== เทียบกับ {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}) ===")
+        rows = compare_load_tests(report, baseline)
+        for metric, before, after, change, regressed in rows:
+            print(f"  {'🔴' if regressed else '⚪'} {metric:<36} {before} -> {after} ({change:+.0%})")
+        if args.fail_on_regression and any(r[4] for r in rows):
+            exit_code = 1
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import gspread
+import pandas as pd
+
+# ==========================================
+# 🗄️ LOCAL SHEETS (ใช้แทน Google Sheets ในเครื่อง)
+# Client ที่มีเมธอดเท่าที่ gsheet_handler ใช้ เก็บข้อมูลในหน่วยความจำ (โหลดจากไฟล์ CSV ได้)
+# สำหรับ Benchmark / Load Test / เปิดแอปด้วยข้อมูลจำลอง:
+#   LOCAL_SHEETS_DIR=data/synthetic/10k streamlit run app.py
+# ==========================================
+
+def _numericise(value):
+    # เหมือน gspread.get_all_records(): ตัวเลขแปลงเป็น int/float, นอกนั้นเป็น str
+    if value == '':
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+def _parse_range(a1):
+    m = re.match(r'^([A-Z]+)(\d+)(?::([A-Z]+)(\d+)?)?$', a1)
+    if not m:
+        raise ValueError(f"Unsupported range: {a1}")
+    first_col, first_row = _col_index(m.group(1)), int(m.group(2))
+    last_col = _col_index(m.group(3)) if m.group(3) else first_col
+    last_row = int(m.group(4)) if m.group(4) else None
+    return first_row, first_col, last_row, last_col
+
+class LocalWorksheet:
+    def __init__(self, client, title, rows):
+        self._client = client
+        self.title = title
+        self._rows = rows     # list ของ list (แถวแรก = Header) ค่าทุกช่องเป็น str
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        self._client._record(self.title, method)
+
+    # --- อ่าน ---
+    def get_all_values(self):
+        self._call('get_all_values')
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def get_all_records(self):
+        self._call('get_all_records')
+        with self._lock:
+            if not self._rows:
+                return []
+            header = self._rows[0]
+            return [
+                dict(zip(header, [_numericise(v) for v in r] + [''] * (len(header) - len(r))))
+                for r in self._rows[1:]
+            ]
+
+    def row_values(self, row):
+        self._call('row_values')
+        with self._lock:
+            return list(self._rows[row - 1]) if row <= len(self._rows) else []
+
+    def col_values(self, col):
+        self._call('col_values')
+        with self._lock:
+            values = [r[col - 1] if len(r) >= col else '' for r in self._rows]
+        # Sheets ตัดค่าว่างท้ายคอลัมน์
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def _get_range(self, a1):
+        first_row, first_col, last_row, last_col = _parse_range(a1)
+        rows = self._rows[first_row - 1:last_row]
+        out = [r[first_col - 1:last_col] for r in rows]
+        for r in out:
+            while r and r[-1] == '':
+                r.pop()
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get(self, a1):
+        self._call('get')
+        with self._lock:
+            return self._get_range(a1)
+
+    def batch_get(self, ranges):
+        self._call('batch_get')
+        with self._lock:
+            return [self._get_range(a1) for a1 in ranges]
+
+    def cell(self, row, col):
+        self._call('cell')
+        with self._lock:
+            r = self._rows[row - 1] if row <= len(self._rows) else []
+            return gspread.Cell(row, col, r[col - 1] if len(r) >= col else '')
+
+    def find(self, query):
+        self._call('find')
+        with self._lock:
+            for i, r in enumerate(self._rows):
+                for j, v in enumerate(r):
+                    if v == str(query):
+                        return gspread.Cell(i + 1, j + 1, v)
+        return None
+
+    # --- เขียน ---
+    def append_row(self, values, **kwargs):
+        self._call('append_row')
+        with self._lock:
+            self._rows.append(['' if v is None else str(v) for v in values])
+
+    def append_rows(self, values, **kwargs):
+        self._call('append_rows')
+        with self._lock:
+            self._rows.extend(['' if v is None else str(v) for v in row] for row in values)
+
+    def update_cells(self, cells, **kwargs):
+        self._call('update_cells')
+        with self._lock:
+            for c in cells:
+                while len(self._rows) < c.row:
+                    self._rows.append([])
+                r = self._rows[c.row - 1]
+                while len(r) < c.col:
+                    r.append('')
+                r[c.col - 1] = '' if c.value is None else str(c.value)
+
+    def update_cell(self, row, col, value):
+        self.update_cells([gspread.Cell(row, col, value)])
+
+    def to_frame(self):
+        with self._lock:
+            if not self._rows:
+                return pd.DataFrame()
+            header = self._rows[0]
+            return pd.DataFrame([r + [''] * (len(header) - len(r)) for r in self._rows[1:]], columns=header)
+
+class LocalSpreadsheet:
+    def __init__(self, client):
+        self._client = client
+        self._sheets = {}
+
+    def worksheet(self, title):
+        self._client._record(title, 'worksheet')
+        if title not in self._sheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def add_worksheet(self, title, rows=0, cols=0):
+        self._sheets[title] = LocalWorksheet(self._client, title, [])
+        return self._sheets[title]
+
+    def worksheets(self):
+        return list(self._sheets.values())
+
+class LocalSheetsClient:
+    """
+    ใช้แทน gspread Client: ทุก Sheet ID เปิดได้ Spreadsheet เดียวกัน
+    (ยกเว้น ID ที่เพิ่มด้วย add_table(..., key=) -> Spreadsheet แยก เช่นทดสอบหลายคลินิก)
+    latency = วินาทีที่หน่วงต่อการเรียก 1 ครั้ง (จำลองความช้าของ Google Sheets API)
+    tag_fn = ฟังก์ชันคืนป้ายกำกับของผู้เรียก (เช่นชนิด Session) -> นับเป็น (tag, sheet, method) แทน
+    """
+
+    def __init__(self, tables=None, latency=0.0, tag_fn=None):
+        self.latency = latency
+        self.tag_fn = tag_fn
+        self.calls = Counter()    # (sheet, method) หรือ (tag, sheet, method) -> จำนวนครั้ง
+        self._calls_lock = threading.Lock()
+        self._spreadsheet = LocalSpreadsheet(self)
+        self._by_key = {}
+        for title, df in (tables or {}).items():
+            self.add_table(title, df)
+
+    def _record(self, sheet, method):
+        key = (sheet, method) if self.tag_fn is None else (self.tag_fn(), sheet, method)
+        with self._calls_lock:
+            self.calls[key] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_table(self, title, df, key=None):
+        rows = [list(map(str, df.columns))] + df.astype(str).replace({'nan': '', 'None': ''}).values.tolist()
+        sh = self._spreadsheet if key is None else self._by_key.setdefault(key, LocalSpreadsheet(self))
+        sh._sheets[title] = LocalWorksheet(self, title, rows)
+
+    def open_by_key(self, key):
+        return self._by_key.get(key, self._spreadsheet)
+
+    def reset_calls(self):
+        with self._calls_lock:
+            calls, self.calls = self.calls, Counter()
+        return dict(calls)
+
+    @classmethod
+    def from_dir(cls, path, latency=0.0):
+        """
+        โหลดทุกไฟล์ <ชื่อ Sheet>.csv ในโฟลเดอร์ (เช่นผลจาก utils.synthetic_data)
+        """
+        tables = {}
+        for name in sorted(os.listdir(path)):
+            title, ext = os.path.splitext(name)
+            if ext.lower() == '.csv' and not title.startswith('hosxp'):
+                tables[title] = pd.read_csv(os.path.join(path, name), dtype=str, keep_default_na=False)
+        return cls(tables, latency=latency)
+
+    def save_dir(self, path):
+        os.makedirs(path, exist_ok=True)
+        for ws in self._spreadsheet.worksheets():
+            ws.to_frame().to_csv(os.path.join(path, f"{ws.title}.csv"), index=False)
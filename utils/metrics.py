@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# 📈 METRICS (ตัวนับ / Histogram ภายใน Process)
+# ใช้ดูว่าแต่ละหน้าเรียก Google Sheets กี่ครั้ง, Cache ได้ผลแค่ไหน, คิวเขียนค้างเท่าไร
+# เปิด Endpoint สำหรับ Prometheus / Dashboard (ปิดไว้ถ้าไม่ได้ตั้ง METRICS_PORT):
+#   METRICS_PORT=9108 streamlit run app.py
+#   curl localhost:9108/metrics        (Prometheus text format)
+#   curl localhost:9108/metrics.json   (JSON)
+# ==========================================
+
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRIC_PREFIX = "asthma_"
+# วินาที: ขอบบนของแต่ละช่องใน Histogram (Sheets API ปกติ 0.2-2 วินาที)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LOCK = threading.Lock()
+_HELP = {}          # name -> (type, help)
+_COUNTERS = {}      # (name, labels) -> ค่า
+_HISTOGRAMS = {}    # (name, labels) -> [จำนวนในแต่ละช่อง..., sum, count]
+_COLLECTORS = []    # ฟังก์ชันที่คืนค่า Gauge/Counter ณ ตอนอ่าน (เช่นสถานะ Cache)
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+def describe(name, kind, help_text):
+    _HELP[name] = (kind, help_text)
+
+def inc(name, labels=None, value=1):
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+def observe(name, value, labels=None, buckets=LATENCY_BUCKETS):
+    key = _key(name, labels)
+    with _LOCK:
+        hist = _HISTOGRAMS.get(key)
+        if hist is None:
+            hist = _HISTOGRAMS[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += value
+        hist[-1] += 1
+
+@contextmanager
+def timed(name, labels=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, labels)
+
+def register_collector(fn):
+    """
+    fn() -> list ของ (name, kind, help, labels, value) อ่านค่า ณ ตอนที่มีคนขอ Metrics
+    """
+    with _LOCK:
+        if fn not in _COLLECTORS:
+            _COLLECTORS.append(fn)
+
+def reset_metrics():
+    with _LOCK:
+        _COUNTERS.clear()
+        _HISTOGRAMS.clear()
+
+def _collected():
+    with _LOCK:
+        collectors = list(_COLLECTORS)
+    samples = []
+    for fn in collectors:
+        try:
+            samples.extend(fn())
+        except Exception as e:
+            print(f"⚠️ Metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+    return samples
+
+def metrics_snapshot():
+    """
+    ค่าทั้งหมดเป็น dict (สำหรับ JSON / Benchmark): {name: [{labels, value}] หรือ [{labels, buckets, sum, count}]}
+    """
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        histograms = {k: list(v) for k, v in _HISTOGRAMS.items()}
+    out = {}
+    for (name, labels), value in sorted(counters.items()):
+        out.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+    for (name, labels), hist in sorted(histograms.items()):
+        cumulative, buckets = 0, {}
+        for bound, n in zip(LATENCY_BUCKETS, hist):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        out.setdefault(name, []).append(
+            {'labels': dict(labels), 'buckets': buckets, 'sum': round(hist[-2], 6), 'count': hist[-1]})
+    for name, kind, help_text, labels, value in _collected():
+        describe(name, kind, help_text)
+        out.setdefault(name, []).append({'labels': dict(labels or {}), 'value': value})
+    return out
+
+def _label_text(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def render_prometheus():
+    lines = []
+    for name, series in metrics_snapshot().items():
+        full = METRIC_PREFIX + name
+        kind, help_text = _HELP.get(name, ("histogram" if 'buckets' in series[0] else "counter", ""))
+        if help_text:
+            lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for s in series:
+            if 'buckets' in s:
+                for bound, n in s['buckets'].items():
+                    lines.append(f"{full}_bucket{_label_text(s['labels'], {'le': bound})} {n}")
+                lines.append(f"{full}_bucket{_label_text(s['labels'], {'le': '+Inf'})} {s['count']}")
+                lines.append(f"{full}_sum{_label_text(s['labels'])} {s['sum']}")
+                lines.append(f"{full}_count{_label_text(s['labels'])} {s['count']}")
+            elif s['value'] is not None:
+                lines.append(f"{full}{_label_text(s['labels'])} {float(s['value']):g}")
+    return "\n".join(lines) + "\n"
+
+# --- HTTP Endpoint (1 Thread ต่อ Process) ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            body, content_type = render_prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body, content_type = json.dumps(metrics_snapshot(), ensure_ascii=False, default=str), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+_SERVER_LOCK = threading.Lock()
+_SERVER = {'server': None, 'thread': None, 'last_error': None}
+
+def start_metrics_server(port=None, host=None):
+    """
+    เปิด Endpoint /metrics และ /metrics.json (เรียกซ้ำได้ จะเปิดแค่ครั้งเดียว / ไม่มี Port = ไม่เปิด)
+    """
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER['server'] is not None or _SERVER['last_error'] is not None:
+            return _SERVER['server']
+        try:
+            server = ThreadingHTTPServer((host or METRICS_HOST, int(port)), _MetricsHandler)
+        except OSError as e:
+            # Port ถูกใช้อยู่ (เช่นหลาย Replica ในเครื่องเดียว) -> แอปทำงานต่อได้ ไม่มี Endpoint
+            _SERVER['last_error'] = str(e)
+            print(f"⚠️ Metrics server not started: {e}")
+            return None
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        _SERVER['server'], _SERVER['thread'] = server, thread
+    return server
+
+def metrics_server_status():
+    server = _SERVER['server']
+    return {
+        'running': _SERVER['thread'] is not None and _SERVER['thread'].is_alive(),
+        'address': None if server is None else "%s:%s" % server.server_address[:2],
+        'last_error': _SERVER['last_error'],
+    }
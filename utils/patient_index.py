@@ -0,0 +1,252 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.calculations import (
+    calculate_predicted_pefr, get_action_plan_zone, get_percent_predicted,
+    compute_technique_status_table
+)
+from utils.patient_search import invalidate_search_index, drop_search_index
+from utils.frame_diff import row_hashes, row_keys, changed_keys
+from utils.snapshot_cache import snapshot_version
+from utils.clinics import current_clinic
+
+# ==========================================
+# 📇 PATIENT SUMMARY INDEX
+# ตารางสรุป 1 แถวต่อ HN (Visit ล่าสุด, PEFR ล่าสุด, Zone, เทคนิคพ่นยา, ยาล่าสุด)
+# สร้างครั้งเดียวตอนโหลดข้อมูล และอัปเดตเฉพาะ HN ที่ข้อมูลเปลี่ยน (บันทึกจากแอป / แก้ใน Sheets)
+# ==========================================
+
+def _clean_text(val):
+    if val is None or pd.isna(val):
+        return "-"
+    val = str(val).strip()
+    return "-" if val in ['', 'nan', 'None'] else val
+
+def _sorted_visits(visits_df):
+    # เรียงตาม (hn, วันที่) แบบ stable -> Visit ที่บันทึกทีหลังในวันเดียวกันถือเป็นล่าสุด
+    v = visits_df.copy()
+    v['_pos'] = np.arange(len(v))
+    v['_date'] = pd.to_datetime(v['date'], errors='coerce')
+    v['_pefr'] = pd.to_numeric(v['pefr'], errors='coerce').fillna(0) if 'pefr' in v.columns else 0
+    return v.sort_values(['hn', '_date'], kind='mergesort')
+
+def _patient_fields(pt, dob, now):
+    try:
+        age = (now - dob).days // 365
+        predicted_pefr = calculate_predicted_pefr(age, pt.get('height', 0) or 0, pt['prefix'])
+    except Exception:
+        age, predicted_pefr = None, 0
+
+    best_pefr = pd.to_numeric(pt.get('best_pefr', 0), errors='coerce')
+    best_pefr = 0 if pd.isna(best_pefr) else best_pefr
+    return {
+        'age': age,
+        'predicted_pefr': predicted_pefr,
+        'ref_pefr': predicted_pefr if predicted_pefr > 0 else best_pefr,
+    }
+
+def build_patient_summary(patients_df, visits_df):
+    """
+    สร้างตารางสรุปผู้ป่วย (index = hn) และตำแหน่งแถว Visit ของแต่ละคน (เรียงตามวันที่)
+    """
+    now = datetime.now()
+    pts = patients_df.reset_index(drop=True)
+    pts = pts.assign(patient_pos=np.arange(len(pts))).drop_duplicates('hn', keep='first')
+
+    # แปลงวันเกิดทีเดียวทั้งคอลัมน์ (เร็วกว่าแปลงทีละคน)
+    dobs = pd.to_datetime(pts['dob'], errors='coerce') if 'dob' in pts.columns else pd.Series(pd.NaT, index=pts.index)
+
+    rows = {}
+    for pt, dob in zip(pts.to_dict('records'), dobs):
+        rows[pt['hn']] = {'patient_pos': pt['patient_pos'], **_patient_fields(pt, dob, now)}
+    summary = pd.DataFrame.from_dict(rows, orient='index')
+    summary.index.name = 'hn'
+
+    positions = {}
+    if not visits_df.empty and not summary.empty:
+        v = _sorted_visits(visits_df)
+        sorted_pos = v['_pos'].to_numpy()
+        for hn, idx in v.groupby('hn', sort=False).indices.items():
+            positions[hn] = sorted_pos[idx]
+
+        last_any = v.groupby('hn', sort=False).tail(1).set_index('hn')
+        last_valid = v[v['_pefr'] > 0].groupby('hn', sort=False).tail(1).set_index('hn')
+
+        summary['visit_count'] = v.groupby('hn').size().reindex(summary.index).fillna(0).astype(int)
+        summary['last_visit_date'] = last_any['_date'].reindex(summary.index)
+        for col in ['controller', 'reliever', 'drp', 'advice', 'next_appt']:
+            if col in last_any.columns:
+                summary[f'last_{col}'] = last_any[col].reindex(summary.index).map(_clean_text)
+            else:
+                summary[f'last_{col}'] = "-"
+        summary['last_valid_date'] = last_valid['_date'].reindex(summary.index)
+        summary['last_valid_pefr'] = last_valid['_pefr'].reindex(summary.index).fillna(0)
+        if 'control_level' in last_valid.columns:
+            summary['last_valid_control_level'] = last_valid['control_level'].reindex(summary.index).map(_clean_text)
+        else:
+            summary['last_valid_control_level'] = "-"
+    else:
+        summary['visit_count'] = 0
+        summary['last_visit_date'] = pd.NaT
+        for col in ['controller', 'reliever', 'drp', 'advice', 'next_appt']:
+            summary[f'last_{col}'] = "-"
+        summary['last_valid_date'] = pd.NaT
+        summary['last_valid_pefr'] = 0
+        summary['last_valid_control_level'] = "-"
+
+    # Zone จาก PEFR ล่าสุดที่เป่าจริง
+    zone_names, zone_colors, pcts = [], [], []
+    for pefr, ref in zip(summary.get('last_valid_pefr', []), summary.get('ref_pefr', [])):
+        if pefr > 0:
+            name, color, _ = get_action_plan_zone(pefr, ref)
+            zone_names.append(name)
+            zone_colors.append(color)
+            pcts.append(get_percent_predicted(pefr, ref))
+        else:
+            zone_names.append(None)
+            zone_colors.append(None)
+            pcts.append(None)
+    summary['zone_name'] = zone_names
+    summary['zone_color'] = zone_colors
+    summary['pct_predicted'] = pcts
+
+    # เทคนิคพ่นยา (คำนวณรวดเดียวทุกคน)
+    tech = compute_technique_status_table(visits_df, all_hns=summary.index)
+    summary['tech_status'] = tech['status']
+    summary['tech_days'] = tech['days']
+    summary['tech_last_date'] = tech['last_tech_date']
+
+    return summary, positions
+
+# คอลัมน์ที่ตารางสรุปใช้ (แก้คอลัมน์อื่น เช่น note ไม่ต้องคำนวณใหม่)
+SUMMARY_PATIENT_COLUMNS = ('hn', 'prefix', 'dob', 'height', 'best_pefr')
+SUMMARY_VISIT_COLUMNS = ('hn', 'date', 'pefr', 'control_level', 'controller', 'reliever',
+                         'drp', 'advice', 'next_appt', 'technique_check')
+REFRESH_MAX_FRACTION = 0.2   # HN ที่เปลี่ยนเกินสัดส่วนนี้ -> สร้างใหม่ทั้งหมด (เร็วกว่าอัปเดตทีละส่วน)
+
+def _fingerprint(df, columns):
+    return row_hashes(df, columns), row_keys(df)
+
+class PatientSummaryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summary = None
+        self._positions = {}
+        self._version = None      # snapshot_version ของ (patients, visits) ที่ Index ไว้
+        self._rows = None         # (hash, hn) ของทุกแถวใน patients / visits ที่ Index ไว้
+
+    def sync(self, patients_df, visits_df):
+        """
+        ให้ Index ตรงกับข้อมูลชุดนี้: ชุดเดิม (รุ่นเดียวกันจาก Cache) -> ไม่ต้องทำอะไร
+        ชุดใหม่ -> เทียบ Hash รายแถวกับชุดที่ Index ไว้ แล้วคำนวณใหม่เฉพาะ HN ที่เปลี่ยน/เลื่อนตำแหน่ง
+        (รวมการแก้ไขใน Google Sheets โดยตรงที่ได้มาจากการโหลดใหม่ตาม TTL)
+        """
+        version = (snapshot_version(patients_df), snapshot_version(visits_df))
+        with self._lock:
+            if self._summary is not None and None not in version and version == self._version:
+                return self
+            rows = (_fingerprint(patients_df, SUMMARY_PATIENT_COLUMNS), _fingerprint(visits_df, SUMMARY_VISIT_COLUMNS))
+            changed = None if self._summary is None else (
+                changed_keys(*self._rows[0], *rows[0]) | changed_keys(*self._rows[1], *rows[1])
+            )
+            if changed is None or len(changed) > max(1, len(self._summary)) * REFRESH_MAX_FRACTION:
+                self._summary, self._positions = build_patient_summary(patients_df, visits_df)
+            elif changed:
+                self._refresh(patients_df, visits_df, changed)
+            self._version, self._rows = version, rows
+        return self
+
+    def _refresh(self, patients_df, visits_df, hns):
+        hns = list(hns)
+        pt_mask = patients_df['hn'].isin(hns).to_numpy()
+        sub_pts = patients_df[pt_mask]
+        sub_visits = visits_df[visits_df['hn'].isin(hns)] if not visits_df.empty else visits_df
+
+        part, part_pos = build_patient_summary(sub_pts, sub_visits)
+        # แปลงตำแหน่งกลับเป็นตำแหน่งในตารางเต็ม
+        part['patient_pos'] = np.flatnonzero(pt_mask)[part['patient_pos'].to_numpy()] if not part.empty else []
+        if not visits_df.empty:
+            visit_rows = np.flatnonzero(visits_df['hn'].isin(hns).to_numpy())
+            part_pos = {hn: visit_rows[pos] for hn, pos in part_pos.items()}
+
+        summary = self._summary.drop(index=[h for h in hns if h in self._summary.index])
+        self._summary = pd.concat([summary, part]) if not part.empty else summary
+        for hn in hns:
+            self._positions.pop(hn, None)
+        self._positions.update(part_pos)
+
+    def invalidate(self):
+        with self._lock:
+            self._summary = None
+
+    @property
+    def table(self):
+        return self._summary
+
+    def get(self, hn):
+        if self._summary is None or hn not in self._summary.index:
+            return None
+        return self._summary.loc[hn].to_dict()
+
+    def patient_row(self, hn, patients_df):
+        summary = self.get(hn)
+        if summary is None:
+            return None
+        pos = int(summary['patient_pos'])
+        if pos < len(patients_df) and patients_df['hn'].iat[pos] == hn:
+            return patients_df.iloc[pos]
+        # ตำแหน่งไม่ตรงกับข้อมูลชุดนี้ (เช่น Session อื่นเพิ่ง sync ด้วยชุดใหม่กว่า) -> ค้นหาตรงๆ
+        match = patients_df[patients_df['hn'] == hn]
+        return match.iloc[0] if not match.empty else None
+
+    def patient_visits(self, hn, visits_df):
+        """
+        Visit ของผู้ป่วย 1 คน (เรียงตามวันที่ + แปลงวันที่แล้ว) โดยไม่ต้องกรองทั้งตาราง
+        """
+        pos = self._positions.get(hn)
+        if pos is not None and len(pos) and pos.max() < len(visits_df) and (visits_df['hn'].iloc[pos] == hn).all():
+            pt_visits = visits_df.iloc[pos].copy()
+        elif 'hn' in visits_df.columns and (visits_df['hn'] == hn).any():
+            # ตำแหน่งไม่ตรงกับข้อมูลชุดนี้ -> กรองจากทั้งตาราง (ไม่แสดง Visit ของคนอื่น)
+            pt_visits = visits_df[visits_df['hn'] == hn]
+            dates = pd.to_datetime(pt_visits['date'], errors='coerce').reset_index(drop=True)
+            pt_visits = pt_visits.iloc[dates.sort_values(kind='mergesort').index.to_numpy()].copy()
+        else:
+            return visits_df.iloc[0:0].copy()
+        pt_visits['date'] = pd.to_datetime(pt_visits['date'], errors='coerce')
+        return pt_visits
+
+# Index แยกตามคลินิก + แหล่งข้อมูล ("staff" = load_data_staff, "public" = load_data_fast)
+# clinic = None -> คลินิกของงานปัจจุบัน
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_patient_index(name="staff", clinic=None):
+    key = (clinic or current_clinic(), name)
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = PatientSummaryIndex()
+        return _INDEXES[key]
+
+def sync_patient_index(patients_df, visits_df, name="staff", clinic=None):
+    return get_patient_index(name, clinic).sync(patients_df, visits_df)
+
+def _clinic_indexes(clinic):
+    with _INDEXES_LOCK:
+        return [index for (c, _), index in _INDEXES.items() if clinic is None or c == clinic]
+
+def invalidate_patient_indexes(clinic=None):
+    # ใช้เมื่อไม่รู้ว่า HN ไหนเปลี่ยน -> สร้างใหม่ทั้งหมดในการโหลดครั้งถัดไป (clinic = None -> ทุกคลินิก)
+    for index in _clinic_indexes(clinic):
+        index.invalidate()
+    invalidate_search_index(clinic)
+
+def drop_patient_indexes(clinic):
+    # ปล่อย Index ทั้งหมดของคลินิกออกจากหน่วยความจำ (LRU ของคลินิกที่ไม่มีใครใช้)
+    with _INDEXES_LOCK:
+        for key in [k for k in _INDEXES if k[0] == clinic]:
+            del _INDEXES[key]
+    drop_search_index(clinic)
@@ -0,0 +1,282 @@
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from utils.clinics import current_clinic
+from utils.frame_diff import row_hashes, row_keys, changed_keys
+from utils.snapshot_cache import snapshot_version
+
+# ==========================================
+# 🔎 PATIENT SEARCH INDEX
+# ค้นหาผู้ป่วยจาก HN / ชื่อ / นามสกุล / สถานะ (ขึ้นต้นด้วย, มีคำนี้, สะกดใกล้เคียง)
+# สร้างครั้งเดียว แล้วเพิ่มเฉพาะผู้ป่วยใหม่ / HN ที่ถูกแก้ไข (จากแอป หรือแก้ใน Sheets โดยตรง)
+# ==========================================
+
+SEARCH_TOP_K = 20
+SEARCH_COLUMNS = ('hn', 'prefix', 'first_name', 'last_name', 'status')
+SEARCH_REBUILD_FRACTION = 0.2   # HN ที่เปลี่ยนเกินสัดส่วนนี้ -> สร้างใหม่ทั้งหมด
+FUZZY_MIN_SCORE = 0.6       # ความคล้ายของการสะกด (0-1) ขั้นต่ำ
+FUZZY_MAX_CANDIDATES = 200  # จำนวนคนที่นำมาเทียบการสะกดละเอียด (คัดจาก bigram ที่ตรงกันมากสุด)
+
+def _normalize(text):
+    # ไทย/อังกฤษ: รวมสระวรรณยุกต์ให้เป็นรูปเดียวกัน + ตัวพิมพ์เล็ก + ตัดช่องว่าง
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ""
+    text = unicodedata.normalize("NFC", str(text)).casefold()
+    return "".join(text.split())
+
+def _bigrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+class _SearchState:
+    """
+    ข้อมูลของ Index 1 ชุด: เผยแพร่แล้วไม่แก้ไขอีก (sync สร้างชุดใหม่/สำเนาแล้วสลับทีเดียว)
+    -> การค้นหาที่ทำพร้อมกับ sync ของ Session อื่นเห็นข้อมูลชุดเดียวกันตลอดการค้นหา
+    """
+
+    def __init__(self):
+        self.hns = []
+        self.pos = {}            # hn -> ตำแหน่งใน array
+        self.labels = {}
+        self.first = []
+        self.last = []
+        self.status = []
+        self.grams = []          # set ของ bigram ต่อคน (ชื่อ+นามสกุล)
+        self.postings = {}       # bigram -> set ตำแหน่ง
+        self.sorted_hns = []
+        self._owned = None       # bigram ที่ชุดนี้คัดลอก set มาแล้ว (None = เป็นเจ้าของทั้งหมด)
+        self._arrays = None      # numpy array สำหรับค้นหาแบบ Vectorized (สร้างเมื่อค้นหาครั้งแรก)
+        self._arrays_lock = threading.Lock()
+
+    def copy(self):
+        # สำเนาสำหรับอัปเดตบาง HN (set ของ Posting คัดลอกเฉพาะ bigram ที่ถูกแก้)
+        state = _SearchState()
+        state.hns, state.pos, state.labels = list(self.hns), dict(self.pos), dict(self.labels)
+        state.first, state.last, state.status = list(self.first), list(self.last), list(self.status)
+        state.grams, state.postings = list(self.grams), dict(self.postings)
+        state.sorted_hns = self.sorted_hns
+        state._owned = set()
+        return state
+
+    def _posting(self, g):
+        if self._owned is not None and g not in self._owned:
+            self.postings[g] = set(self.postings.get(g, ()))
+            self._owned.add(g)
+        return self.postings.setdefault(g, set())
+
+    def index_rows(self, rows):
+        for pt in rows:
+            hn = str(pt.get('hn', '')).strip()
+            if not hn:
+                continue
+            status = pt.get('status', '')
+            status = status.strip() if isinstance(status, str) and status.strip() else "Active"
+            prefix = pt.get('prefix', '') or ''
+            first_raw = pt.get('first_name', '') or ''
+            last_raw = pt.get('last_name', '') or ''
+            first, last = _normalize(first_raw), _normalize(last_raw)
+            grams = _bigrams(first) | _bigrams(last) | _bigrams(first + last)
+
+            if hn in self.pos:
+                # HN เดิม (แก้ไขข้อมูล) -> เขียนทับตำแหน่งเดิม
+                i = self.pos[hn]
+                for g in self.grams[i]:
+                    self._posting(g).discard(i)
+                self.first[i], self.last[i], self.status[i], self.grams[i] = first, last, _normalize(status), grams
+            else:
+                i = len(self.hns)
+                self.pos[hn] = i
+                self.hns.append(hn)
+                self.first.append(first)
+                self.last.append(last)
+                self.status.append(_normalize(status))
+                self.grams.append(grams)
+                self.sorted_hns = None
+            for g in grams:
+                self._posting(g).add(i)
+            self.labels[hn] = f"{hn} - {prefix}{first_raw} {last_raw} ({status})"
+
+    def finish(self):
+        if self.sorted_hns is None:
+            self.sorted_hns = sorted(self.hns)
+        self._owned = None
+        return self
+
+    def arrays(self):
+        with self._arrays_lock:
+            if self._arrays is None:
+                first = np.array(self.first, dtype=str)
+                last = np.array(self.last, dtype=str)
+                self._arrays = {
+                    'hn': np.array(self.hns, dtype=str),
+                    'first': first,
+                    'last': last,
+                    'full': np.char.add(first, last),
+                    'status': np.array(self.status, dtype=str),
+                    'postings': {},
+                }
+            return self._arrays
+
+    def posting_array(self, gram):
+        arrays = self.arrays()
+        with self._arrays_lock:
+            cache = arrays['postings']
+            if gram not in cache:
+                cache[gram] = np.fromiter(self.postings.get(gram, ()), dtype=np.int64)
+            return cache[gram]
+
+    def fuzzy_scores(self, q, n):
+        # 1) คัดผู้ที่มี bigram ตรงกันมากสุดจาก Posting List  2) เทียบการสะกดละเอียดเฉพาะกลุ่มนั้น
+        grams = _bigrams(q)
+        if not grams:
+            return {}
+        shared = np.bincount(np.concatenate([self.posting_array(g) for g in grams]), minlength=n)
+        candidates = np.flatnonzero(shared)
+        if len(candidates) > FUZZY_MAX_CANDIDATES:
+            candidates = candidates[np.argsort(-shared[candidates], kind='stable')[:FUZZY_MAX_CANDIDATES]]
+
+        matcher = SequenceMatcher(None, b=q)
+        ratios = {}    # ชื่อซ้ำกันบ่อย -> คำนวณครั้งเดียวต่อคำ
+
+        def ratio(text):
+            if text not in ratios:
+                matcher.set_seq1(text)
+                ratios[text] = matcher.ratio() if matcher.real_quick_ratio() >= FUZZY_MIN_SCORE else 0
+            return ratios[text]
+
+        scores = {}
+        for i in candidates:
+            first, last = self.first[i], self.last[i]
+            best = max(ratio(first), ratio(last))
+            if len(q) > max(len(first), len(last)):
+                best = max(best, ratio(first + last))
+            if best >= FUZZY_MIN_SCORE:
+                scores[i] = best * 50
+        return scores
+
+class PatientSearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None      # snapshot_version ของตารางผู้ป่วยที่ Index ไว้
+        self._rows = None         # (hash, hn) ของทุกแถวที่ Index ไว้ (None = ต้องสร้างใหม่)
+        self._state = _SearchState()
+
+    # --- สร้าง / อัปเดต Index ---
+    def sync(self, patients_df):
+        """
+        ชุดเดิม (รุ่นเดียวกันจาก Cache) -> ไม่ต้องทำอะไร / ชุดใหม่ -> เทียบ Hash รายแถวกับชุดที่ Index ไว้
+        แล้ว Index ใหม่เฉพาะ HN ที่เพิ่ม/แก้ไข (มี HN หายไป หรือเปลี่ยนเยอะ -> สร้างใหม่ทั้งหมด)
+        """
+        version = snapshot_version(patients_df)
+        with self._lock:
+            if self._rows is not None and version is not None and version == self._version:
+                return self
+            rows = (row_hashes(patients_df, SEARCH_COLUMNS), row_keys(patients_df))
+            changed = None if self._rows is None else changed_keys(*self._rows, *rows)
+            if changed:
+                present = set(rows[1])
+                removed = any(hn not in present for hn in changed)
+                if removed or len(changed) > max(1, len(self._state.hns)) * SEARCH_REBUILD_FRACTION:
+                    changed = None
+            if changed is None:
+                state = _SearchState()
+                state.index_rows(patients_df.to_dict('records'))
+                self._state = state.finish()
+            elif changed:
+                # ทุกแถวของ HN ที่เปลี่ยน (HN ซ้ำ -> แถวหลังทับแถวก่อน เหมือนตอนสร้างใหม่)
+                state = self._state.copy()
+                state.index_rows(patients_df[np.isin(rows[1], list(changed))].to_dict('records'))
+                self._state = state.finish()
+            self._version, self._rows = version, rows
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    # --- ค้นหา (ใช้ข้อมูลชุดเดียวตลอดการเรียก 1 ครั้ง) ---
+    @property
+    def all_hns(self):
+        return self._state.sorted_hns or []
+
+    def label(self, hn):
+        return self._state.labels.get(hn, hn)
+
+    def search(self, query, limit=SEARCH_TOP_K, statuses=None):
+        """
+        คืนค่า list ของ HN เรียงตามความตรง: HN ตรง > HN ขึ้นต้น > ชื่อขึ้นต้น > มีคำนี้ > สะกดใกล้เคียง
+        """
+        state = self._state
+        q = _normalize(query)
+        n = len(state.hns)
+        if n == 0:
+            return []
+        if not q:
+            hns = state.sorted_hns or []
+            if statuses:
+                allowed = {_normalize(s) for s in statuses}
+                hns = [hn for hn in hns if state.status[state.pos[hn]] in allowed]
+            return hns[:limit] if limit else hns
+
+        arr = state.arrays()
+        scores = np.zeros(n)
+        if q.isdigit():
+            contains = np.char.find(arr['hn'], q) >= 0
+            scores[contains] = 70
+            scores[np.char.startswith(arr['hn'], q)] = 90
+            scores[arr['hn'] == q.zfill(7)] = 100
+        else:
+            scores[np.char.startswith(arr['status'], q)] = 50
+            contains = (np.char.find(arr['full'], q) >= 0) | (np.char.find(arr['last'], q) >= 0)
+            scores[contains] = 60
+            prefix = (np.char.startswith(arr['first'], q) | np.char.startswith(arr['last'], q)
+                      | np.char.startswith(arr['full'], q))
+            scores[prefix] = 80
+
+            # สะกดใกล้เคียง (ทำเฉพาะเมื่อผลที่ตรงแบบอื่นยังไม่พอ)
+            if np.count_nonzero(scores >= 60) < limit:
+                for i, score in state.fuzzy_scores(q, n).items():
+                    if scores[i] < score:
+                        scores[i] = score
+
+        if statuses:
+            allowed = {_normalize(s) for s in statuses}
+            scores[~np.isin(arr['status'], list(allowed))] = 0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        # คะแนนมากก่อน, คะแนนเท่ากันเรียงตาม HN
+        order = hits[np.lexsort((arr['hn'][hits], -scores[hits]))]
+        return arr['hn'][order[:limit]].tolist()
+
+# Index แยกตามคลินิก (clinic = None -> คลินิกของงานปัจจุบัน)
+_SEARCH_INDEXES = {}
+_SEARCH_INDEXES_LOCK = threading.Lock()
+
+def _search_index(clinic=None):
+    clinic = clinic or current_clinic()
+    with _SEARCH_INDEXES_LOCK:
+        if clinic not in _SEARCH_INDEXES:
+            _SEARCH_INDEXES[clinic] = PatientSearchIndex()
+        return _SEARCH_INDEXES[clinic]
+
+def get_search_index(patients_df, clinic=None):
+    return _search_index(clinic).sync(patients_df)
+
+def invalidate_search_index(clinic=None):
+    # clinic = None -> ทุกคลินิก
+    with _SEARCH_INDEXES_LOCK:
+        indexes = [i for c, i in _SEARCH_INDEXES.items() if clinic is None or c == clinic]
+    for index in indexes:
+        index.invalidate()
+
+def drop_search_index(clinic):
+    # ปล่อย Index ของคลินิกออกจากหน่วยความจำ (สร้างใหม่เมื่อมีคนใช้อีกครั้ง)
+    with _SEARCH_INDEXES_LOCK:
+        _SEARCH_INDEXES.pop(clinic, None)
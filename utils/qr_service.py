@@ -0,0 +1,84 @@
+import io
+import base64
+from functools import lru_cache
+
+import qrcode
+
+# --- CONFIGURATION ---
+QR_CACHE_SIZE = 512  # จำนวน QR ที่เก็บไว้ในหน่วยความจำ (LRU)
+
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# 1. เข้ารหัส QR เป็น Matrix (ส่วนที่แพงที่สุด ทำครั้งเดียวต่อ payload)
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _qr_matrix(data, error_correction="L", border=4):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=1,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return tuple(tuple(bool(cell) for cell in row) for row in qr.get_matrix())
+
+# 2. PNG (ใช้ Pillow เฉพาะตอนที่ยังไม่มีใน Cache)
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_png(data, box_size=10, border=4, error_correction="L"):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+# 3. Base64 สำหรับฝังใน HTML (<img src="data:image/png;base64,...">)
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_base64(data, box_size=10, border=4, error_correction="L"):
+    png_bytes = get_qr_png(data, box_size=box_size, border=border, error_correction=error_correction)
+    return base64.b64encode(png_bytes).decode()
+
+# 4. SVG แบบเบา (ไม่ต้องใช้ Pillow, สร้างจาก Matrix โดยตรง)
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def get_qr_svg(data, box_size=10, border=4, error_correction="L"):
+    matrix = _qr_matrix(data, error_correction, border)
+    size = len(matrix)
+
+    # รวมทุกช่องดำเป็น path เดียว (ไฟล์เล็กกว่าการใช้ <rect> ทีละช่อง)
+    path_parts = []
+    for y, row in enumerate(matrix):
+        for x, cell in enumerate(row):
+            if cell:
+                path_parts.append(f"M{x},{y}h1v1h-1z")
+
+    px = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{px}" height="{px}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#ffffff"/>'
+        f'<path d="{"".join(path_parts)}" fill="#000000"/>'
+        f'</svg>'
+    )
+
+def get_qr_svg_base64(data, box_size=10, border=4, error_correction="L"):
+    svg = get_qr_svg(data, box_size=box_size, border=border, error_correction=error_correction)
+    return base64.b64encode(svg.encode("utf-8")).decode()
+
+def clear_qr_cache():
+    """
+    ล้าง Cache ของ QR ทั้งหมด (เช่น หลังเปลี่ยน deploy_url)
+    """
+    for fn in (_qr_matrix, get_qr_png, get_qr_base64, get_qr_svg):
+        fn.cache_clear()
@@ -0,0 +1,226 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================
+# 🔄 SNAPSHOT CACHE (Stale-While-Revalidate)
+# ผู้ใช้ได้ข้อมูลชุดล่าสุดที่โหลดสำเร็จทันทีเสมอ
+# ส่วนการโหลดใหม่จาก Google Sheets ทำใน Thread เบื้องหลัง (ก่อนหมดอายุเล็กน้อย) แล้วสลับชุดข้อมูลทีเดียว
+# ==========================================
+
+REFRESH_TICK = 0.5           # วินาที ระหว่างรอบตรวจว่าตารางไหนใกล้หมดอายุ
+REFRESH_WORKERS = 4          # จำนวนตารางที่โหลดพร้อมกันได้
+REFRESH_MAX_BACKOFF = 60     # วินาที สูงสุดที่รอก่อนลองโหลดใหม่ (ตอน Sheets ล่ม / ติด Quota)
+SNAPSHOT_ATTR = "snapshot"   # DataFrame.attrs[SNAPSHOT_ATTR] = (ชื่อ Cache, key, เวลาที่เริ่มโหลด)
+
+def _tag(value, name, key, started):
+    # ติดป้ายรุ่นของข้อมูลไว้กับ DataFrame (สำเนาที่ผู้ใช้ได้รับก็มีป้ายเดียวกัน)
+    attrs = getattr(value, 'attrs', None)
+    if isinstance(attrs, dict):
+        attrs[SNAPSHOT_ATTR] = (name, key, started)
+
+def snapshot_version(value):
+    """
+    รุ่นของข้อมูลที่ได้จาก SnapshotCache (เปลี่ยนทุกครั้งที่โหลดใหม่) / None = ไม่ได้มาจาก Cache
+    ใช้ให้ Index รู้ว่าต้องตรวจข้อมูลใหม่หรือไม่ โดยไม่ต้องอ่านทั้งตาราง
+    """
+    attrs = getattr(value, 'attrs', None)
+    return attrs.get(SNAPSHOT_ATTR) if isinstance(attrs, dict) else None
+
+class _Entry:
+    __slots__ = ('value', 'size', 'loaded_at', 'last_access', 'refreshing', 'failures', 'retry_at', 'last_error')
+
+    def __init__(self):
+        self.value = None
+        self.size = 0
+        self.loaded_at = None
+        self.last_access = 0.0
+        self.refreshing = False
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+class SnapshotCache:
+    """
+    Cache ของผลลัพธ์ loader(*key)
+    - อายุ < ttl - refresh_ahead          -> ใช้ชุดเดิม
+    - ใกล้หมดอายุ / หมดอายุ (< max_stale) -> ใช้ชุดเดิมทันที + สั่งโหลดใหม่เบื้องหลัง
+    - เก่ากว่า max_stale / ยังไม่เคยโหลด  -> โหลดทันที (แบบเดิม)
+    ตารางที่มีคนใช้ภายใน idle_timeout วินาที จะถูกโหลดใหม่ล่วงหน้าเรื่อยๆ แม้ไม่มีใครเปิดหน้า
+    size_fn(value) = ขนาด (byte) ของแต่ละชุด สำหรับจำกัดหน่วยความจำ (ดู usage() / evict())
+    """
+
+    def __init__(self, loader, ttl, refresh_ahead=None, max_stale=None, idle_timeout=None, copy_fn=None,
+                 size_fn=None, name=None):
+        self._loader = loader
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else ttl * 0.2
+        self.max_stale = max_stale if max_stale is not None else ttl * 6
+        self.idle_timeout = idle_timeout if idle_timeout is not None else ttl * 12
+        # ผู้ใช้ได้สำเนา (แก้ DataFrame ในหน้าเว็บแล้วไม่กระทบชุดที่ใช้ร่วมกัน)
+        self._copy_fn = copy_fn
+        self._size_fn = size_fn
+        self.name = name or getattr(loader, '__name__', 'snapshot')
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._load_locks = {}
+        self.stats = {'hits': 0, 'stale_hits': 0, 'sync_loads': 0, 'refreshes': 0, 'refresh_errors': 0, 'evictions': 0}
+        _register(self)
+
+    def _copy(self, value):
+        return self._copy_fn(value) if self._copy_fn else value
+
+    def get(self, *key):
+        now = time.monotonic()
+        load_lock = None
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+            entry.last_access = now
+            age = None if entry.loaded_at is None else now - entry.loaded_at
+            if age is not None and age < self.max_stale:
+                if age < self.ttl - self.refresh_ahead:
+                    self.stats['hits'] += 1
+                else:
+                    self.stats['stale_hits'] += 1
+                    self._schedule_locked(key, entry, now)
+                value = entry.value
+            else:
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+        if load_lock is None:
+            return self._copy(value)
+
+        # ไม่มีข้อมูล / เก่าเกินกำหนด -> โหลดใน Request นี้ (Error ส่งต่อให้ผู้เรียก)
+        # หลาย Session มาพร้อมกัน -> โหลดครั้งเดียว คนที่เหลือรอใช้ผลเดียวกัน
+        with load_lock:
+            with self._lock:
+                entry = self._entries.setdefault(key, _Entry())
+                entry.last_access = time.monotonic()
+                if entry.loaded_at is not None and time.monotonic() - entry.loaded_at < self.max_stale:
+                    self.stats['hits'] += 1
+                    value = entry.value
+                    loading = False
+                else:
+                    self.stats['sync_loads'] += 1
+                    loading = True
+            if loading:
+                started = time.monotonic()
+                value = self._loader(*key)
+                _tag(value, self.name, key, started)
+                size = self._size_fn(value) if self._size_fn else 0
+                with self._lock:
+                    self._install_locked(key, entry, value, size, started)
+        return self._copy(value)
+
+    def _install_locked(self, key, entry, value, size, started):
+        # Key ถูกล้าง/ปล่อยระหว่างโหลด (มีการเขียนข้อมูลใหม่) -> ทิ้งผลนี้ ให้การอ่านครั้งถัดไปโหลดใหม่
+        if self._entries.get(key) is not entry:
+            return
+        # อายุนับจากตอนเริ่มโหลด (ข้อมูลอาจเปลี่ยนระหว่างดาวน์โหลด)
+        if entry.loaded_at is None or started >= entry.loaded_at:
+            entry.value = value
+            entry.size = size
+            entry.loaded_at = started
+        entry.failures = 0
+        entry.retry_at = 0.0
+        entry.last_error = None
+
+    def _schedule_locked(self, key, entry, now):
+        if entry.refreshing or now < entry.retry_at:
+            return
+        entry.refreshing = True
+        _EXECUTOR.submit(self._refresh, key, entry)
+
+    def _refresh(self, key, entry):
+        started = time.monotonic()
+        try:
+            value = self._loader(*key)
+            _tag(value, self.name, key, started)
+            size = self._size_fn(value) if self._size_fn else 0
+        except BaseException as e:
+            # Thread เบื้องหลัง: เก็บ Error ไว้ แล้วใช้ชุดเดิมต่อ (รอนานขึ้นเรื่อยๆ ก่อนลองใหม่)
+            with self._lock:
+                entry.refreshing = False
+                entry.failures += 1
+                entry.retry_at = time.monotonic() + min(2 ** entry.failures, REFRESH_MAX_BACKOFF)
+                entry.last_error = str(e) or type(e).__name__
+                self.stats['refresh_errors'] += 1
+            return
+
+        with self._lock:
+            self._install_locked(key, entry, value, size, started)
+            entry.refreshing = False
+            self.stats['refreshes'] += 1
+
+    def refresh_due(self):
+        # เรียกจาก Thread เบื้องหลัง: โหลดใหม่ล่วงหน้าเฉพาะตารางที่ยังมีคนใช้อยู่
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.loaded_at is None or now - entry.last_access > self.idle_timeout:
+                    continue
+                if now - entry.loaded_at >= self.ttl - self.refresh_ahead:
+                    self._schedule_locked(key, entry, now)
+
+    def clear(self, *prefix):
+        """
+        ล้าง Cache หลังเขียนข้อมูล -> การอ่านครั้งถัดไปโหลดใหม่ทันที (เห็นข้อมูลที่เพิ่งบันทึก)
+        prefix = ล้างเฉพาะ key ที่ขึ้นต้นด้วยค่าเหล่านี้ เช่น clear(clinic, table) (ไม่ระบุ = ล้างทั้งหมด)
+        """
+        with self._lock:
+            keys = [k for k in self._entries if k[:len(prefix)] == prefix]
+        self.evict(keys)
+
+    def evict(self, keys):
+        # ปล่อยชุดข้อมูลออกจากหน่วยความจำ (การอ่านครั้งถัดไปโหลดใหม่)
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['evictions'] += 1
+
+    def usage(self):
+        """
+        [(key, ขนาด byte, เวลาที่ใช้ล่าสุด (monotonic))] ของชุดที่โหลดแล้ว
+        """
+        with self._lock:
+            return [(key, e.size, e.last_access) for key, e in self._entries.items() if e.loaded_at is not None]
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            tables = {
+                "/".join(str(k) for k in key) or self.name: {
+                    'age': None if e.loaded_at is None else round(now - e.loaded_at, 1),
+                    'refreshing': e.refreshing,
+                    'last_error': e.last_error,
+                }
+                for key, e in self._entries.items()
+            }
+            return {'name': self.name, 'ttl': self.ttl, 'tables': tables, **self.stats}
+
+# --- Background Refresher (1 Thread ต่อ Process สำหรับทุก Cache) ---
+_EXECUTOR = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="snapshot-refresh")
+_CACHES = []
+_CACHES_LOCK = threading.Lock()
+_REFRESHER = {'thread': None}
+
+def _refresher_loop():
+    while True:
+        time.sleep(REFRESH_TICK)
+        with _CACHES_LOCK:
+            caches = list(_CACHES)
+        for cache in caches:
+            cache.refresh_due()
+
+def _register(cache):
+    with _CACHES_LOCK:
+        _CACHES.append(cache)
+        thread = _REFRESHER['thread']
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_refresher_loop, name="snapshot-refresher", daemon=True)
+            thread.start()
+            _REFRESHER['thread'] = thread
+
+def snapshot_status():
+    with _CACHES_LOCK:
+        caches = list(_CACHES)
+    return [cache.status() for cache in caches]
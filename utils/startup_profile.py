@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+# ==========================================
+# ⏱️ STARTUP PROFILE
+# วัดเวลา import ของแต่ละหน้า (Process ใหม่ทุกครั้ง = เหมือนเปิดแอปครั้งแรก)
+#   python -m utils.startup_profile --top 15
+# ==========================================
+
+# Module ที่แต่ละหน้าต้อง import (ตาม app.py)
+ROUTE_MODULES = {
+    "patient": ["streamlit", "utils.gsheet_handler", "utils.style", "views.patient_view"],
+    "staff_search": ["streamlit", "utils.gsheet_handler", "utils.style", "views.staff_action"],
+    "staff_dashboard": ["streamlit", "utils.gsheet_handler", "utils.style", "views.staff_dashboard"],
+    "staff_import": ["streamlit", "utils.gsheet_handler", "utils.style", "views.staff_import"],
+    "staff_cards": ["streamlit", "utils.gsheet_handler", "utils.style", "views.staff_cards"],
+}
+
+# งบเวลา import ต่อหน้า (ms) -> เกินแล้วรายงานเป็น OVER BUDGET
+STARTUP_BUDGET_MS = {
+    "patient": 2500,
+    "staff_search": 3000,
+    "staff_dashboard": 3000,
+    "staff_import": 3000,
+    "staff_cards": 3000,
+}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append({
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            'depth': depth,
+        })
+    return pd.DataFrame(rows, columns=['module', 'self_ms', 'cumulative_ms', 'depth'])
+
+def profile_imports(modules, python=None):
+    """
+    import modules ใน Process ใหม่ด้วย -X importtime -> DataFrame เวลา import ทุก Module
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return _parse_importtime(proc.stderr)
+
+def route_report(routes=None, top=10):
+    """
+    สรุปเวลา import ต่อหน้า: รวมทั้งหมด, เทียบงบเวลา, Package ที่ใช้เวลามากสุด
+    """
+    routes = routes or ROUTE_MODULES
+    report = {}
+    for route, modules in routes.items():
+        timings = profile_imports(modules)
+        top_level = timings[timings['depth'] == 0]
+        total_ms = round(float(top_level['cumulative_ms'].sum()), 1)
+        budget = STARTUP_BUDGET_MS.get(route)
+
+        # เวลาของแต่ละ Package = ครั้งแรกที่ถูก import (แถวที่ cumulative มากสุดของ Package นั้น)
+        packages = timings.assign(package=timings['module'].str.split('.').str[0])
+        heaviest = (packages.groupby('package')['cumulative_ms'].max()
+                    .sort_values(ascending=False).head(top).round(1))
+        report[route] = {
+            'total_ms': total_ms,
+            'budget_ms': budget,
+            'over_budget': budget is not None and total_ms > budget,
+            'modules': heaviest.to_dict(),
+        }
+    return report
+
+def _print_report(report):
+    for route, info in report.items():
+        flag = "OVER BUDGET" if info['over_budget'] else "ok"
+        print(f"=== {route}: {info['total_ms']:.0f} ms (งบ {info['budget_ms']} ms) [{flag}]")
+        for name, ms in info['modules'].items():
+            print(f"  {ms:8.1f} ms  {name}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="รายงานเวลา import ตอนเริ่มแอปของแต่ละหน้า")
+    parser.add_argument("routes", nargs="*", help="ชื่อหน้า (ค่าเริ่มต้น = ทุกหน้า)")
+    parser.add_argument("--top", type=int, default=10, help="จำนวน Package ที่แสดงต่อหน้า")
+    parser.add_argument("--json", action="store_true", help="พิมพ์ผลลัพธ์เป็น JSON")
+    args = parser.parse_args(argv)
+
+    unknown = [r for r in args.routes if r not in ROUTE_MODULES]
+    if unknown:
+        print(f"❌ ไม่รู้จักหน้า: {', '.join(unknown)} (มี: {', '.join(ROUTE_MODULES)})", file=sys.stderr)
+        return 2
+    routes = {r: ROUTE_MODULES[r] for r in args.routes} if args.routes else None
+
+    report = route_report(routes, top=args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+    return 1 if any(info['over_budget'] for info in report.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,82 +1,58 @@
+import os
+import re
+from functools import lru_cache
+
 import streamlit as st
 
-def load_custom_css():
-    """
-    โหลด CSS ปรับแต่งหน้าตา (ฉบับแก้บั๊ก Icon กลายเป็นตัวหนังสือ)
-    """
-    st.markdown("""
-    <style>
-        /* 1. IMPORT FONT */
-        @import url('https://fonts.googleapis.com/css2?family=Kanit:wght@300;400;500;600&display=swap');
-        /* Import Material Icons เพื่อความชัวร์ */
-        @import url('https://fonts.googleapis.com/icon?family=Material+Icons');
+# ==========================================
+# 🎨 STYLE
+# CSS อยู่ในไฟล์ static/css/ (ไม่โหลดไอคอนจาก CDN ภายนอก)
+# ฟอนต์ Kanit: ใช้ไฟล์ใน static/fonts/ (python -m utils.fetch_fonts) / ยังไม่มีไฟล์ -> โหลดจาก Google Fonts แบบเดิม
+# อ่าน + ย่อไฟล์ครั้งเดียวต่อ Process แล้วส่งเป็น <style> ล้วน (ไม่กินพื้นที่หน้าเว็บ)
+# ==========================================
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+# URL ของไฟล์ใน static/ (server.enableStaticServing ใน .streamlit/config.toml)
+STATIC_URL = "app/static"
+KANIT_FACES = {300: "Kanit-Light.ttf", 400: "Kanit-Regular.ttf", 500: "Kanit-Medium.ttf", 600: "Kanit-SemiBold.ttf"}
+KANIT_GOOGLE_FONTS_URL = "https://fonts.googleapis.com/css2?family=Kanit:wght@300;400;500;600&display=swap"
 
-        /* 2. GLOBAL FONT (SAFE MODE) 
-           ❌ เอา 'span', 'div', 'i' ออกจากบรรทัดนี้ เพื่อไม่ให้ไอคอนเพี้ยน */
-        html, body, h1, h2, h3, h4, h5, h6, p, li, button, input, textarea, label {
-            font-family: 'Kanit', sans-serif !important;
-        }
-        
-        /* สั่งเฉพาะ Text Container ของ Streamlit ให้เป็น Kanit */
-        [data-testid="stMarkdownContainer"] p, [data-testid="stMarkdownContainer"] span {
-             font-family: 'Kanit', sans-serif !important;
-        }
+@lru_cache(maxsize=None)
+def _minified_css(name):
+    with open(os.path.join(STATIC_DIR, "css", name), encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
 
-        /* 3. PROTECT ICONS (สำคัญมาก: กู้ชีพไอคอนลูกศร) */
-        /* ถ้าคลาสไหนเป็นไอคอน ให้กลับไปใช้ Font Icon ตามเดิม ห้ามใช้ Kanit */
-        i, .material-icons, .material-symbols-rounded, [data-testid="stExpander"] svg {
-            font-family: 'Material Icons' !important;
-            font-weight: normal;
-            font-style: normal;
-            display: inline-block;
-            white-space: nowrap;
-            word-wrap: normal;
-            direction: ltr;
-        }
+def static_url(path):
+    return f"{STATIC_URL}/{path}"
 
-        /* 4. FIX EXPANDER LAYOUT */
-        /* จัด layout ใหม่ ให้ลูกศรกับตัวหนังสือไม่ขี่กัน */
-        div[data-testid="stExpander"] summary {
-            display: flex !important;
-            align-items: center !important;
-            gap: 12px !important; /* ระยะห่างลูกศรกับข้อความ */
-        }
-        
-        /* ซ่อนข้อความขยะที่อาจหลุดมา (ถ้ายังเจอ keyboard_arrow_down) */
-        div[data-testid="stExpander"] summary .material-icons {
-            font-size: 24px !important;
-             /* ถ้ามันยังเป็นตัวหนังสือ ให้บังคับขนาด หรือซ่อนไปเลยแล้วใช้ SVG แทน */
-        }
+@lru_cache(maxsize=None)
+def _font_css():
+    # ประกาศ Kanit เฉพาะไฟล์ที่มีจริง (ไม่ให้ Browser ขอไฟล์ที่ไม่มีแล้วได้ 404 ทุกหน้า)
+    if all(os.path.exists(os.path.join(STATIC_DIR, "fonts", f)) for f in KANIT_FACES.values()):
+        return "".join(
+            f"@font-face{{font-family:'Kanit';src:url('{static_url('fonts/' + f)}') format('truetype');"
+            f"font-weight:{weight};font-display:swap}}"
+            for weight, f in KANIT_FACES.items()
+        )
+    return f"@import url('{KANIT_GOOGLE_FONTS_URL}');"
 
-        /* 5. PREMIUM METRIC CARDS */
-        div[data-testid="stMetric"] {
-            background-color: #FFFFFF;
-            padding: 15px;
-            border-radius: 12px;
-            border: 1px solid #E0E0E0;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-            text-align: center;
-        }
-        div[data-testid="stMetricLabel"] {
-            font-size: 0.9rem !important;
-            color: #607d8b !important;
-            font-family: 'Kanit', sans-serif !important; /* บังคับเฉพาะจุด */
-        }
-        div[data-testid="stMetricValue"] {
-            font-size: 1.6rem !important;
-            font-weight: 600 !important;
-            color: #00695C !important;
-            font-family: 'Kanit', sans-serif !important;
-        }
+def _inject_css(*names, fonts=False):
+    # @import ต้องอยู่ต้น <style> -> ใส่ CSS ของฟอนต์ก่อน
+    css = (_font_css() if fonts else "") + "".join(_minified_css(n) for n in names)
+    st.html("<style>" + css + "</style>")
 
-        /* 6. INPUT STYLING */
-        input {
-            font-family: 'Kanit', sans-serif !important;
-        }
+def load_custom_css():
+    """
+    โหลด CSS ปรับแต่งหน้าตาของทั้งแอป
+    """
+    _inject_css("app.css", fonts=True)
 
-        /* 7. BACKGROUND */
-        .stApp {
-            background-color: #F8F9FA;
-        }
-    </style>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+def load_card_css():
+    """
+    CSS ของบัตร Digital Asthma Card (ใช้เฉพาะหน้าที่แสดงบัตร)
+    """
+    _inject_css("card.css")
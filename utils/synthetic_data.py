@@ -0,0 +1,238 @@
+import argparse
+import os
+import sys
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from utils.calculations import calculate_predicted_pefr
+
+# ==========================================
+# 🧪 SYNTHETIC CLINIC (ข้อมูลจำลองสำหรับ Benchmark / ทดสอบ)
+# สร้างผู้ป่วย + Visit หลายปี + ไฟล์ส่งออกแบบ HOSxP (ไม่มีข้อมูลผู้ป่วยจริง)
+#   python -m utils.synthetic_data --scale 10k --out data/synthetic/10k
+# ==========================================
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+
+PATIENT_COLUMNS = ['hn', 'prefix', 'first_name', 'last_name', 'dob', 'best_pefr', 'height', 'status', 'public_token']
+VISIT_COLUMNS = ['hn', 'date', 'pefr', 'control_level', 'controller', 'reliever', 'adherence', 'drp',
+                 'advice', 'technique_check', 'next_appt', 'note', 'is_new_case', 'inhaler_eval', 'journal_id']
+
+FIRST_NAMES_MALE = ['สมชาย', 'สมศักดิ์', 'ประเสริฐ', 'วิชัย', 'สุรชัย', 'อนันต์', 'ธนากร', 'กิตติ', 'ณัฐวุฒิ', 'พิชิต',
+                    'ชัยวัฒน์', 'บุญมี', 'สุทธิพงษ์', 'อภิชาติ', 'ปกรณ์', 'ภานุวัฒน์', 'วีระ', 'ศุภชัย', 'เอกชัย', 'ธีรวัฒน์']
+FIRST_NAMES_FEMALE = ['สมหญิง', 'สุภาพร', 'มาลี', 'วันเพ็ญ', 'นภา', 'กมลวรรณ', 'ศิริพร', 'อรุณี', 'ปวีณา', 'จันทร์เพ็ญ',
+                      'พรทิพย์', 'รัตนา', 'สุนิสา', 'อัญชลี', 'ณัฐธิดา', 'เบญจวรรณ', 'ลำดวน', 'บุษบา', 'ชลธิชา', 'ปิยะนุช']
+LAST_NAMES = ['ใจดี', 'รักไทย', 'ศรีสุข', 'แก้วมณี', 'บุญมา', 'ทองดี', 'สุขสวัสดิ์', 'วงศ์ใหญ่', 'พรหมมา', 'จันทร์หอม',
+              'เพชรรัตน์', 'สายบุญ', 'มั่นคง', 'ศักดิ์สิทธิ์', 'อินทร์แก้ว', 'ประเสริฐวงศ์', 'ชัยมงคล', 'นาคสวัสดิ์',
+              'ทรัพย์สมบูรณ์', 'เจริญผล', 'คงสมบัติ', 'ภูมิพัฒน์', 'สิทธิโชค', 'บุญเรือง', 'ธนสาร']
+
+STATUSES = (['Active', 'Discharge', 'COPD'], [0.85, 0.1, 0.05])
+CONTROL_LEVELS = (['Well Controlled', 'Partly Controlled', 'Uncontrolled'], [0.55, 0.3, 0.15])
+# ค่า PEFR เทียบกับค่ามาตรฐาน ตามระดับการควบคุมอาการ (ค่าเฉลี่ย, ส่วนเบี่ยงเบน)
+CONTROL_PEFR_RATIO = {'Well Controlled': (0.9, 0.08), 'Partly Controlled': (0.72, 0.08), 'Uncontrolled': (0.55, 0.1)}
+CONTROLLERS = (['Seretide', 'Budesonide', 'Symbicort', 'Seretide, Budesonide', ''], [0.4, 0.25, 0.25, 0.05, 0.05])
+RELIEVERS = (['Salbutamol', 'Berodual', 'Salbutamol, Berodual', ''], [0.6, 0.2, 0.05, 0.15])
+DRPS = (['-', '', 'ลืมพ่นยา', 'พ่นยาผิดเทคนิค', 'ใช้ยาเกินขนาด', 'ไม่มารับยาตามนัด', 'แพ้ยา'],
+        [0.6, 0.15, 0.09, 0.07, 0.03, 0.05, 0.01])
+ADVICES = (['-', 'ออกกำลังกายสม่ำเสมอ', 'หลีกเลี่ยงควันบุหรี่', 'บ้วนปากหลังพ่นยา', 'พกยาฉุกเฉินติดตัว'],
+           [0.4, 0.15, 0.15, 0.15, 0.15])
+INHALER_EVALS = (['-', 'Score: 8/8 (Pass) | Fail: None', 'Score: 7/8 (Needs Improvement) | Fail: 1',
+                  'Score: 6/8 (Fail (Critical)) | Fail: 5,6', 'Score: 8/8 (Pass) | Fail: None | Adv:Rinse'],
+                 [0.55, 0.25, 0.1, 0.05, 0.05])
+
+def _choice(rng, options, n):
+    values, weights = options
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=weights)]
+
+def make_patients(n, rng, today=None):
+    """
+    ทะเบียนผู้ป่วย n คน (คอลัมน์เหมือน Sheet patients)
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    age = np.clip(rng.gamma(4.0, 11.0, n), 6, 90).astype(int)
+    male = rng.random(n) < 0.45
+    child = age < 15
+    married = rng.random(n) < 0.7
+
+    prefix = np.where(child, np.where(male, 'ด.ช.', 'ด.ญ.'),
+                      np.where(male, 'นาย', np.where(married, 'นาง', 'น.ส.')))
+    first = np.where(male, np.asarray(FIRST_NAMES_MALE, dtype=object)[rng.integers(0, len(FIRST_NAMES_MALE), n)],
+                     np.asarray(FIRST_NAMES_FEMALE, dtype=object)[rng.integers(0, len(FIRST_NAMES_FEMALE), n)])
+    last = np.asarray(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), n)]
+
+    # ส่วนสูงตามอายุ/เพศ (เด็กโตตามอายุ, ผู้ใหญ่ชาย ~168 หญิง ~157)
+    adult_height = np.where(male, rng.normal(168, 6, n), rng.normal(157, 5.5, n))
+    child_height = 80 + age * 6 + rng.normal(0, 5, n)
+    height = np.round(np.where(child, np.minimum(child_height, adult_height), adult_height)).astype(int)
+
+    dob = today - pd.to_timedelta(age * 365 + rng.integers(0, 365, n), unit='D')
+    predicted = np.array([calculate_predicted_pefr(a, h, p) for a, h, p in zip(age, height, prefix)])
+    # best_pefr: บางคนยังไม่เคยวัดค่าดีที่สุด (= 0 ใช้ค่ามาตรฐานแทน)
+    best = np.where(rng.random(n) < 0.3, 0, np.round(predicted * rng.normal(0.95, 0.1, n)).clip(60))
+
+    tokens = [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n)]
+    return pd.DataFrame({
+        'hn': [str(i).zfill(7) for i in rng.permutation(np.arange(1, n * 3))[:n]],
+        'prefix': prefix,
+        'first_name': first,
+        'last_name': last,
+        'dob': dob.strftime('%Y-%m-%d'),
+        'best_pefr': best.astype(int),
+        'height': height,
+        'status': _choice(rng, STATUSES, n),
+        'public_token': tokens,
+    }, columns=PATIENT_COLUMNS)
+
+def make_visits(patients, rng, years=3, visits_per_year=4, today=None):
+    """
+    Visit ย้อนหลังหลายปี (นัดทุก ~3 เดือน +- คลาดเคลื่อน) คอลัมน์เหมือน Sheet visits
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    n = len(patients)
+    per_patient = rng.poisson(years * visits_per_year, n).clip(1)
+    owner = np.repeat(np.arange(n), per_patient)
+    seq = np.arange(len(owner)) - np.repeat(np.cumsum(per_patient) - per_patient, per_patient)
+
+    # Visit ล่าสุดอยู่ภายใน 1 รอบนัดก่อนวันนี้ แล้วย้อนหลังทีละรอบ (seq 0 = Visit แรก)
+    interval = 365 / visits_per_year
+    last_gap = rng.integers(14, int(interval) + 14, n)
+    offsets = last_gap[owner] + (per_patient[owner] - 1 - seq) * interval + rng.normal(0, 7, len(owner))
+    dates = today - pd.to_timedelta(np.clip(offsets, 0, None).round(), unit='D')
+
+    age = ((today - pd.to_datetime(patients['dob'])).dt.days // 365).to_numpy()
+    predicted = np.array([
+        calculate_predicted_pefr(a, h, p)
+        for a, h, p in zip(age, patients['height'].to_numpy(), patients['prefix'].to_numpy())
+    ])
+    control = _choice(rng, CONTROL_LEVELS, len(owner))
+    ratio_mean = np.array([CONTROL_PEFR_RATIO[c][0] for c in control])
+    ratio_sd = np.array([CONTROL_PEFR_RATIO[c][1] for c in control])
+    pefr = np.round(predicted[owner] * rng.normal(ratio_mean, ratio_sd)).clip(50, 800).astype(int)
+    pefr[rng.random(len(owner)) < 0.08] = 0     # ญาติรับยาแทน / ไม่ได้เป่า
+
+    technique = np.where(rng.random(len(owner)) < 0.35, 'ทำ', 'ไม่')
+    inhaler_eval = np.where(technique == 'ทำ', _choice(rng, INHALER_EVALS, len(owner)), '-')
+    next_appt = dates + pd.to_timedelta(np.round(interval + rng.normal(0, 5, len(owner))), unit='D')
+
+    visits = pd.DataFrame({
+        'hn': patients['hn'].to_numpy()[owner],
+        'date': dates.strftime('%Y-%m-%d'),
+        'pefr': pefr,
+        'control_level': control,
+        'controller': _choice(rng, CONTROLLERS, len(owner)),
+        'reliever': _choice(rng, RELIEVERS, len(owner)),
+        'adherence': np.round(rng.beta(8, 2, len(owner)) * 100).astype(int),
+        'drp': _choice(rng, DRPS, len(owner)),
+        'advice': _choice(rng, ADVICES, len(owner)),
+        'technique_check': technique,
+        'next_appt': next_appt.strftime('%Y-%m-%d'),
+        'note': np.where(rng.random(len(owner)) < 0.05, '[ญาติรับแทน] -', ''),
+        'is_new_case': np.where(seq == 0, 'TRUE', 'FALSE'),
+        'inhaler_eval': inhaler_eval,
+        'journal_id': '',
+    }, columns=VISIT_COLUMNS)
+    # Sheet จริงเรียงตามลำดับที่บันทึก (วันที่เก่า -> ใหม่)
+    return visits.sort_values('date', kind='mergesort').reset_index(drop=True)
+
+def _hosxp_date(dates, rng, bad_rate):
+    # รูปแบบวันที่ปนกันแบบไฟล์จริง: dd/mm/yyyy (พ.ศ.), dd/mm/yyyy (ค.ศ.), yyyy-mm-dd, ค่าว่าง/อ่านไม่ได้
+    n = len(dates)
+    style = rng.choice(3, size=n, p=[0.6, 0.2, 0.2])
+    be = (dates.day.astype(str).str.zfill(2) + '/' + dates.month.astype(str).str.zfill(2) + '/'
+          + (dates.year + 543).astype(str))
+    ce = dates.strftime('%d/%m/%Y')
+    iso = dates.strftime('%Y-%m-%d')
+    out = np.where(style == 0, np.asarray(be), np.where(style == 1, np.asarray(ce), np.asarray(iso))).astype(object)
+    bad = rng.random(n) < bad_rate
+    out[bad] = rng.choice(np.array(['', '99/99/2567', 'ไม่ระบุ'], dtype=object), size=int(bad.sum()))
+    return out
+
+def make_hosxp_export(patients, visits, rows, rng, existing_rate=0.4, unknown_rate=0.05, bad_date_rate=0.01, today=None):
+    """
+    ไฟล์ส่งออกนัดหมายแบบ HOSxP: ปนกันระหว่าง Visit ที่มีอยู่แล้ว (บางแถวเลื่อนวันนัด),
+    Visit ใหม่, HN ที่ไม่มีในทะเบียน และวันที่ที่อ่านไม่ได้
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    n_existing = min(int(rows * existing_rate), len(visits))
+    n_unknown = int(rows * unknown_rate)
+    n_new = rows - n_existing - n_unknown
+
+    existing = visits.iloc[rng.choice(len(visits), n_existing, replace=False)] if n_existing else visits.iloc[0:0]
+    visit_dates = [pd.to_datetime(existing['date'])]
+    appt = pd.to_datetime(existing['next_appt'])
+    moved = rng.random(n_existing) < 0.3
+    appt_dates = [appt.where(~moved, appt + pd.to_timedelta(rng.integers(1, 30, n_existing), unit='D'))]
+    hns = [existing['hn'].to_numpy()]
+
+    new_owner = rng.integers(0, len(patients), n_new)
+    new_dates = today - pd.to_timedelta(rng.integers(0, 60, n_new), unit='D')
+    hns.append(patients['hn'].to_numpy()[new_owner])
+    visit_dates.append(pd.Series(new_dates))
+    appt_dates.append(pd.Series(new_dates + pd.to_timedelta(rng.integers(60, 120, n_new), unit='D')))
+
+    unknown_dates = today - pd.to_timedelta(rng.integers(0, 60, n_unknown), unit='D')
+    hns.append(np.array([str(h).zfill(7) for h in rng.integers(9_000_000, 9_999_999, n_unknown)], dtype=object))
+    visit_dates.append(pd.Series(unknown_dates))
+    appt_dates.append(pd.Series(unknown_dates + pd.to_timedelta(90, unit='D')))
+
+    visit_dates = pd.DatetimeIndex(pd.concat(visit_dates, ignore_index=True))
+    appt_dates = pd.DatetimeIndex(pd.concat(appt_dates, ignore_index=True))
+    hn_values = np.concatenate(hns)
+    # HOSxP ส่งออก HN แบบไม่มีเลข 0 นำหน้า
+    hn_values = np.array([h.lstrip('0') or '0' for h in hn_values], dtype=object)
+
+    export = pd.DataFrame({
+        'HN': hn_values,
+        'ชื่อ-สกุล': '-',
+        'วันที่รับบริการ': _hosxp_date(visit_dates, rng, bad_date_rate),
+        'คลินิก': 'คลินิกโรคหืด',
+        'วันนัดถัดไป': _hosxp_date(appt_dates, rng, bad_date_rate),
+    })
+    return export.iloc[rng.permutation(len(export))].reset_index(drop=True)
+
+def make_clinic(patients=1_000, seed=0, years=3, visits_per_year=4, hosxp_rows=None, today=None):
+    """
+    คลินิกจำลองทั้งชุด -> dict: patients, visits, hosxp (ผลลัพธ์เหมือนเดิมทุกครั้งเมื่อใช้ seed และ today เดิม)
+    """
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    rng = np.random.default_rng(seed)
+    patients_df = make_patients(patients, rng, today=today)
+    visits_df = make_visits(patients_df, rng, years=years, visits_per_year=visits_per_year, today=today)
+    hosxp_df = make_hosxp_export(patients_df, visits_df, hosxp_rows or max(patients // 2, 100), rng, today=today)
+    return {'patients': patients_df, 'visits': visits_df, 'hosxp': hosxp_df}
+
+def write_clinic(clinic, out_dir, hosxp_encoding='utf-8-sig'):
+    """
+    เขียนไฟล์: patients.csv, visits.csv (ตาราง Sheet) + hosxp_export.csv (ไฟล์นำเข้า)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name in ('patients', 'visits'):
+        paths[name] = os.path.join(out_dir, f"{name}.csv")
+        clinic[name].to_csv(paths[name], index=False)
+    paths['hosxp'] = os.path.join(out_dir, "hosxp_export.csv")
+    clinic['hosxp'].to_csv(paths['hosxp'], index=False, encoding=hosxp_encoding)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="สร้างข้อมูลคลินิกจำลอง (ผู้ป่วย, Visit, ไฟล์ HOSxP)")
+    parser.add_argument("--scale", choices=list(SCALES), default='1k', help="จำนวนผู้ป่วย")
+    parser.add_argument("--patients", type=int, default=None, help="กำหนดจำนวนผู้ป่วยเอง (แทน --scale)")
+    parser.add_argument("--years", type=int, default=3, help="จำนวนปีของ Visit ย้อนหลัง")
+    parser.add_argument("--hosxp-rows", type=int, default=None, help="จำนวนแถวในไฟล์ HOSxP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encoding", default='utf-8-sig', help="encoding ของไฟล์ HOSxP (เช่น cp874)")
+    parser.add_argument("--out", required=True, help="โฟลเดอร์ที่จะเขียนไฟล์")
+    args = parser.parse_args(argv)
+
+    clinic = make_clinic(args.patients or SCALES[args.scale], seed=args.seed, years=args.years,
+                         hosxp_rows=args.hosxp_rows)
+    paths = write_clinic(clinic, args.out, hosxp_encoding=args.encoding)
+    for name, path in paths.items():
+        print(f"{name}: {len(clinic[name]):,} แถว -> {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.clinics import clinic_path
+
+# ==========================================
+# 📓 VISIT JOURNAL (Write-Ahead)
+# บันทึก Visit ลงดิสก์ในเครื่องก่อน (ตอบกลับทันที)
+# แล้วมี Thread เบื้องหลังทยอยส่งขึ้น Google Sheets เป็น Batch + Retry
+# แต่ละคลินิกมีไฟล์ Journal ของตัวเอง (path = None -> ไฟล์ของคลินิกปัจจุบัน)
+# ==========================================
+
+VISIT_JOURNAL_PATH = os.environ.get(
+    "VISIT_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "visit_journal.sqlite")
+)
+JOURNAL_FLUSH_INTERVAL = 2       # วินาที ระหว่างรอบการส่ง (ตอนปกติ)
+JOURNAL_MAX_BACKOFF = 60         # วินาที สูงสุดตอนส่งไม่สำเร็จติดต่อกัน
+JOURNAL_BATCH_SIZE = 500
+JOURNAL_CLAIM_LEASE = 300         # วินาที ที่แถวถูกจองไว้ให้ Worker ที่ส่งอยู่ (เงียบนานกว่านี้ -> Worker อื่นส่งแทนได้)
+JOURNAL_MAX_ATTEMPTS = 5          # ส่งไม่ผ่านครบเท่านี้ (ขณะที่แถวอื่นส่งผ่าน) -> พักแถวไว้ให้เจ้าหน้าที่ตรวจสอบ
+JOURNAL_PROBE_ROWS = 3            # Batch ไม่ผ่าน -> ส่งทีละแถว ถ้าแถวแรกๆ เท่านี้ไม่ผ่านเลย ถือว่า Sheets ล่ม (หยุดรอรอบหน้า)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visit_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hn TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    flushed_at TEXT,
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_at TEXT,
+    parked_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_visit_journal_pending ON visit_journal (flushed_at, hn);
+"""
+
+# ไฟล์ที่สร้างตาราง/Migrate แล้วใน Process นี้ (ทำครั้งเดียวต่อไฟล์ ไม่ใช่ทุกครั้งที่เปิด Connection)
+_INITIALISED = set()
+_INIT_LOCK = threading.Lock()
+
+def _initialise(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    # ไฟล์จากเวอร์ชันก่อน -> เพิ่มคอลัมน์สำหรับจองแถวก่อนส่ง / พักแถวที่ส่งไม่ผ่าน
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(visit_journal)")}
+    for column in ('claimed_by', 'claimed_at', 'parked_at'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE visit_journal ADD COLUMN {column} TEXT")
+
+@contextmanager
+def _connect(path=None):
+    path = path or clinic_path(VISIT_JOURNAL_PATH)
+    conn = None
+    try:
+        # ไฟล์ถูกลบ/ย้ายระหว่างทำงาน -> สร้างตารางใหม่
+        if path not in _INITIALISED or not os.path.exists(path):
+            with _INIT_LOCK:
+                if path not in _INITIALISED or not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    conn = sqlite3.connect(path, timeout=30)
+                    _initialise(conn)
+                    _INITIALISED.add(path)
+        conn = conn or sqlite3.connect(path, timeout=30)
+        with conn:
+            yield conn
+    finally:
+        if conn is not None:
+            conn.close()
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def append_visit(data_dict, path=None):
+    """
+    บันทึก Visit ลง Journal (ลงดิสก์แล้วถือว่าบันทึกสำเร็จ) -> คืนค่า id
+    """
+    with _connect(path) as conn:
+        cur = conn.execute(
+            "INSERT INTO visit_journal (hn, payload, created_at) VALUES (?, ?, ?)",
+            (str(data_dict["hn"]), json.dumps(data_dict, ensure_ascii=False, default=str),
+             _now())
+        )
+        journal_id = cur.lastrowid
+    _flusher(path)['wake'].set()
+    return journal_id
+
+def pending_visits(hn=None, path=None):
+    """
+    Visit ที่ยังไม่ได้ส่งขึ้น Sheets รวมแถวที่พักไว้
+    (คอลัมน์เดียวกับ Sheet visits + journal_id, attempts, last_error, parked_at)
+    """
+    query = "SELECT id, payload, attempts, last_error, parked_at FROM visit_journal WHERE flushed_at IS NULL"
+    params = ()
+    if hn is not None:
+        query += " AND hn = ?"
+        params = (str(hn),)
+    with _connect(path) as conn:
+        rows = conn.execute(query + " ORDER BY id", params).fetchall()
+
+    records = [
+        {**json.loads(payload), 'journal_id': jid, 'attempts': attempts, 'last_error': last_error,
+         'parked_at': parked_at}
+        for jid, payload, attempts, last_error, parked_at in rows
+    ]
+    return pd.DataFrame(records)
+
+def pending_count(path=None):
+    # เฉพาะแถวที่รอส่งอัตโนมัติ (ไม่นับแถวที่พักไว้)
+    with _connect(path) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM visit_journal WHERE flushed_at IS NULL AND parked_at IS NULL"
+        ).fetchone()[0]
+
+def parked_count(path=None):
+    with _connect(path) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM visit_journal WHERE flushed_at IS NULL AND parked_at IS NOT NULL"
+        ).fetchone()[0]
+
+def requeue_parked(ids=None, path=None):
+    """
+    ให้แถวที่พักไว้กลับเข้าคิวส่งอัตโนมัติ (ids = None -> ทุกแถว) -> คืนค่าจำนวนแถว
+    """
+    query = "UPDATE visit_journal SET parked_at = NULL, attempts = 0 WHERE flushed_at IS NULL AND parked_at IS NOT NULL"
+    params = ()
+    if ids is not None:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        query += f" AND id IN ({','.join('?' * len(ids))})"
+        params = tuple(ids)
+    with _connect(path) as conn:
+        count = conn.execute(query, params).rowcount
+    if count:
+        _flusher(path)['wake'].set()
+    return count
+
+def merge_pending_visits(visits, pending):
+    """
+    รวม Visit ที่ยังไม่ถึง Sheets (จาก pending_visits) เข้ากับ Visit ของผู้ป่วย แล้วเรียงตามวันที่
+    แถวที่ Sheets มี journal_id เดียวกันแล้ว (ส่งถึงแล้วแต่ Cache ยังเก่า) -> ไม่ซ้ำ
+    """
+    if pending is None or pending.empty:
+        return visits
+    if 'journal_id' in visits.columns:
+        sent = set(visits['journal_id'].astype(str).str.strip())
+        pending = pending[~pending['journal_id'].astype(str).isin(sent)]
+        if pending.empty:
+            return visits
+    columns = list(visits.columns) or [c for c in pending.columns if c not in ('attempts', 'last_error', 'parked_at')]
+    extra = pending.reindex(columns=columns)
+    extra['date'] = pd.to_datetime(extra['date'], errors='coerce')
+    merged = extra if visits.empty else pd.concat([visits, extra])
+    return merged.sort_values('date', kind='mergesort')
+
+def _claim_batch(owner, batch_size, lease, path=None):
+    # จองแถวด้วย UPDATE คำสั่งเดียว (atomic) -> หลาย Thread/Process ที่ใช้ไฟล์เดียวกันไม่หยิบแถวเดียวกันไปส่ง
+    now = datetime.now()
+    expired = (now - timedelta(seconds=lease)).strftime("%Y-%m-%d %H:%M:%S")
+    with _connect(path) as conn:
+        conn.execute(
+            "UPDATE visit_journal SET claimed_by = ?, claimed_at = ? WHERE id IN ("
+            " SELECT id FROM visit_journal WHERE flushed_at IS NULL AND parked_at IS NULL"
+            " AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY id LIMIT ?)",
+            (owner, now.strftime("%Y-%m-%d %H:%M:%S"), expired, batch_size)
+        )
+        return conn.execute(
+            "SELECT id, payload FROM visit_journal WHERE claimed_by = ? AND flushed_at IS NULL ORDER BY id",
+            (owner,)
+        ).fetchall()
+
+def _records(rows):
+    # journal_id ติดไปกับแถวใน Sheet -> ส่งซ้ำ (เช่น lease หมดระหว่างส่ง) ไม่เกิดแถวซ้ำ
+    return [{**json.loads(payload), 'journal_id': jid} for jid, payload in rows]
+
+def _mark_flushed(ids, path=None):
+    with _connect(path) as conn:
+        conn.execute(
+            f"UPDATE visit_journal SET flushed_at = ?, attempts = attempts + 1, last_error = NULL "
+            f"WHERE id IN ({','.join('?' * len(ids))})",
+            (_now(), *ids)
+        )
+
+def _release(ids, owner, path=None, error=None):
+    """
+    ปล่อยแถวที่จองไว้ให้ส่งใหม่ได้ทันที (error = ส่งไม่ผ่าน -> นับครั้ง + เก็บข้อความ Error)
+    แถวที่ส่งไม่ผ่านครบ JOURNAL_MAX_ATTEMPTS ทั้งที่มีแถวอื่นส่งผ่านหลังจากบันทึกแถวนี้
+    (= แถวมีปัญหา ไม่ใช่ Sheets ล่ม) -> พักไว้ ไม่ส่งอัตโนมัติอีก ให้เจ้าหน้าที่ตรวจสอบ
+    """
+    if not ids:
+        return
+    placeholders = ",".join("?" * len(ids))
+    with _connect(path) as conn:
+        if error is None:
+            conn.execute(
+                f"UPDATE visit_journal SET claimed_by = NULL, claimed_at = NULL "
+                f"WHERE id IN ({placeholders}) AND claimed_by = ?",
+                (*ids, owner)
+            )
+            return
+        conn.execute(
+            f"UPDATE visit_journal SET attempts = attempts + 1, last_error = ?, claimed_by = NULL, "
+            f"claimed_at = NULL WHERE id IN ({placeholders}) AND claimed_by = ?",
+            ((str(error) or type(error).__name__)[:500], *ids, owner)
+        )
+        conn.execute(
+            f"UPDATE visit_journal SET parked_at = ? WHERE id IN ({placeholders}) AND flushed_at IS NULL "
+            f"AND attempts >= ? AND EXISTS (SELECT 1 FROM visit_journal AS sent "
+            f"WHERE sent.flushed_at >= visit_journal.created_at)",
+            (_now(), *ids, JOURNAL_MAX_ATTEMPTS)
+        )
+
+def _flush_one_by_one(write_fn, rows, owner, path=None):
+    """
+    Batch ส่งไม่ผ่าน -> ส่งทีละแถว (แถวที่มีปัญหาแถวเดียวไม่ขวางแถวอื่นทั้งคิว)
+    แถวแรกๆ ไม่ผ่านเลย (น่าจะ Sheets ล่ม) หรือไม่ผ่านทุกแถว -> Error ถูกส่งต่อ
+    """
+    sent, last_error = 0, None
+    for i, (jid, payload) in enumerate(rows):
+        try:
+            write_fn(_records([(jid, payload)]))
+        except BaseException as e:
+            _release([jid], owner, path, error=e)
+            last_error = e
+            if not isinstance(e, Exception) or (not sent and i + 1 >= JOURNAL_PROBE_ROWS):
+                _release([r[0] for r in rows[i + 1:]], owner, path)
+                raise
+            continue
+        _mark_flushed([jid], path)
+        sent += 1
+    if not sent:
+        raise last_error
+    return sent
+
+def flush_pending(write_fn, batch_size=JOURNAL_BATCH_SIZE, path=None, lease=JOURNAL_CLAIM_LEASE):
+    """
+    ส่ง Visit ที่ค้างอยู่ด้วย write_fn(list ของ dict + journal_id) ทีละ Batch ตามลำดับที่บันทึก
+    จองแถวก่อนส่ง (แถวที่ Worker อื่นจองไว้และยังไม่หมด lease / แถวที่พักไว้ -> ข้าม)
+    คืนค่าจำนวนที่ส่งสำเร็จ (ถ้าส่งไม่สำเร็จ -> Error ถูกส่งต่อ และแถวยังค้างอยู่ใน Journal)
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    flushed = 0
+    while True:
+        rows = _claim_batch(owner, batch_size, lease, path)
+        if not rows:
+            return flushed
+
+        ids = [r[0] for r in rows]
+        try:
+            write_fn(_records(rows))
+        except BaseException as e:
+            if len(rows) > 1 and isinstance(e, Exception):
+                flushed += _flush_one_by_one(write_fn, rows, owner, path)
+                continue
+            # รวม st.stop() (ไม่ใช่ Exception) -> ปล่อยแถวที่จองไว้ให้ส่งใหม่ได้ทันที
+            _release(ids, owner, path, error=e)
+            raise
+        _mark_flushed(ids, path)
+        flushed += len(ids)
+
+def purge_flushed(older_than_days=30, path=None):
+    # ลบรายการที่ส่งสำเร็จนานแล้ว (ไม่ให้ไฟล์ Journal โตไม่จำกัด)
+    cutoff = (pd.Timestamp.now() - pd.Timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    with _connect(path) as conn:
+        return conn.execute(
+            "DELETE FROM visit_journal WHERE flushed_at IS NOT NULL AND flushed_at < ?", (cutoff,)
+        ).rowcount
+
+# --- Background Flusher (1 Thread ต่อไฟล์ Journal = ต่อคลินิก) ---
+_FLUSHER_LOCK = threading.Lock()
+_FLUSHERS = {}   # path -> {'thread', 'wake', 'last_error', 'last_flush'}
+
+def _flusher(path=None):
+    path = path or clinic_path(VISIT_JOURNAL_PATH)
+    with _FLUSHER_LOCK:
+        if path not in _FLUSHERS:
+            _FLUSHERS[path] = {'thread': None, 'wake': threading.Event(), 'last_error': None, 'last_flush': None}
+        return _FLUSHERS[path]
+
+def _flusher_loop(write_fn, path, state):
+    delay = JOURNAL_FLUSH_INTERVAL
+    while True:
+        state['wake'].wait(timeout=delay)
+        state['wake'].clear()
+        try:
+            if flush_pending(write_fn, path=path):
+                state['last_flush'] = datetime.now()
+            state['last_error'] = None
+            delay = JOURNAL_FLUSH_INTERVAL
+        except BaseException as e:
+            # Sheets ล่ม/ช้า -> รอนานขึ้นเรื่อยๆ (Exponential Backoff)
+            # รวม st.stop() / StopException ที่ไม่ใช่ Exception -> Thread ต้องไม่ตาย (ไม่งั้น Visit ค้างใน Journal)
+            state['last_error'] = str(e) or type(e).__name__
+            delay = min(delay * 2, JOURNAL_MAX_BACKOFF)
+
+def start_journal_flusher(write_fn, path=None):
+    """
+    เริ่ม Thread ส่งข้อมูลเบื้องหลังของไฟล์ Journal นี้ (เรียกซ้ำได้ จะเริ่มแค่ครั้งเดียวต่อไฟล์)
+    """
+    path = path or clinic_path(VISIT_JOURNAL_PATH)
+    state = _flusher(path)
+    with _FLUSHER_LOCK:
+        thread = state['thread']
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_flusher_loop, args=(write_fn, path, state),
+                                      name=f"visit-journal-flusher:{os.path.basename(path)}", daemon=True)
+            thread.start()
+            state['thread'] = thread
+    return thread
+
+def flusher_status(path=None):
+    state = _flusher(path)
+    return {
+        'running': state['thread'] is not None and state['thread'].is_alive(),
+        'last_error': state['last_error'],
+        'last_flush': state['last_flush'],
+    }
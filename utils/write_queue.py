@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# ==========================================
+# ✍️ WRITE QUEUE (Group Commit)
+# หลาย Session บันทึกพร้อมกัน -> รวมเป็นการเขียน 1 ครั้ง
+# คนแรกที่เข้าคิวเป็น "Leader" รอสั้นๆ ให้คนอื่นเข้ามารวม แล้วเขียนทีเดียว
+# ==========================================
+
+WRITE_GROUP_WINDOW = 0.05     # วินาทีที่ Leader รอรวมรายการก่อนเขียน
+WRITE_MAX_BATCH = 1000        # จำนวนแถวสูงสุดต่อการเขียน 1 ครั้ง
+WRITE_TIMEOUT = 120
+
+class GroupCommitQueue:
+    def __init__(self, flush_fn, window=WRITE_GROUP_WINDOW, max_batch=WRITE_MAX_BATCH):
+        self._flush_fn = flush_fn
+        self._window = window
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        # Lock ของ Sheet: งานที่อ้างอิงตำแหน่งแถวต้องไม่ทำพร้อมกับการเขียนแถวใหม่
+        self._sheet_lock = threading.RLock()
+        self._pending = []
+        self._leader_active = False
+        self.stats = {'submitted': 0, 'flushes': 0, 'rows_written': 0}
+
+    def submit(self, rows, timeout=WRITE_TIMEOUT):
+        """
+        เข้าคิวเขียนแถว แล้วรอจนเขียนเสร็จ (Error ของการเขียนจะถูกส่งกลับมาที่ผู้เรียก)
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        future = Future()
+        with self._lock:
+            self._pending.append((rows, future))
+            self.stats['submitted'] += 1
+            is_leader = not self._leader_active
+            if is_leader:
+                self._leader_active = True
+
+        if is_leader:
+            time.sleep(self._window)
+            self._drain()
+        return future.result(timeout=timeout)
+
+    def _take_batch(self):
+        with self._lock:
+            if not self._pending:
+                self._leader_active = False
+                return []
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self._max_batch):
+                item = self._pending.pop(0)
+                batch.append(item)
+                size += len(item[0])
+            return batch
+
+    def _drain(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            all_rows = [row for rows, _ in batch for row in rows]
+            try:
+                with self._sheet_lock:
+                    self._flush_fn(all_rows)
+            except BaseException as e:
+                # รวม st.stop() (ไม่ใช่ Exception) -> ต้องส่งกลับให้ทุกคนที่รออยู่ ไม่ให้ค้าง
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['rows_written'] += len(all_rows)
+            for rows, future in batch:
+                future.set_result(len(rows))
+
+    def depth(self):
+        # จำนวนแถวที่รอเขียนอยู่ในคิว (ยังไม่ถึงรอบของ Leader)
+        with self._lock:
+            return sum(len(rows) for rows, _ in self._pending)
+
+    @contextmanager
+    def exclusive(self):
+        # ใช้ตอนอัปเดตแถวตามตำแหน่ง (ไม่ให้มีการเขียนแถวใหม่แทรกระหว่างตรวจสอบ/เขียน)
+        with self._sheet_lock:
+            yield
+
+def resolve_row_positions(updates, sheet_keys, key_fn):
+    """
+    ตรวจตำแหน่งแถวก่อนเขียน: sheet_keys = รายการ key ของทุกแถวใน Sheet (ไม่รวม Header)
+    คืนค่า (รายการที่ตำแหน่งถูกต้อง/ย้ายไปตำแหน่งใหม่, รายการที่หาแถวไม่เจอ, จำนวนที่ย้ายตำแหน่ง)
+    """
+    row_of = {}
+    for i, key in enumerate(sheet_keys):
+        row_of[key] = i + 2   # Header = แถว 1
+    resolved, stale, relocated = [], [], 0
+
+    for item in updates:
+        key = key_fn(item)
+        row = item['row']
+        if 0 <= row - 2 < len(sheet_keys) and sheet_keys[row - 2] == key:
+            resolved.append(item)
+        elif key in row_of:
+            resolved.append({**item, 'row': row_of[key]})
+            relocated += 1
+        else:
+            stale.append(item)
+    return resolved, stale, relocated
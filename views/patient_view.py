@@ -2,24 +2,24 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from utils.calculations import (
-    calculate_predicted_pefr, 
     get_action_plan_zone, 
-    plot_pefr_chart, 
-    check_technique_status
+    plot_pefr_chart
 )
+from utils.patient_index import sync_patient_index
+from utils.style import static_url
 
-def render_patient_view(target_hn, patients_db, visits_db):
-    if target_hn in patients_db['hn'].values:
-        # ดึงข้อมูลคนไข้
-        pt_data = patients_db[patients_db['hn'] == target_hn].iloc[0]
-        pt_visits = visits_db[visits_db['hn'] == target_hn]
+def render_patient_view(target_hn, patients_db, visits_db, clinic=None):
+    patient_index = sync_patient_index(patients_db, visits_db, name="public", clinic=clinic)
+    summary = patient_index.get(target_hn)
+
+    if summary:
+        # ดึงข้อมูลคนไข้ (Keyed Lookup จาก Index)
+        pt_data = patient_index.patient_row(target_hn, patients_db)
+        pt_visits = patient_index.patient_visits(target_hn, visits_db)
         
         # คำนวณข้อมูลพื้นฐาน
-        dob = pd.to_datetime(pt_data['dob'])
-        age = (datetime.now() - dob).days // 365
-        height = pt_data['height']
-        predicted_pefr = calculate_predicted_pefr(age, height, pt_data['prefix'])
-        ref_pefr = predicted_pefr if predicted_pefr > 0 else pt_data['best_pefr']
+        age = summary['age']
+        ref_pefr = summary['ref_pefr']
 
         # ฟังก์ชัน Mask ชื่อ
         def mask_text(text):
@@ -33,7 +33,7 @@ def render_patient_view(target_hn, patients_db, visits_db):
         display_name = f"{pt_data['prefix']}{masked_fname} {masked_lname}"
 
         # --- Header ---
-        st.image("https://img.icons8.com/color/96/asthma.png", width=60)
+        st.markdown(f'<img src="{static_url("img/asthma.svg")}" width="60" alt="asthma">', unsafe_allow_html=True)
         st.title(f"สวัสดี {display_name} 👋")
         
         with st.container(border=True):
@@ -44,15 +44,9 @@ def render_patient_view(target_hn, patients_db, visits_db):
 
         # --- ส่วนข้อมูลจาก Visit ล่าสุด (ยา & คำแนะนำ) ---
         if not pt_visits.empty:
-            # เรียงตามวันที่เพื่อเอาข้อมูลล่าสุด
-            last_visit_any = pt_visits.sort_values(by="date").iloc[-1]
-            
-            # 1. ยาที่ใช้ปัจจุบัน (Current Medication)
-            curr_controller = str(last_visit_any.get('controller', '-')).strip()
-            curr_reliever = str(last_visit_any.get('reliever', '-')).strip()
-            
-            if curr_controller in ['nan', 'None', '']: curr_controller = "-"
-            if curr_reliever in ['nan', 'None', '']: curr_reliever = "-"
+            # 1. ยาที่ใช้ปัจจุบัน (Current Medication) จาก Visit ล่าสุด
+            curr_controller = summary['last_controller']
+            curr_reliever = summary['last_reliever']
             
             if curr_controller != "-" or curr_reliever != "-":
                 with st.container(border=True):
@@ -72,25 +66,18 @@ def render_patient_view(target_hn, patients_db, visits_db):
                             st.markdown("-")
             
             # ✅ 2. เพิ่มส่วนแสดง Advice (คำแนะนำจากเภสัชกร)
-            # พยายามดึงจาก key 'note' หรือ 'advice'
-            curr_advice = str(last_visit_any.get('advice', '-')).strip()
-            if curr_advice in ['-', '', 'nan', 'None']:
-                curr_advice = str(last_visit_any.get('advice', '-')).strip()
+            curr_advice = summary['last_advice']
             
-            if curr_advice not in ['-', '', 'nan', 'None']:
+            if curr_advice != "-":
                 with st.container(border=True):
                     st.markdown("##### 💬 คำแนะนำเภสัชกร (ล่าสุด)")
                     st.info(f"ℹ️ {curr_advice}")
 
         # --- ส่วนวันนัดหมาย ---
         if not pt_visits.empty:
-            # ใช้ last_visit_any จากด้านบน (หรือหาใหม่ถ้ายังไม่มี)
-            if 'last_visit_any' not in locals():
-                last_visit_any = pt_visits.sort_values(by="date").iloc[-1]
-                
-            next_appt = str(last_visit_any.get('next_appt', '-')).strip()
+            next_appt = summary['last_next_appt']
             
-            if next_appt and next_appt not in ['-', '', 'nan', 'None']:
+            if next_appt != "-":
                 try:
                     next_appt_dt = pd.to_datetime(next_appt)
                     formatted_date = next_appt_dt.strftime('%d/%m/%Y')
@@ -111,7 +98,7 @@ def render_patient_view(target_hn, patients_db, visits_db):
                     st.info(f"📅 **นัดครั้งถัดไป:** {next_appt}")
 
         # --- เทคนิคพ่นยา ---
-        tech_status, _, tech_last_date = check_technique_status(pt_visits)
+        tech_status, tech_last_date = summary['tech_status'], summary['tech_last_date']
         
         with st.container(border=True):
             c_icon, c_text = st.columns([1, 4])
@@ -147,11 +134,10 @@ def render_patient_view(target_hn, patients_db, visits_db):
 
         # --- ผลการประเมินล่าสุด (Logic กรอง 0 ออก) ---
         if not pt_visits.empty:
-            pt_visits['date'] = pd.to_datetime(pt_visits['date'])
-            sorted_visits = pt_visits.sort_values(by="date")
+            sorted_visits = pt_visits
             
             # กรองหา Visit ที่มีการเป่าจริง (PEFR > 0)
-            valid_pefr_visits = sorted_visits[sorted_visits['pefr'] > 0]
+            valid_pefr_visits = sorted_visits[pd.to_numeric(sorted_visits['pefr'], errors='coerce') > 0]
             
             if not valid_pefr_visits.empty:
                 last_valid_visit = valid_pefr_visits.iloc[-1]
@@ -248,7 +234,15 @@ def render_patient_view(target_hn, patients_db, visits_db):
 
                 # กราฟ (ส่งเฉพาะข้อมูลที่มีการเป่าจริงไปพล็อต)
                 st.subheader("📈 กราฟแสดงค่าการเป่าปอด (Peak Flow)")
-                chart = plot_pefr_chart(valid_pefr_visits, ref_pefr)
+                chart_range = None
+                first_d = valid_pefr_visits['date'].min().date()
+                last_d = valid_pefr_visits['date'].max().date()
+                if (last_d - first_d).days > 365:
+                    chart_range = st.slider(
+                        "ช่วงเวลาที่แสดงในกราฟ", min_value=first_d, max_value=last_d,
+                        value=(first_d, last_d), format="DD/MM/YYYY"
+                    )
+                chart = plot_pefr_chart(valid_pefr_visits, ref_pefr, date_range=chart_range)
                 st.altair_chart(chart, use_container_width=True)
 
             else:
@@ -1,27 +1,18 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
-import qrcode
-import io
-import base64
 import uuid
 
 # Import Utils
 # ✅ 1. เพิ่ม log_action ในบรรทัดนี้
-from utils.gsheet_handler import save_patient_data, save_visit_data, update_patient_status, update_patient_token, log_action
-from utils.calculations import (
-    calculate_predicted_pefr, get_action_plan_zone, get_percent_predicted,
-    check_technique_status, plot_pefr_chart, generate_qr
-)
-
-def get_base64_qr(data):
-    qr = qrcode.QRCode(version=1, box_size=10, border=1)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+from utils.gsheet_handler import save_patient_data, save_visit_data, update_patient_status, log_action
+from utils.calculations import plot_pefr_chart, get_card_zone_limits, pefr_date_bounds
+from utils.qr_service import get_qr_base64
+from utils.patient_index import sync_patient_index
+from utils.patient_search import get_search_index
+from utils.clinics import patient_link
+from utils.visit_journal import pending_visits, merge_pending_visits, requeue_parked
+from utils.style import load_card_css
 
 def render_register_patient(patients_db):
     st.title("➕ ลงทะเบียนผู้ป่วยรายใหม่")
@@ -82,13 +73,21 @@ def render_search_patient(patients_db, visits_db, base_url):
             del st.session_state[k]
         st.session_state['reset_visit_form'] = False
 
-    hn_list = patients_db['hn'].unique().tolist()
-    hn_list.sort()
-    selected_hn = st.sidebar.selectbox("เลือกผู้ป่วย", hn_list)
+    # ค้นหาจาก Index (ไม่ต้องสร้าง/เรียงรายชื่อ HN ใหม่ทุก Rerun)
+    search_index = get_search_index(patients_db)
+    search_query = st.sidebar.text_input("🔎 ค้นหาผู้ป่วย", placeholder="HN / ชื่อ / นามสกุล / สถานะ")
+    hn_list = search_index.search(search_query) if search_query.strip() else search_index.all_hns
+    if search_query.strip() and not hn_list:
+        st.sidebar.caption("ไม่พบผู้ป่วยที่ตรงกับคำค้น")
+    selected_hn = st.sidebar.selectbox("เลือกผู้ป่วย", hn_list, format_func=search_index.label)
     
-    if selected_hn:
-        pt_data = patients_db[patients_db['hn'] == selected_hn].iloc[0]
-        pt_visits = visits_db[visits_db['hn'] == selected_hn]
+    # ดึงข้อมูลสรุปจาก Index (ไม่ต้องกรอง/เรียงทั้งตารางทุกครั้งที่ Rerun)
+    patient_index = sync_patient_index(patients_db, visits_db, name="staff")
+    summary = patient_index.get(selected_hn) if selected_hn else None
+
+    if summary:
+        pt_data = patient_index.patient_row(selected_hn, patients_db)
+        pt_visits = patient_index.patient_visits(selected_hn, visits_db)
         
         current_status = pt_data.get('status', 'Active')
         if pd.isna(current_status) or str(current_status).strip() == "":
@@ -98,16 +97,10 @@ def render_search_patient(patients_db, visits_db, base_url):
         if current_status == "Discharge": status_color = "grey"
         elif current_status == "COPD": status_color = "orange"
 
+        # Token สร้างแบบ Bulk ตอนโหลดข้อมูล (app.py) -> ที่นี่อ่านอย่างเดียว
         public_token = pt_data.get('public_token', '')
         if pd.isna(public_token) or str(public_token).strip() == "" or str(public_token).lower() == "nan":
-            with st.spinner("Creating Secure Token..."):
-                new_token = str(uuid.uuid4())
-                if update_patient_token(selected_hn, new_token):
-                    log_action("Admin", "Generate Token", f"HN: {selected_hn}") # ✅ 3. Log สร้าง Token
-                    public_token = new_token
-                    st.rerun()
-                else:
-                    st.error("Failed to generate token")
+            public_token = None
 
         c_head, c_status = st.columns([3, 1])
         with c_head:
@@ -131,11 +124,28 @@ def render_search_patient(patients_db, visits_db, base_url):
                             st.success(f"เปลี่ยนสถานะเป็น {new_status} เรียบร้อย!")
                             st.rerun()
 
-        dob = pd.to_datetime(pt_data['dob'])
-        age = (datetime.now() - dob).days // 365
+        # Visit ที่บันทึกแล้วแต่ยังรอส่งขึ้น Google Sheets (จาก Journal ในเครื่อง) -> รวมในประวัติ/กราฟด้วย
+        pt_pending = pending_visits(selected_hn)
+        if not pt_pending.empty:
+            parked = pt_pending['parked_at'].notna()
+            waiting = int((~parked).sum())
+            if waiting:
+                st.warning(f"⏳ มี {waiting} Visit ที่บันทึกแล้ว กำลังรอส่งขึ้นระบบ (แสดงรวมในประวัติและกราฟแล้ว)")
+            if parked.any():
+                # ส่งไม่ผ่านซ้ำหลายครั้ง -> ระบบหยุดส่งอัตโนมัติ ให้เจ้าหน้าที่ตรวจสอบ
+                st.error(f"🚫 มี {int(parked.sum())} Visit ส่งขึ้นระบบไม่สำเร็จหลายครั้ง (หยุดส่งอัตโนมัติ) กรุณาตรวจสอบข้อมูล")
+                pending_cols = [c for c in ['date', 'pefr', 'control_level', 'next_appt', 'attempts', 'last_error'] if c in pt_pending.columns]
+                st.dataframe(pt_pending.loc[parked, pending_cols], hide_index=True, use_container_width=True)
+                if st.button("🔁 ลองส่งใหม่", key=f"requeue_{selected_hn}"):
+                    requeue_parked(pt_pending.loc[parked, 'journal_id'].tolist())
+                    log_action("Admin", "Requeue Visits", f"HN: {selected_hn}")
+                    st.rerun()
+            pt_visits = merge_pending_visits(pt_visits, pt_pending)
+
+        age = summary['age']
         height = pt_data.get('height', 0)
-        predicted_pefr = calculate_predicted_pefr(age, height, pt_data['prefix'])
-        ref_pefr = predicted_pefr if predicted_pefr > 0 else pt_data['best_pefr']
+        predicted_pefr = summary['predicted_pefr']
+        ref_pefr = summary['ref_pefr']
         
         c1, c2, c3, c4 = st.columns(4)
         c1.metric("HN", pt_data['hn'])
@@ -149,33 +159,27 @@ def render_search_patient(patients_db, visits_db, base_url):
         default_relievers = []
 
         if not pt_visits.empty:
-            pt_visits['date'] = pd.to_datetime(pt_visits['date'], errors='coerce')
-            pt_visits_sorted = pt_visits.sort_values(by="date")
-            last_actual_visit = pt_visits_sorted.iloc[-1]
-            
             def parse_meds(med_str, available_opts):
-                if pd.isna(med_str) or str(med_str).strip() == "": return []
+                if pd.isna(med_str) or str(med_str).strip() in ["", "-"]: return []
                 items = [x.strip() for x in str(med_str).split(",")]
                 return [x for x in items if x in available_opts]
 
-            default_controllers = parse_meds(last_actual_visit.get('controller'), controller_options)
-            default_relievers = parse_meds(last_actual_visit.get('reliever'), reliever_options)
+            default_controllers = parse_meds(summary['last_controller'], controller_options)
+            default_relievers = parse_meds(summary['last_reliever'], reliever_options)
 
             st.markdown("---")
-            valid_pefr_visits = pt_visits_sorted[pt_visits_sorted['pefr'] > 0]
             
-            if not valid_pefr_visits.empty:
-                last_valid_visit = valid_pefr_visits.iloc[-1]
-                current_pefr = last_valid_visit['pefr']
-                visit_date_str = last_valid_visit['date'].strftime('%d/%m/%Y')
+            if summary['last_valid_pefr'] > 0:
+                current_pefr = summary['last_valid_pefr']
+                visit_date_str = summary['last_valid_date'].strftime('%d/%m/%Y')
                 
-                zone_name, zone_color, advice = get_action_plan_zone(current_pefr, ref_pefr)
-                pct_std = get_percent_predicted(current_pefr, ref_pefr)
+                zone_name, zone_color = summary['zone_name'], summary['zone_color']
+                pct_std = summary['pct_predicted']
                 
                 st.info(f"📋 **สถานะล่าสุด ({visit_date_str})**")
                 
-                if last_actual_visit['date'] != last_valid_visit['date']:
-                    last_actual_str = last_actual_visit['date'].strftime('%d/%m/%Y')
+                if summary['last_visit_date'] != summary['last_valid_date']:
+                    last_actual_str = summary['last_visit_date'].strftime('%d/%m/%Y')
                     st.caption(f"ℹ️ (ล่าสุดเมื่อ {last_actual_str} ไม่ได้เป่า Peak Flow ระบบจึงแสดงผลจากครั้งก่อนหน้า)")
                 
                 s1, s2, s3, s4 = st.columns([1, 1, 1.5, 1.8])
@@ -191,11 +195,7 @@ def render_search_patient(patients_db, visits_db, base_url):
                     """, unsafe_allow_html=True)
                 
                 with s4:
-                    raw_ctrl = last_valid_visit.get('control_level', '-')
-                    if pd.isna(raw_ctrl) or str(raw_ctrl).strip() in ['', 'nan', 'None']:
-                        ctrl_lvl = "-"
-                    else:
-                        ctrl_lvl = str(raw_ctrl).strip()
+                    ctrl_lvl = summary['last_valid_control_level']
 
                     if "Uncontrolled" in ctrl_lvl:
                         c_color = "#EF4444"
@@ -220,11 +220,11 @@ def render_search_patient(patients_db, visits_db, base_url):
             else:
                 st.warning("⚠️ ยังไม่มีข้อมูลการเป่า Peak Flow (มีแต่ประวัติรับยา)")
             
-            last_drp = str(last_actual_visit.get('drp', '')).strip()
-            if last_drp and last_drp != "-" and last_drp.lower() != "nan":
+            last_drp = summary['last_drp']
+            if last_drp != "-":
                 st.warning(f"⚠️ **DRP ครั้งล่าสุด:** {last_drp}")
 
-            tech_status, tech_days, tech_last_date = check_technique_status(pt_visits)
+            tech_status, tech_days = summary['tech_status'], summary['tech_days']
             st.write("") 
             if tech_status == "overdue":
                 st.error(f"🚨 **Alert: ขาดทบทวนเทคนิคพ่นยา!** (เลยมา {tech_days} วัน)")
@@ -236,17 +236,26 @@ def render_search_patient(patients_db, visits_db, base_url):
         st.divider()
         st.subheader("📈 กราฟติดตามอาการ")
         if not pt_visits.empty:
-            valid_pefr_visits_all = pt_visits_sorted[pt_visits_sorted['pefr'] > 0]
+            valid_pefr_visits_all = pt_visits[pd.to_numeric(pt_visits['pefr'], errors='coerce') > 0]
             if not valid_pefr_visits_all.empty:
-                chart = plot_pefr_chart(valid_pefr_visits_all, ref_pefr)
+                # ประวัติยาวกว่า 1 ปี -> ให้เลือกช่วงเวลาที่ต้องการซูมดู
+                chart_range = None
+                bounds = pefr_date_bounds(valid_pefr_visits_all)
+                first_d, last_d = bounds if bounds else (None, None)
+                if bounds and (last_d - first_d).days > 365:
+                    # key แยกตาม HN: ช่วงวันที่ของผู้ป่วยแต่ละคนต่างกัน (ค่าของคนก่อนอาจอยู่นอกช่วง)
+                    chart_range = st.slider(
+                        "ช่วงเวลาที่แสดงในกราฟ", min_value=first_d, max_value=last_d,
+                        value=(first_d, last_d), format="DD/MM/YYYY", key=f"chart_range_{selected_hn}"
+                    )
+                chart = plot_pefr_chart(valid_pefr_visits_all, ref_pefr, date_range=chart_range)
                 st.altair_chart(chart, use_container_width=True)
             else:
                 st.caption("ไม่มีข้อมูลกราฟ")
 
         with st.expander("ประวัติการรักษาทั้งหมด"):
             if not pt_visits.empty:
-                history_df = pt_visits.copy()
-                history_df = history_df.sort_values(by="date", ascending=False)
+                history_df = pt_visits.iloc[::-1].copy()
                 history_df['date'] = history_df['date'].dt.strftime('%d/%m/%Y')
                 st.dataframe(history_df, use_container_width=True)
             else:
@@ -255,266 +264,225 @@ def render_search_patient(patients_db, visits_db, base_url):
         st.divider()
         st.subheader("📝 บันทึก Visit")
         
-        inhaler_summary_text = "-" 
-        tech_check_status = "ไม่"
-
-        with st.container(border=True):
-            st.markdown("##### 🎯 การประเมินเทคนิคพ่นยา (Optional)")
-            is_teach_and_assess = st.checkbox("✅ ต้องการสอน/ประเมินเทคนิคพ่นยาในครั้งนี้", key="assess_toggle")
-
-            if is_teach_and_assess:
-                tech_check_status = "ทำ"
-                st.info("📝 **แบบประเมินเทคนิค MDI (Inhaler Device Technique)**")
-                steps = [
-                    "(1) เขย่าหลอดพ่นยาในแนวตั้ง 3-4 ครั้ง",
-                    "(2) ถือหลอดพ่นยาในแนวตั้ง",
-                    "(3) หายใจออกทางปากให้สุดเต็มที่",
-                    "(4) ตั้งศีรษะให้ตรง",
-                    "(5) ใช้ริมฝีปากอมปากหลอดพ่นยาให้สนิท",
-                    "(6) หายใจเข้าทางปากช้าๆ ลึกๆ พร้อมกดที่พ่นยา 1 ครั้ง",
-                    "(7) กลั้นลมหายใจประมาณ 10 วินาที",
-                    "(8) ผ่อนลมหายใจออกทางปากหรือจมูกช้าๆ"
-                ]
-                checks = []
-                cols_check = st.columns(2)
-                for i, step in enumerate(steps):
-                    with cols_check[i % 2]:
-                        checks.append(st.checkbox(step, value=True, key=f"step_{i}"))
-
-                score = sum(checks)
-                critical_fail = []
-                if not checks[4]: critical_fail.append("ข้อ 5 (อมไม่สนิท)")
-                if not checks[5]: critical_fail.append("ข้อ 6 (กดพร้อมสูด)")
-                if not checks[6]: critical_fail.append("ข้อ 7 (กลั้นหายใจ)")
-
-                inhaler_status = ""
-                if critical_fail:
-                    st.error(f"🚨 **Critical Fail:** {', '.join(critical_fail)}")
-                    st.toast("⚠️ กรุณาสอนเทคนิคใหม่ทันที!", icon="📢")
-                    inhaler_status = "Fail (Critical)"
-                elif score == 8:
-                    st.success("✅ เทคนิคถูกต้องสมบูรณ์ (Perfect)")
-                    inhaler_status = "Pass"
-                else:
-                    st.warning(f"⚠️ ยังไม่สมบูรณ์ (ขาด {8-score} ข้อ)")
-                    inhaler_status = "Needs Improvement"
-                
-                st.markdown("---")
-                st.write("**คำแนะนำเพิ่มเติม:**")
-                c_adv1, c_adv2 = st.columns(2)
-                adv_rinse = c_adv1.checkbox("แนะนำบ้วนปาก", key="adv_rinse")
-                adv_clean = c_adv2.checkbox("แนะนำล้างอุปกรณ์", key="adv_clean")
-
-                failed_indices = [i+1 for i, x in enumerate(checks) if not x]
-                fail_str = ",".join(map(str, failed_indices)) if failed_indices else "None"
-                inhaler_summary_text = f"Score: {score}/8 ({inhaler_status}) | Fail: {fail_str}"
-                if adv_rinse: inhaler_summary_text += " | Adv:Rinse"
-                if adv_clean: inhaler_summary_text += " | Adv:Clean"
-
-        with st.form("new_visit", clear_on_submit=True):
-            col_a, col_b = st.columns(2)
-            v_date = col_a.date_input("วันที่", value=date.today())
-            v_is_new = col_a.checkbox("🆕 เป็นผู้ป่วยรายใหม่ (New Case)") 
-            with col_b:
-                v_pefr = st.number_input("PEFR (L/min)", 0, 999, step=10)
-                v_no_pefr = st.checkbox("ไม่ได้เป่า Peak Flow (N/A)")
-            
-            v_control = st.radio(
-                "Control Level", 
-                ["Well Controlled", "Partly Controlled", "Uncontrolled"], 
-                horizontal=True
-            )
-            
-            c_med1, c_med2 = st.columns(2)
-            v_cont = c_med1.multiselect("Controller", controller_options, default=default_controllers)
-            v_rel = c_med2.multiselect("Reliever", reliever_options, default=default_relievers)
-            
-            if default_controllers or default_relievers:
-                st.caption("✨ ระบบดึงรายการยาจากครั้งล่าสุดมาให้แล้ว")
+        # แต่ละส่วนเป็น Fragment: ติ๊ก Checkbox / กรอกฟอร์ม แล้ว Rerun เฉพาะส่วนนั้น (ไม่โหลดข้อมูล/วาดกราฟใหม่)
+        _render_inhaler_assessment()
+        _render_visit_form(selected_hn, controller_options, reliever_options, default_controllers, default_relievers)
+        if public_token:
+            # CSS ของบัตรอยู่นอก Fragment -> Fragment Rerun ไม่ต้องส่ง CSS ซ้ำ
+            load_card_css()
+            _render_digital_card(pt_data, selected_hn, base_url, public_token, predicted_pefr)
+        else:
+            st.warning("⚠️ ผู้ป่วยรายนี้ยังไม่มี Public Token (ระบบจะสร้างให้อัตโนมัติในการโหลดข้อมูลครั้งถัดไป)")
+
+@st.fragment
+def _render_inhaler_assessment():
+    """
+    แบบประเมินเทคนิคพ่นยา -> เก็บผลใน session_state['inhaler_assessment'] ให้ฟอร์มบันทึก Visit อ่านตอนกดบันทึก
+    """
+    inhaler_summary_text = "-"
+    tech_check_status = "ไม่"
+
+    with st.container(border=True):
+        st.markdown("##### 🎯 การประเมินเทคนิคพ่นยา (Optional)")
+        is_teach_and_assess = st.checkbox("✅ ต้องการสอน/ประเมินเทคนิคพ่นยาในครั้งนี้", key="assess_toggle")
+
+        if is_teach_and_assess:
+            tech_check_status = "ทำ"
+            st.info("📝 **แบบประเมินเทคนิค MDI (Inhaler Device Technique)**")
+            steps = [
+                "(1) เขย่าหลอดพ่นยาในแนวตั้ง 3-4 ครั้ง",
+                "(2) ถือหลอดพ่นยาในแนวตั้ง",
+                "(3) หายใจออกทางปากให้สุดเต็มที่",
+                "(4) ตั้งศีรษะให้ตรง",
+                "(5) ใช้ริมฝีปากอมปากหลอดพ่นยาให้สนิท",
+                "(6) หายใจเข้าทางปากช้าๆ ลึกๆ พร้อมกดที่พ่นยา 1 ครั้ง",
+                "(7) กลั้นลมหายใจประมาณ 10 วินาที",
+                "(8) ผ่อนลมหายใจออกทางปากหรือจมูกช้าๆ"
+            ]
+            checks = []
+            cols_check = st.columns(2)
+            for i, step in enumerate(steps):
+                with cols_check[i % 2]:
+                    checks.append(st.checkbox(step, value=True, key=f"step_{i}"))
+
+            score = sum(checks)
+            critical_fail = []
+            if not checks[4]: critical_fail.append("ข้อ 5 (อมไม่สนิท)")
+            if not checks[5]: critical_fail.append("ข้อ 6 (กดพร้อมสูด)")
+            if not checks[6]: critical_fail.append("ข้อ 7 (กลั้นหายใจ)")
+
+            inhaler_status = ""
+            if critical_fail:
+                st.error(f"🚨 **Critical Fail:** {', '.join(critical_fail)}")
+                st.toast("⚠️ กรุณาสอนเทคนิคใหม่ทันที!", icon="📢")
+                inhaler_status = "Fail (Critical)"
+            elif score == 8:
+                st.success("✅ เทคนิคถูกต้องสมบูรณ์ (Perfect)")
+                inhaler_status = "Pass"
+            else:
+                st.warning(f"⚠️ ยังไม่สมบูรณ์ (ขาด {8-score} ข้อ)")
+                inhaler_status = "Needs Improvement"
 
-            c_adh, c_chk = st.columns(2)
-            v_adh = c_adh.slider("ความร่วมมือ (%)", 0, 100, 100)
-            v_relative_pickup = c_adh.checkbox("ญาติรับยาแทน")
-            
-            v_drp = st.text_area("DRP")
-            v_adv = st.text_area("Advice")
-            v_note = st.text_input("หมายเหตุ")
-            v_next = st.date_input("นัดถัดไป", value=date.today() + timedelta(days=90))
-            
-            if st.form_submit_button("💾 บันทึกข้อมูล"):
-                visit_errors = []
-                if v_next < v_date:
-                    visit_errors.append(f"วันนัดถัดไป ({v_next}) ต้องไม่ใช่อดีต (ก่อนวันที่ตรวจ {v_date})")
-                elif v_next == v_date:
-                    st.warning("⚠️ วันนัดถัดไปเป็นวันเดียวกับวันนี้ (ตรวจสอบว่าถูกต้องหรือไม่)")
-
-                if not v_no_pefr:
-                    if v_pefr == 0:
-                        visit_errors.append("ค่า PEFR เป็น 0 (ถ้าไม่ได้เป่า ให้ติ๊กช่อง 'ไม่ได้เป่า')")
-                    elif v_pefr > 900:
-                        visit_errors.append(f"ค่า PEFR สูงผิดปกติ ({v_pefr}) กรุณาตรวจสอบ")
-                
-                if v_relative_pickup and not v_no_pefr and v_pefr > 0:
-                    st.warning("⚠️ แจ้งเตือน: ญาติรับยาแต่มีการกรอกค่า PEFR (คนไข้มาด้วยหรือไม่?)")
+            st.markdown("---")
+            st.write("**คำแนะนำเพิ่มเติม:**")
+            c_adv1, c_adv2 = st.columns(2)
+            adv_rinse = c_adv1.checkbox("แนะนำบ้วนปาก", key="adv_rinse")
+            adv_clean = c_adv2.checkbox("แนะนำล้างอุปกรณ์", key="adv_clean")
+
+            failed_indices = [i+1 for i, x in enumerate(checks) if not x]
+            fail_str = ",".join(map(str, failed_indices)) if failed_indices else "None"
+            inhaler_summary_text = f"Score: {score}/8 ({inhaler_status}) | Fail: {fail_str}"
+            if adv_rinse: inhaler_summary_text += " | Adv:Rinse"
+            if adv_clean: inhaler_summary_text += " | Adv:Clean"
+
+    st.session_state['inhaler_assessment'] = {
+        'technique_check': tech_check_status,
+        'inhaler_eval': inhaler_summary_text,
+    }
+
+@st.fragment
+def _render_visit_form(selected_hn, controller_options, reliever_options, default_controllers, default_relievers):
+    with st.form("new_visit", clear_on_submit=True):
+        col_a, col_b = st.columns(2)
+        v_date = col_a.date_input("วันที่", value=date.today())
+        v_is_new = col_a.checkbox("🆕 เป็นผู้ป่วยรายใหม่ (New Case)") 
+        with col_b:
+            v_pefr = st.number_input("PEFR (L/min)", 0, 999, step=10)
+            v_no_pefr = st.checkbox("ไม่ได้เป่า Peak Flow (N/A)")
+
+        v_control = st.radio(
+            "Control Level", 
+            ["Well Controlled", "Partly Controlled", "Uncontrolled"], 
+            horizontal=True
+        )
+
+        c_med1, c_med2 = st.columns(2)
+        v_cont = c_med1.multiselect("Controller", controller_options, default=default_controllers)
+        v_rel = c_med2.multiselect("Reliever", reliever_options, default=default_relievers)
+
+        if default_controllers or default_relievers:
+            st.caption("✨ ระบบดึงรายการยาจากครั้งล่าสุดมาให้แล้ว")
+
+        c_adh, c_chk = st.columns(2)
+        v_adh = c_adh.slider("ความร่วมมือ (%)", 0, 100, 100)
+        v_relative_pickup = c_adh.checkbox("ญาติรับยาแทน")
+
+        v_drp = st.text_area("DRP")
+        v_adv = st.text_area("Advice")
+        v_note = st.text_input("หมายเหตุ")
+        v_next = st.date_input("นัดถัดไป", value=date.today() + timedelta(days=90))
+
+        if st.form_submit_button("💾 บันทึกข้อมูล"):
+            visit_errors = []
+            if v_next < v_date:
+                visit_errors.append(f"วันนัดถัดไป ({v_next}) ต้องไม่ใช่อดีต (ก่อนวันที่ตรวจ {v_date})")
+            elif v_next == v_date:
+                st.warning("⚠️ วันนัดถัดไปเป็นวันเดียวกับวันนี้ (ตรวจสอบว่าถูกต้องหรือไม่)")
+
+            if not v_no_pefr:
+                if v_pefr == 0:
+                    visit_errors.append("ค่า PEFR เป็น 0 (ถ้าไม่ได้เป่า ให้ติ๊กช่อง 'ไม่ได้เป่า')")
+                elif v_pefr > 900:
+                    visit_errors.append(f"ค่า PEFR สูงผิดปกติ ({v_pefr}) กรุณาตรวจสอบ")
+
+            if v_relative_pickup and not v_no_pefr and v_pefr > 0:
+                st.warning("⚠️ แจ้งเตือน: ญาติรับยาแต่มีการกรอกค่า PEFR (คนไข้มาด้วยหรือไม่?)")
+
+            if visit_errors:
+                for err in visit_errors:
+                    st.error(f"❌ {err}")
+                return
 
-                if visit_errors:
-                    for err in visit_errors:
-                        st.error(f"❌ {err}")
-                    return
+            actual_pefr = 0 if v_no_pefr else v_pefr
+            actual_adherence = 0 if v_relative_pickup else v_adh
+            final_note = f"[ญาติรับแทน] {v_note}" if v_relative_pickup else v_note
+
+            # ผลประเมินเทคนิคพ่นยาจาก Fragment แบบประเมิน
+            assessment = st.session_state.get('inhaler_assessment', {})
+            tech_check_status = assessment.get('technique_check', "ไม่")
+            inhaler_summary_text = assessment.get('inhaler_eval', "-")
+
+            new_data = {
+                "hn": selected_hn, "date": str(v_date), "pefr": actual_pefr,
+                "control_level": v_control, 
+                "controller": ", ".join(v_cont),
+                "reliever": ", ".join(v_rel), 
+                "adherence": actual_adherence,
+                "drp": v_drp, "advice": v_adv, 
+                "technique_check": tech_check_status,
+                "next_appt": str(v_next), "note": final_note, 
+                "is_new_case": "TRUE" if v_is_new else "FALSE",
+                "inhaler_eval": inhaler_summary_text
+            }
 
-                actual_pefr = 0 if v_no_pefr else v_pefr
-                actual_adherence = 0 if v_relative_pickup else v_adh
-                final_note = f"[ญาติรับแทน] {v_note}" if v_relative_pickup else v_note
-                
-                new_data = {
-                    "hn": selected_hn, "date": str(v_date), "pefr": actual_pefr,
-                    "control_level": v_control, 
-                    "controller": ", ".join(v_cont),
-                    "reliever": ", ".join(v_rel), 
-                    "adherence": actual_adherence,
-                    "drp": v_drp, "advice": v_adv, 
-                    "technique_check": tech_check_status,
-                    "next_appt": str(v_next), "note": final_note, 
-                    "is_new_case": "TRUE" if v_is_new else "FALSE",
-                    "inhaler_eval": inhaler_summary_text
-                }
-                
-                try:
-                    save_visit_data(new_data)
-                    log_action("Admin", "Record Visit", f"HN: {selected_hn}, Date: {v_date}") # ✅ 5. Log บันทึก Visit
-                    
-                    st.session_state['reset_visit_form'] = True
-                    
-                    st.success("บันทึกสำเร็จ")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"เกิดข้อผิดพลาดในการบันทึก: {e}")
+            try:
+                save_visit_data(new_data)
+                log_action("Admin", "Record Visit", f"HN: {selected_hn}, Date: {v_date}") # ✅ 5. Log บันทึก Visit
 
-        st.divider()
-        st.subheader("📇 Digital Asthma Card")
-        link = f"{base_url}/?token={public_token}"
-        
-        card_best_pefr = int(predicted_pefr)
-        if card_best_pefr == 0:
-            card_best_pefr = pt_data.get('best_pefr', 0)
-
-        if card_best_pefr > 0:
-            green_lim = int(card_best_pefr * 0.8)
-            yellow_lim = int(card_best_pefr * 0.6)
-            txt_g = f"> {green_lim}"
-            txt_y = f"{yellow_lim} - {green_lim}"
-            txt_r = f"< {yellow_lim}"
-        else:
-            txt_g, txt_y, txt_r = "-", "-", "-"
-
-        qr_b64 = get_base64_qr(link)
-
-        card_html = f"""
-        <style>
-            .asthma-card {{
-                position: relative;
-                width: 100%;
-                max-width: 420px;
-                padding-top: 63%; 
-                background: linear-gradient(135deg, #ffffff 0%, #f1f5f9 100%);
-                border-radius: 16px;
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-                border: 1px solid #cbd5e1;
-                overflow: hidden;
-                font-family: 'Kanit', sans-serif;
-                color: #334155;
-            }}
-            .card-content {{
-                position: absolute;
-                top: 0; left: 0; bottom: 0; right: 0;
-                padding: 16px 20px;
-                display: flex;
-                flex-direction: column;
-                justify-content: space-between;
-            }}
-            .card-header {{
-                display: flex; justify-content: space-between; align-items: flex-start;
-                margin-bottom: 5px;
-            }}
-            .card-chip {{
-                width: 42px; height: 28px;
-                background: linear-gradient(135deg, #e2e8f0 0%, #94a3b8 100%);
-                border-radius: 6px; border: 1px solid #64748b; opacity: 0.8;
-            }}
-            .card-logo {{
-                font-size: 10px; font-weight: bold; color: #94a3b8; letter-spacing: 1px; text-transform: uppercase;
-            }}
-            .card-body {{
-                display: flex; justify-content: space-between; align-items: center; flex: 1;
-            }}
-            .info-col {{ 
-                flex: 1; padding-right: 10px; display: flex; flex-direction: column; justify-content: center;
-            }}
-            .pt-name {{ 
-                font-size: 18px; font-weight: 600; color: #1e293b; line-height: 1.3; margin-bottom: 6px;
-                display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; overflow: hidden;
-            }}
-            .pt-meta {{ font-size: 12px; color: #64748B; }}
-            .pt-meta b {{ color: #0f172a; font-size: 14px; font-weight: 600; }}
-            .qr-box {{
-                background: white; padding: 4px; border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.08); border: 1px solid #e2e8f0;
-                display: flex; align-items: center; justify-content: center; flex-shrink: 0;
-            }}
-            .zone-container {{ display: flex; gap: 6px; margin-top: auto; }}
-            .zone-box {{ 
-                flex: 1; padding: 6px 2px; border-radius: 8px; text-align: center; 
-                display: flex; flex-direction: column; justify-content: center; 
-            }}
-            .z-green {{ background: #DCFCE7; border: 1px solid #86EFAC; color: #166534; }}
-            .z-yellow {{ background: #FEF9C3; border: 1px solid #FDE047; color: #854D0E; }}
-            .z-red {{ background: #FEE2E2; border: 1px solid #FCA5A5; color: #991B1B; }}
-            .z-lbl {{ font-size: 8px; font-weight: 700; text-transform: uppercase; margin-bottom: 2px; opacity: 0.9; }}
-            .z-val {{ font-size: 11px; font-weight: 800; letter-spacing: 0.5px; }}
-        </style>
-        
-        <div class="asthma-card">
-            <div class="card-content">
-                <div class="card-header">
-                    <div class="card-chip"></div>
-                    <div class="card-logo">Asthma Care Card</div>
-                </div>
-                <div class="card-body">
-                    <div class="info-col">
-                        <div class="pt-name">{pt_data['prefix']}{pt_data['first_name']} {pt_data['last_name']}</div>
-                        <div class="pt-meta">
-                            HN: {selected_hn} <br> 
-                            Ref. PEFR: <b>{card_best_pefr}</b>
-                        </div>
-                    </div>
-                    <div class="qr-box">
-                        <img src="data:image/png;base64,{qr_b64}" width="65" height="65" style="display:block; border-radius: 4px;">
+                st.session_state['reset_visit_form'] = True
+
+                st.success("บันทึกสำเร็จ (กำลังส่งข้อมูลขึ้นระบบเบื้องหลัง)")
+                st.rerun(scope="app")  # ข้อมูลเปลี่ยน -> Rerun ทั้งหน้า
+            except Exception as e:
+                st.error(f"เกิดข้อผิดพลาดในการบันทึก: {e}")
+
+@st.fragment
+def _render_digital_card(pt_data, selected_hn, base_url, public_token, predicted_pefr):
+    st.divider()
+    st.subheader("📇 Digital Asthma Card")
+    link = patient_link(base_url, public_token)
+
+    card_best_pefr = int(predicted_pefr)
+    if card_best_pefr == 0:
+        card_best_pefr = pt_data.get('best_pefr', 0)
+
+    txt_g, txt_y, txt_r = get_card_zone_limits(card_best_pefr)
+
+    qr_b64 = get_qr_base64(link, box_size=10, border=1, error_correction="M")
+
+    card_html = f"""
+    <div class="asthma-card">
+        <div class="card-content">
+            <div class="card-header">
+                <div class="card-chip"></div>
+                <div class="card-logo">Asthma Care Card</div>
+            </div>
+            <div class="card-body">
+                <div class="info-col">
+                    <div class="pt-name">{pt_data['prefix']}{pt_data['first_name']} {pt_data['last_name']}</div>
+                    <div class="pt-meta">
+                        HN: {selected_hn} <br> 
+                        Ref. PEFR: <b>{card_best_pefr}</b>
                     </div>
                 </div>
-                <div class="zone-container">
-                    <div class="zone-box z-green">
-                        <span class="z-lbl">Normal</span>
-                        <span class="z-val">{txt_g}</span>
-                    </div>
-                    <div class="zone-box z-yellow">
-                        <span class="z-lbl">Caution</span>
-                        <span class="z-val">{txt_y}</span>
-                    </div>
-                    <div class="zone-box z-red">
-                        <span class="z-lbl">Danger</span>
-                        <span class="z-val">{txt_r}</span>
-                    </div>
+                <div class="qr-box">
+                    <img src="data:image/png;base64,{qr_b64}" width="65" height="65" style="display:block; border-radius: 4px;">
+                </div>
+            </div>
+            <div class="zone-container">
+                <div class="zone-box z-green">
+                    <span class="z-lbl">Normal</span>
+                    <span class="z-val">{txt_g}</span>
+                </div>
+                <div class="zone-box z-yellow">
+                    <span class="z-lbl">Caution</span>
+                    <span class="z-val">{txt_y}</span>
+                </div>
+                <div class="zone-box z-red">
+                    <span class="z-lbl">Danger</span>
+                    <span class="z-val">{txt_r}</span>
                 </div>
             </div>
         </div>
-        """
-        
-        c_main, c_dummy = st.columns([1.5, 1])
-        with c_main:
-            st.markdown(card_html, unsafe_allow_html=True)
-            
-            st.write("")
-            col_b1, col_b2 = st.columns(2)
-            col_b1.link_button("🔗 เปิดหน้าคนไข้", link, use_container_width=True)
-            with col_b2.popover("🔗 Copy Link"):
-                st.code(link)
+    </div>
+    """
+
+    c_main, c_dummy = st.columns([1.5, 1])
+    with c_main:
+        st.markdown(card_html, unsafe_allow_html=True)
+
+        st.write("")
+        col_b1, col_b2 = st.columns(2)
+        col_b1.link_button("🔗 เปิดหน้าคนไข้", link, use_container_width=True)
+        with col_b2.popover("🔗 Copy Link"):
+            st.code(link)
@@ -0,0 +1,64 @@
+import streamlit as st
+from datetime import datetime, date, timedelta
+from utils.gsheet_handler import log_action
+from utils.card_batch import (
+    select_card_patients, build_card_jobs, render_cards, cards_to_pdf, cards_to_zip, card_font_path
+)
+
+def render_bulk_cards(patients_db, visits_db, base_url):
+    st.title("🖨️ พิมพ์บัตรผู้ป่วย (Bulk)")
+    st.info("💡 สร้าง Digital Asthma Card หลายรายพร้อมกัน สำหรับงานออกหน่วย / แจกบัตร")
+    if card_font_path() is None:
+        st.warning("⚠️ ไม่พบฟอนต์ภาษาไทยสำหรับวาดบัตร (ชื่อผู้ป่วยจะอ่านไม่ออก) -> รัน `python -m utils.fetch_fonts`")
+
+    # 1. ตัวกรองผู้ป่วย
+    with st.form("bulk_card_filter"):
+        statuses = st.multiselect("สถานะผู้ป่วย", ["Active", "Discharge", "COPD"], default=["Active"])
+        use_appt = st.checkbox("กรองตามช่วงวันนัดถัดไป")
+        c1, c2 = st.columns(2)
+        appt_from = c1.date_input("ตั้งแต่วันที่", value=date.today())
+        appt_to = c2.date_input("ถึงวันที่", value=date.today() + timedelta(days=30))
+        output_type = st.radio("รูปแบบไฟล์", ["PDF (พร้อมพิมพ์ A4)", "ZIP (รูปภาพ PNG)"], horizontal=True)
+        submitted = st.form_submit_button("🖨️ สร้างบัตร", type="primary")
+
+    if not submitted:
+        return
+
+    if use_appt and appt_to < appt_from:
+        st.error("❌ ช่วงวันนัดไม่ถูกต้อง (วันที่สิ้นสุดต้องไม่ก่อนวันที่เริ่มต้น)")
+        return
+
+    selected = select_card_patients(
+        patients_db, visits_db, statuses=statuses,
+        appt_from=appt_from if use_appt else None,
+        appt_to=appt_to if use_appt else None
+    )
+    jobs, skipped = build_card_jobs(selected, base_url)
+
+    if skipped:
+        st.warning(f"⚠️ ข้าม {len(skipped)} ราย เนื่องจากยังไม่มี Token: {', '.join(skipped[:10])}{' ...' if len(skipped) > 10 else ''}")
+
+    if not jobs:
+        st.warning("⚠️ ไม่พบผู้ป่วยตามเงื่อนไขที่เลือก")
+        return
+
+    # 2. วาดบัตรแบบขนาน พร้อมแสดงความคืบหน้า
+    progress = st.progress(0, text=f"กำลังสร้างบัตร 0/{len(jobs)}")
+
+    def on_progress(done, total):
+        progress.progress(int(done / total * 100), text=f"กำลังสร้างบัตร {done}/{total}")
+
+    card_images = render_cards(jobs, progress_callback=on_progress)
+    progress.progress(100, text=f"✅ สร้างบัตรเสร็จ {len(card_images)} ใบ")
+
+    # 3. ดาวน์โหลด
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    if output_type.startswith("PDF"):
+        data = cards_to_pdf(card_images)
+        file_name, mime = f"asthma_cards_{timestamp}.pdf", "application/pdf"
+    else:
+        data = cards_to_zip(card_images)
+        file_name, mime = f"asthma_cards_{timestamp}.zip", "application/zip"
+
+    log_action("Admin", "Bulk Print Cards", f"{len(card_images)} cards")
+    st.download_button("📥 ดาวน์โหลดไฟล์บัตร", data=data, file_name=file_name, mime=mime, type="primary")
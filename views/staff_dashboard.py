@@ -3,9 +3,7 @@ import pandas as pd
 import altair as alt
 from datetime import datetime, timedelta
 import io
-from utils.style import load_custom_css
-
-load_custom_css()
+from utils.calculations import compute_technique_status_table
 
 def render_dashboard(visits_df, patients_df):
     if visits_df.empty:
@@ -259,6 +257,49 @@ def render_dashboard(visits_df, patients_df):
         else:
             st.info("ยังไม่มีข้อมูลการสอนพ่นยา")
 
+    # --- ส่วนที่ 4.1: ผู้ป่วยที่ต้องทบทวนเทคนิคพ่นยาในเดือนนี้ ---
+    st.divider()
+    st.subheader("🎯 ผู้ป่วยที่ต้องทบทวนเทคนิคพ่นยา (ภายในเดือนนี้)")
+
+    active_pts = patients_df.copy()
+    if 'status' in active_pts.columns:
+        active_pts = active_pts[active_pts['status'].fillna('').isin(['', 'Active'])]
+
+    tech_table = compute_technique_status_table(visits_df, all_hns=active_pts['hn']).reset_index()
+    month_end = (pd.Timestamp(today_date) + pd.offsets.MonthEnd(0)).normalize()
+    due_table = tech_table[(tech_table['status'] != 'valid') | (tech_table['due_date'] <= month_end)]
+
+    if not due_table.empty:
+        due_table = pd.merge(due_table, active_pts[['hn', 'prefix', 'first_name', 'last_name']], on='hn', how='left')
+        due_table['full_name'] = due_table['prefix'].fillna('') + due_table['first_name'].fillna('') + " " + due_table['last_name'].fillna('')
+        due_table['status_text'] = due_table['status'].map({
+            'never': "🚨 ยังไม่เคยสอน",
+            'overdue': "⚠️ เลยกำหนด",
+            'valid': "📅 ครบกำหนดเดือนนี้",
+        })
+        due_table = due_table.sort_values(by=['status', 'due_date', 'hn'], na_position='first')
+
+        t1, t2, t3 = st.columns(3)
+        t1.metric("ยังไม่เคยสอน", f"{(due_table['status'] == 'never').sum()} คน")
+        t2.metric("เลยกำหนด", f"{(due_table['status'] == 'overdue').sum()} คน")
+        t3.metric("ครบกำหนดเดือนนี้", f"{(due_table['status'] == 'valid').sum()} คน")
+
+        with st.expander(f"📂 ดูรายชื่อ ({len(due_table)} คน)", expanded=False):
+            st.dataframe(
+                due_table[['hn', 'full_name', 'status_text', 'last_tech_date', 'due_date']],
+                column_config={
+                    "hn": "HN",
+                    "full_name": "ชื่อ-สกุล",
+                    "status_text": "สถานะ",
+                    "last_tech_date": st.column_config.DateColumn("สอนล่าสุด", format="DD/MM/YYYY"),
+                    "due_date": st.column_config.DateColumn("ครบกำหนด", format="DD/MM/YYYY"),
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+    else:
+        st.success("✅ ไม่มีผู้ป่วยที่ต้องทบทวนเทคนิคพ่นยาในเดือนนี้")
+
     # --- ส่วนที่ 5: สถิติ DRP ---
     st.divider()
     st.subheader("💊 5. สถิติปัญหาจากการใช้ยา (DRP Summary)")
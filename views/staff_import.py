@@ -1,189 +1,165 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-from utils.gsheet_handler import save_multiple_visits
+from utils.gsheet_handler import save_multiple_visits, update_appointments_batch
+from utils.hosxp_import import (
+    stream_hosxp_file, diff_import, applied_import_rows, file_content_hash, IMPORT_ACTIONS, IMPORT_CHUNK_SIZE
+)
+from utils.import_ledger import find_imported_file, filter_known_rows, record_import, import_history
+from utils.frame_diff import frame_version
 
 def render_import_appointment(patients_db, visits_db):
     st.title("📥 นำเข้าข้อมูลนัดหมาย (จาก HOSxP)")
     
     st.info("💡 อัปโหลดไฟล์ Excel/CSV ที่ Export จาก HOSxP เพื่อบันทึกวันนัดหมายลงระบบอัตโนมัติ")
     
+    # ประวัติการนำเข้า (จาก Import Ledger)
+    with st.expander("📒 ประวัติการนำเข้า"):
+        history_df = import_history(limit=50)
+        if not history_df.empty:
+            history_df.columns = ['เวลา', 'ไฟล์', 'ผู้นำเข้า', 'จำนวนแถว', 'เพิ่มใหม่', 'อัปเดต', 'ข้าม (เคยนำเข้า)', 'File Hash']
+            st.dataframe(history_df, hide_index=True, use_container_width=True)
+        else:
+            st.caption("ยังไม่มีประวัติการนำเข้า")
+
     # 1. Upload File
     uploaded_file = st.file_uploader("เลือกไฟล์ (.csv หรือ .xls)", type=['csv', 'xls', 'xlsx'])
+    ignore_ledger = st.checkbox("นำเข้าใหม่ทั้งหมด (ไม่ข้ามแถว/ไฟล์ที่เคยนำเข้าแล้ว)")
     
     if uploaded_file is not None:
-        df = None
-        error_msg = ""
-        
-        # --- 🛠️ ส่วนอ่านไฟล์แบบ Robust (ลองหลายๆ แบบจนกว่าจะอ่านออก) ---
-        # รายชื่อ Encoding ที่ HOSxP ชอบใช้
-        encodings_to_try = ['utf-8', 'cp874', 'tis-620', 'utf-16', 'utf-16le', 'utf-16be']
-        
-        try:
-            # กรณีไฟล์ .csv (หรือ xls ปลอมที่เป็น csv)
-            if uploaded_file.name.lower().endswith(('.csv', '.xls')): 
-                for encoding in encodings_to_try:
-                    try:
-                        uploaded_file.seek(0)
-                        # ใช้ engine='python' เพื่อความยืดหยุ่น และ sep=None เพื่อเดาตัวคั่น (, หรือ tab)
-                        df = pd.read_csv(uploaded_file, sep=None, engine='python', encoding=encoding)
-                        st.success(f"✅ อ่านไฟล์สำเร็จด้วยรหัสภาษา: {encoding}")
-                        break # ถ้าอ่านได้แล้ว ให้หยุดลอง
-                    except Exception:
-                        continue # ถ้าอ่านไม่ได้ ให้ลองรหัสถัดไป
-
-            # กรณีไฟล์ Excel จริงๆ (.xlsx)
-            elif uploaded_file.name.lower().endswith('.xlsx'):
-                df = pd.read_excel(uploaded_file)
-                
-        except Exception as e:
-            error_msg = str(e)
-            
-        # ------------------------------------------------------------------
-
-        if df is None:
-            st.error(f"❌ ไม่สามารถอ่านไฟล์ได้ (Format ไม่รองรับ หรือ Encoding ผิดพลาด)")
-            if error_msg: st.caption(f"Error detail: {error_msg}")
+        # ใช้ผลการอ่านไฟล์เดิมซ้ำ ถ้าเป็นไฟล์เดียวกัน (Rerun จากการกดปุ่ม/Widget ไม่ต้อง Parse ใหม่)
+        file_hash = file_content_hash(uploaded_file)
+
+        # ไฟล์เดิมทุกไบต์ -> ปฏิเสธทันที (ไม่ต้องอ่านไฟล์)
+        previous = None if ignore_ledger else find_imported_file(file_hash)
+        if previous:
+            st.info(f"ℹ️ ไฟล์นี้เคยนำเข้าแล้วเมื่อ {previous['imported_at']} ({previous['file_name']}) "
+                    f"- เพิ่มใหม่ {previous['new_count']} | อัปเดต {previous['update_count']}")
             return
 
-        # 2. ตรวจสอบคอลัมน์ที่จำเป็น (Clean ชื่อคอลัมน์ก่อนเช็ค)
-        df.columns = df.columns.str.strip() # ลบช่องว่างหัวท้ายชื่อคอลัมน์
-        
-        required_cols = ['HN', 'วันที่รับบริการ', 'วันนัดถัดไป']
-        # เช็คว่ามีคอลัมน์ครบไหม (Allow case-insensitive check)
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        
-        if missing_cols:
-            st.error(f"❌ ไฟล์ไม่ถูกต้อง! ขาดคอลัมน์: {', '.join(missing_cols)}")
+        # ชื่อ/นามสกุลผู้ป่วยใช้ตอนจับคู่ -> แก้ชื่อโดยจำนวนแถวเท่าเดิมก็ต้อง Parse ใหม่
+        parse_key = (file_hash, frame_version(patients_db, ['hn', 'first_name', 'last_name']))
+        cached = st.session_state.get('import_parse_cache')
+
+        if cached and cached['key'] == parse_key:
+            result = cached['result']
+        else:
+            # --- 🛠️ อ่านไฟล์แบบ Streaming (เดา Encoding/ตัวคั่นครั้งเดียว แล้วอ่านทีละ Chunk) ---
+            progress = st.progress(0, text="กำลังอ่านไฟล์...")
+
+            def on_progress(rows_done, fraction):
+                pct = int(fraction * 100) if fraction is not None else 0
+                progress.progress(pct, text=f"กำลังอ่านไฟล์... {rows_done:,} แถว")
+
+            try:
+                result = stream_hosxp_file(uploaded_file, uploaded_file.name, patients_db, progress_callback=on_progress)
+            except Exception as e:
+                progress.empty()
+                st.error(f"❌ ไม่สามารถอ่านไฟล์ได้ (Format ไม่รองรับ หรือ Encoding ผิดพลาด)")
+                st.caption(f"Error detail: {e}")
+                return
+            progress.empty()
+
+            # เก็บไว้เฉพาะไฟล์ล่าสุดของ Session (ไม่ให้หน่วยความจำโตไม่จำกัด)
+            st.session_state['import_parse_cache'] = {'key': parse_key, 'result': result}
+            st.session_state.pop('import_diff_cache', None)
+
+        # 2. ตรวจสอบคอลัมน์ที่จำเป็น
+        if result['missing_cols']:
+            st.error(f"❌ ไฟล์ไม่ถูกต้อง! ขาดคอลัมน์: {', '.join(result['missing_cols'])}")
             st.warning("⚠️ โปรดตรวจสอบหัวตารางในไฟล์ Excel ต้องมีคำว่า: HN, วันที่รับบริการ, วันนัดถัดไป")
             return
 
-        # 3. แปลงข้อมูล
-        # ฟังก์ชันแปลงวันที่ Excel Serial (เช่น 45930) หรือ String
-        def convert_date(val):
-            try:
-                if pd.isna(val) or val == '' or str(val).strip() == '-': return None
-                
-                # กรณีเป็นตัวเลข Serial ของ Excel (เช่น 45958.0)
-                if isinstance(val, (int, float)):
-                    d = pd.Timestamp('1899-12-30') + pd.Timedelta(days=float(val))
-                    return d.strftime('%Y-%m-%d')
-                
-                # กรณีเป็น Text (เช่น 19/01/2026)
-                val_str = str(val).strip()
-                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                    try:
-                        return datetime.strptime(val_str, fmt).strftime('%Y-%m-%d')
-                    except:
-                        pass
-                return None
-            except:
-                return None
-
-        # แปลง HN ให้เป็น 7 หลัก
-        # .astype(str) เพื่อกัน error กรณี HN เป็นตัวเลขเพียวๆ
-        df['HN_clean'] = df['HN'].astype(str).str.split('.').str[0].str.strip().str.zfill(7)
-        
-        # แปลงวันที่
-        df['visit_date'] = df['วันที่รับบริการ'].apply(convert_date)
-        df['next_appt_date'] = df['วันนัดถัดไป'].apply(convert_date)
+        if result['encoding']:
+            st.success(f"✅ อ่านไฟล์สำเร็จด้วยรหัสภาษา: {result['encoding']} ({result['total_rows']:,} แถว)")
 
-        # 4. กรองเฉพาะคนที่มีในฐานข้อมูล (Merge)
-        existing_hns = patients_db['hn'].unique()
-        
-        matched_df = df[df['HN_clean'].isin(existing_hns)].copy()
-        matched_df = pd.merge(matched_df, patients_db[['hn', 'first_name', 'last_name']], left_on='HN_clean', right_on='hn', how='left')
+        # 3. รายงานวันที่ที่แปลงไม่ได้
+        date_errors = result['date_errors']
+        if not date_errors.empty:
+            st.warning(f"⚠️ พบวันที่ที่อ่านไม่ได้ {len(date_errors)} รายการ (แถวเหล่านี้จะถูกข้ามวันที่)")
+            with st.expander("ดูรายการวันที่ที่อ่านไม่ได้"):
+                report = date_errors.copy()
+                report['row'] = report['row'] + 2  # เลขบรรทัดในไฟล์ (รวม Header)
+                report = report[['row', 'HN', 'column', 'value', 'reason']]
+                report.columns = ['บรรทัด', 'HN', 'คอลัมน์', 'ค่าในไฟล์', 'สาเหตุ']
+                st.dataframe(report, hide_index=True, use_container_width=True)
+
+        # 4. เฉพาะคนที่มีในฐานข้อมูล (จับคู่ไว้แล้วระหว่างอ่านแต่ละ Chunk)
+        matched_df = result['matched']
 
         if matched_df.empty:
             st.warning("⚠️ ไม่พบ HN ในไฟล์ที่ตรงกับฐานข้อมูลคนไข้ในระบบเลย")
-            st.write("ตัวอย่าง HN ในไฟล์:", df['HN_clean'].head().tolist())
-            st.write("ตัวอย่าง HN ในระบบ:", existing_hns[:5])
+            st.write("ตัวอย่าง HN ในไฟล์:", result['sample_hns'])
+            st.write("ตัวอย่าง HN ในระบบ:", patients_db['hn'].unique()[:5])
             return
 
-        # แสดงตัวอย่างข้อมูล
-        st.write(f"✅ พบข้อมูลที่ตรงกันและพร้อมนำเข้า **{len(matched_df)}** รายการ:")
+        # 5. เทียบกับข้อมูลเดิม (Dry-run) ก่อนกดยืนยัน
+        # key ตามรุ่นของข้อมูล (ไม่ใช่จำนวนแถว): วันนัดที่ถูกแก้จาก Session/Replica อื่นต้องเทียบใหม่
+        diff_key = (file_hash, frame_version(patients_db, ['hn']),
+                    frame_version(visits_db, ['hn', 'date', 'next_appt']), ignore_ledger)
+        cached_diff = st.session_state.get('import_diff_cache')
+        if cached_diff and cached_diff['key'] == diff_key:
+            diff = cached_diff['diff']
+        else:
+            # ข้ามแถวที่เคยนำเข้าแล้ว (ตาม Ledger) ก่อนเทียบกับ Visit
+            if ignore_ledger:
+                fresh_df, skipped_known = matched_df, 0
+            else:
+                fresh_df, skipped_known = filter_known_rows(matched_df)
+            diff = diff_import(fresh_df, visits_db)
+            diff['fresh'] = fresh_df
+            diff['skipped_known'] = skipped_known
+            st.session_state['import_diff_cache'] = {'key': diff_key, 'diff': diff}
+        counts = diff['counts']
+        count_new = len(diff['new_visits'])
+        count_update = len(diff['appointment_updates'])
+
+        st.write(f"✅ พบข้อมูลที่ตรงกัน **{len(matched_df)}** รายการ:")
+        if diff['skipped_known']:
+            st.caption(f"⏭️ ข้าม {diff['skipped_known']} รายการที่เคยนำเข้าแล้ว (ตาม Ledger)")
+        d1, d2, d3 = st.columns(3)
+        d1.metric("เพิ่มใหม่", f"{count_new} รายการ")
+        d2.metric("อัปเดตวันนัด", f"{count_update} รายการ")
+        d3.metric("ไม่เปลี่ยนแปลง/ข้าม", f"{counts.get('unchanged', 0) + counts.get('duplicate', 0) + counts.get('skipped', 0)} รายการ")
         
-        preview_df = matched_df[['hn', 'first_name', 'last_name', 'visit_date', 'next_appt_date']].copy()
-        preview_df.columns = ['HN', 'ชื่อ', 'นามสกุล', 'วันที่รับบริการ (Visit)', 'วันนัดถัดไป']
+        preview_df = diff['report'][['hn', 'first_name', 'last_name', 'visit_date', 'next_appt_date', 'existing_next_appt', 'action']].copy()
+        preview_df['action'] = preview_df['action'].map(IMPORT_ACTIONS)
+        preview_df.columns = ['HN', 'ชื่อ', 'นามสกุล', 'วันที่รับบริการ (Visit)', 'วันนัดถัดไป', 'วันนัดเดิมในระบบ', 'ผลการนำเข้า']
         
-        # ไฮไลท์แถวที่วันนัดว่างเปล่า (เผื่อ User อยากรู้)
         st.dataframe(preview_df, hide_index=True, use_container_width=True)
 
         # ปุ่มกดยืนยัน
         if st.button("🚀 ยืนยันการนำเข้าข้อมูล", type="primary"):
-            new_visits = []
-            update_visits = [] # 📝 เก็บรายการที่จะอัปเดตวันนัด
-            count_new = 0
-            count_update = 0
-            
-            # 1. เตรียม Lookup Dictionary จากข้อมูลเดิมในระบบ (เพื่อความเร็ว)
-            visit_lookup = {}
-            if not visits_db.empty:
-                # สร้างคอลัมน์วันที่แบบมาตรฐานชั่วคราวเพื่อเทียบ
-                temp_db = visits_db.copy()
-                # แปลงวันที่ใน DB ให้เป็น YYYY-MM-DD (รองรับทั้ง format เก่า/ใหม่)
-                temp_db['date_norm'] = pd.to_datetime(temp_db['date'], errors='coerce').dt.strftime('%Y-%m-%d')
-                
-                # สร้าง Dict: Key=(HN, Date) -> Value=Index ของ DataFrame
-                for idx, row in temp_db.iterrows():
-                    key = (str(row['hn']).strip(), str(row['date_norm']))
-                    visit_lookup[key] = idx
-
             with st.status("กำลังประมวลผล...", expanded=True) as status:
-                for _, row in matched_df.iterrows():
-                    if not row['visit_date']: continue # ข้ามถ้าไม่มีวันที่
-                    
-                    # Key ที่จะใช้เช็ค
-                    hn_key = str(row['hn']).strip()
-                    date_key = str(row['visit_date']) # format YYYY-MM-DD จาก function convert_date
-                    lookup_key = (hn_key, date_key)
-
-                    if lookup_key in visit_lookup:
-                        # 🟡 เจอซ้ำ -> เก็บข้อมูลเพื่อ Update Row เดิม
-                        if row['next_appt_date']: # ถ้าในไฟล์มีวันนัด
-                            df_idx = visit_lookup[lookup_key]
-                            sheet_row = df_idx + 2 # คำนวณบรรทัดใน Sheet (Header=1 + 0-based index = +2)
-                            
-                            update_visits.append({
-                                'row': sheet_row,
-                                'value': row['next_appt_date']
-                            })
-                            count_update += 1
-                    else:
-                        # 🟢 ไม่ซ้ำ -> New Visit (เพิ่มแถวใหม่)
-                        new_visits.append({
-                            "hn": row['hn'],
-                            "date": row['visit_date'],
-                            "pefr": 0, 
-                            "control_level": "-",
-                            "controller": "-",
-                            "reliever": "-",
-                            "adherence": 0,
-                            "drp": "-",
-                            "advice": "Imported from HOSxP",
-                            "technique_check": "-",
-                            "next_appt": row['next_appt_date'] if row['next_appt_date'] else "-",
-                            "note": "นำเข้าจาก HOSxP",
-                            "is_new_case": "FALSE",
-                            "inhaler_eval": "-"
-                        })
-                        count_new += 1
-                
                 # เริ่มบันทึกข้อมูล
-                if new_visits:
-                    save_multiple_visits(new_visits)
+                stale_updates = []
+                if diff['new_visits']:
+                    # เขียนทีละ Chunk เพื่อไม่ให้ Request เดียวใหญ่เกินไป
+                    for i in range(0, count_new, IMPORT_CHUNK_SIZE):
+                        save_multiple_visits(diff['new_visits'][i:i + IMPORT_CHUNK_SIZE])
                     st.write(f"✅ เพิ่มรายการใหม่: {count_new} รายการ")
                 
-                if update_visits:
-                    # ต้อง import ฟังก์ชันใหม่ก่อนใช้
-                    from utils.gsheet_handler import update_appointments_batch
-                    update_appointments_batch(update_visits)
+                if diff['appointment_updates']:
+                    update_result = update_appointments_batch(diff['appointment_updates'])
+                    count_update = update_result['updated']
                     st.write(f"🔄 อัปเดตวันนัดในรายการเดิม: {count_update} รายการ")
+                    stale_updates = update_result['stale']
+                    if stale_updates:
+                        # แถวใน Sheet ถูกลบ/ย้ายระหว่างนำเข้า -> ไม่เขียนทับแถวอื่น
+                        st.warning(f"⚠️ ข้าม {len(update_result['stale'])} รายการ (ไม่พบแถวเดิมใน Sheet แล้ว)")
+
+                # บันทึกลง Ledger เพื่อข้ามแถว/ไฟล์นี้ในการนำเข้าครั้งถัดไป (เฉพาะแถวที่มีผลใน Sheet แล้ว)
+                record_import(file_hash, uploaded_file.name, applied_import_rows(diff['report'], stale_updates), counts={
+                    'total_rows': result['total_rows'], 'new': count_new,
+                    'update': count_update, 'skipped_known': diff['skipped_known'],
+                })
 
+                # ข้อมูลในระบบเปลี่ยนแล้ว -> ต้องเทียบใหม่ในรอบถัดไป
+                st.session_state.pop('import_diff_cache', None)
                 status.update(label="✅ ดำเนินการเสร็จสิ้น!", state="complete", expanded=False)
                 
                 if count_new == 0 and count_update == 0:
                     st.warning("⚠️ ไม่มีการเปลี่ยนแปลงข้อมูล (ข้อมูลตรงกับในระบบอยู่แล้ว)")
                 else:
                     st.success(f"สรุป: เพิ่มใหม่ {count_new} | อัปเดตเดิม {count_update}")
-                    st.balloons()
\ No newline at end of file
+                    st.balloons()